@@ -1,13 +1,15 @@
 import os
 import uuid
+import hashlib
 import datetime as dt
 from flask import Flask, request, jsonify, make_response
 
-try:
-    from google.cloud import firestore
-    FS_AVAILABLE = True
-except Exception:
-    FS_AVAILABLE = False
+import lazy
+import schema
+
+# Importado só no primeiro uso: o cold start não paga grpc/protobuf antes da primeira requisição
+firestore = lazy.LazyModule("google.cloud.firestore")
+FS_AVAILABLE = lazy.available("google.cloud.firestore")
 
 app = Flask(__name__)
 
@@ -28,7 +30,7 @@ def _corsify(r):
             allow = ALLOWED_ORIGINS[0]
     r.headers["Access-Control-Allow-Origin"] = allow
     r.headers["Vary"] = "Origin"
-    r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+    r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Idempotency-Key"
     r.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
     r.headers["Access-Control-Max-Age"] = "3600"
     return r
@@ -54,6 +56,20 @@ def collect():
     else:
         return handle_complete_data(data)
 
+def _doc_id(*parts):
+    """ID determinístico de documento (o mesmo do app_progressive): reenvios viram upsert do mesmo doc"""
+    key = ":".join(str(p) for p in parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def _invalid_audience(data):
+    """Resposta 400 se audience_type vier fora de schema.AUDIENCE_TYPES (opcional, como no app_progressive)"""
+    audience_type = data.get("audience_type")
+    if audience_type is not None and audience_type not in schema.AUDIENCE_TYPES:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "invalid_audience_type"}), 400
+        )))
+    return None
+
 def handle_progressive_data(data):
     """Handle progressive data collection (single question at a time)"""
     try:
@@ -71,7 +87,11 @@ def handle_progressive_data(data):
                 jsonify({"ok": False, "error": "invalid_question_number"}), 400
             )))
 
-        doc_id = str(uuid.uuid4())
+        invalid = _invalid_audience(data)
+        if invalid:
+            return invalid
+
+        doc_id = _doc_id(data.get("session_id"), question_number)
         row = {
             "id": doc_id,
             "session_id": data.get("session_id"),
@@ -81,6 +101,7 @@ def handle_progressive_data(data):
             "timestamp": data.get("timestamp", dt.datetime.utcnow().isoformat() + "Z"),
             "completion_timestamp": data.get("completion_timestamp"),
             "campaign_id": data.get("campaign_id"),
+            "audience_type": data.get("audience_type"),
             "line_item_id": data.get("line_item_id"),
             "creative_id": data.get("creative_id"),
             "page_url": data.get("page_url"),
@@ -123,7 +144,18 @@ def handle_complete_data(data):
                 jsonify({"ok": False, "error": "missing_answers", "missing": missing}), 400
             )))
 
-        doc_id = str(uuid.uuid4())
+        invalid = _invalid_audience(data)
+        if invalid:
+            return invalid
+
+        # Idempotency-Key explícito > session_id > id aleatório (sem deduplicação)
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key:
+            doc_id = _doc_id("key", idempotency_key)
+        elif data.get("session_id"):
+            doc_id = _doc_id(data.get("session_id"), "complete")
+        else:
+            doc_id = str(uuid.uuid4())
         row = {
             "id": doc_id,
             "ts": dt.datetime.utcnow().isoformat(timespec="seconds") + "Z",
@@ -131,6 +163,7 @@ def handle_complete_data(data):
             "q4": data.get("q4"), "q5": data.get("q5"), "q6": data.get("q6"),
             "session_id": data.get("session_id"),
             "campaign_id": data.get("campaign_id"),
+            "audience_type": data.get("audience_type"),
             "line_item_id": data.get("line_item_id"),
             "creative_id": data.get("creative_id"),
             "page_url": data.get("page_url"),
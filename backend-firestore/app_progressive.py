@@ -1,13 +1,24 @@
 import os
+import time
 import uuid
+import hashlib
+import threading
 import datetime as dt
+from collections import OrderedDict
 from flask import Flask, request, jsonify, make_response
 
-try:
-    from google.cloud import firestore
-    FS_AVAILABLE = True
-except Exception:
-    FS_AVAILABLE = False
+import jobs
+import lazy
+import schema
+import cleanup
+import sketch
+import replica
+import rollups
+import reconcile
+
+# Importado só no primeiro uso (ou no warm_up do gunicorn.conf.py): o worker sobe sem grpc/protobuf
+firestore = lazy.LazyModule("google.cloud.firestore")
+FS_AVAILABLE = lazy.available("google.cloud.firestore")
 
 app = Flask(__name__)
 
@@ -15,6 +26,262 @@ PROJECT_ID = os.environ.get("PROJECT_ID")
 FS_COLLECTION = os.environ.get("FS_COLLECTION", "responses")
 FS_PROGRESSIVE_COLLECTION = os.environ.get("FS_PROGRESSIVE_COLLECTION", "progressive_responses")
 ALLOWED_ORIGINS = [o.strip() for o in os.environ.get("ALLOWED_ORIGINS", "*").split(",")]
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "900"))
+
+FS_SESSION_META_COLLECTION = os.environ.get("FS_SESSION_META_COLLECTION", "session_meta")
+FS_SESSIONS_COLLECTION = os.environ.get("FS_SESSIONS_COLLECTION", "sessions")
+SESSIONS_PAGE_SIZE = int(os.environ.get("SESSIONS_PAGE_SIZE", "100"))
+SESSIONS_MAX_PAGE_SIZE = int(os.environ.get("SESSIONS_MAX_PAGE_SIZE", "500"))
+REPLAY_MAX_ITEMS = int(os.environ.get("REPLAY_MAX_ITEMS", "100"))
+# Idade máxima dos rollups antes de o /dashboard-summary disparar uma atualização
+ROLLUP_REFRESH_SECONDS = int(os.environ.get("ROLLUP_REFRESH_SECONDS", "60"))
+# Intervalo do agendador de rollups da instância (0 desliga)
+ROLLUP_SCHEDULER_SECONDS = int(os.environ.get("ROLLUP_SCHEDULER_SECONDS", "300"))
+# Réplica em memória de responses/progressive_responses/sessions para as leituras
+REPLICA_ENABLED = os.environ.get("REPLICA_ENABLED", "0") in ("1", "true")
+# Snapshot da réplica em disco local ou montado (vazio desliga): boot rápido sem reler as coleções
+REPLICA_SNAPSHOT_PATH = os.environ.get("REPLICA_SNAPSHOT_PATH", "")
+REPLICA_SNAPSHOT_SECONDS = int(os.environ.get("REPLICA_SNAPSHOT_SECONDS", "300"))
+# Beacons dos criativos (/event): contadores por (creative_id, line_item_id, minuto)
+FS_EVENTS_COLLECTION = os.environ.get("FS_EVENTS_COLLECTION", "event_counters")
+EVENT_TYPES = ("impression", "slide_view", "cta_click")
+EVENT_MAX_SLIDE = 50
+# Intervalo de gravação dos contadores (0 desliga); com 60 s, cada instância grava
+# no máximo um incremento por chave e minuto
+EVENT_FLUSH_SECONDS = int(os.environ.get("EVENT_FLUSH_SECONDS", "60"))
+# Chaves pendentes que antecipam a gravação
+EVENT_MAX_KEYS = int(os.environ.get("EVENT_MAX_KEYS", "5000"))
+# Tempo por pergunta e até concluir: sketches de quantis (sketch.py) por campanha, público,
+# métrica e dia, gravados junto com os contadores do /event
+FS_DWELL_COLLECTION = os.environ.get("FS_DWELL_COLLECTION", "dwell_sketches")
+# Intervalos maiores (aba esquecida, retorno em outro dia) ficam fora dos quantis
+DWELL_MAX_SECONDS = int(os.environ.get("DWELL_MAX_SECONDS", "1800"))
+
+class _RecentKeys:
+    """Cache LRU com TTL das últimas chaves gravadas (por instância)"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key, fingerprint):
+        """True se a chave já foi gravada recentemente com o mesmo conteúdo"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return False
+            stored_fingerprint, expires_at = item
+            if expires_at < now:
+                del self._items[key]
+                return False
+            self._items.move_to_end(key)
+            return stored_fingerprint == fingerprint
+
+    def add(self, key, fingerprint):
+        with self._lock:
+            self._items[key] = (fingerprint, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+_recent_keys = _RecentKeys(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS)
+
+class _EventCounters:
+    """Contadores do /event somados em memória até a gravação (por instância).
+
+    Chave (creative_id, line_item_id, minuto, marca de teste); campos são eventos
+    ou caminhos aninhados como "slides.3".
+    """
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, *fields):
+        """Soma 1 em cada campo da chave; retorna quantas chaves estão pendentes"""
+        with self._lock:
+            counts = self._counts.setdefault(key, {})
+            for field in fields:
+                counts[field] = counts.get(field, 0) + 1
+            return len(self._counts)
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def restore(self, counts):
+        """Devolve contadores que não foram gravados para a próxima tentativa"""
+        with self._lock:
+            for key, fields in counts.items():
+                target = self._counts.setdefault(key, {})
+                for field, n in fields.items():
+                    target[field] = target.get(field, 0) + n
+
+    def pending(self):
+        with self._lock:
+            return sum(n for fields in self._counts.values() for field, n in fields.items() if "." not in field)
+
+_event_counters = _EventCounters()
+
+class _DwellSketches:
+    """Sketches de dwell somados em memória até a gravação, por (campanha, público, métrica, dia, marca de teste)"""
+
+    def __init__(self):
+        self._sketches = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, seconds):
+        with self._lock:
+            self._sketches.setdefault(key, sketch.Sketch()).add(seconds)
+
+    def drain(self):
+        with self._lock:
+            sketches, self._sketches = self._sketches, {}
+        return sketches
+
+    def restore(self, sketches):
+        with self._lock:
+            for key, pending in sketches.items():
+                self._sketches.setdefault(key, sketch.Sketch()).merge(pending)
+
+_dwell_sketches = _DwellSketches()
+# Timestamps das respostas por sessão (instância), para o intervalo entre respostas
+_session_clock = OrderedDict()
+_session_clock_lock = threading.Lock()
+
+def _doc_id(*parts):
+    """ID determinístico de documento: reenvios viram upsert do mesmo doc"""
+    key = ":".join(str(p) for p in parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+# Metadados estáticos da sessão: enviados uma vez no handshake e depois
+# referenciados pelo session_token em cada resposta
+SESSION_META_FIELDS = ("campaign_id", "audience_type", "line_item_id", "creative_id",
+                       "page_url", "user_agent", "referer", "origin")
+# Continuam em cada linha progressiva por serem dimensões de filtro/índice
+SESSION_ROW_FIELDS = ("campaign_id", "audience_type")
+
+_session_meta = OrderedDict()
+_session_meta_lock = threading.Lock()
+
+def _test_marker(session_id):
+    """TEST_PREFIX para sessões de teste, senão None.
+
+    Os agregados (dwell, /event) não guardam session_id; os documentos das
+    sessões de teste ficam separados e levam `session_id` = TEST_PREFIX, para
+    que a limpeza os encontre pela mesma consulta de prefixo.
+    """
+    return cleanup.TEST_PREFIX if str(session_id or "").startswith(cleanup.TEST_PREFIX) else None
+
+def _marked(data, test):
+    if test:
+        data["session_id"] = test
+    return data
+
+def _session_token(session_id):
+    """Token curto e determinístico: reenvios do handshake reutilizam o mesmo"""
+    return _doc_id(session_id, "meta")[:16]
+
+def _cache_session(token, meta):
+    with _session_meta_lock:
+        _session_meta[token] = meta
+        _session_meta.move_to_end(token)
+        while len(_session_meta) > IDEMPOTENCY_CACHE_SIZE:
+            _session_meta.popitem(last=False)
+
+def _register_session(data):
+    """session_token da sessão e os metadados a gravar (None se já registrados nesta instância).
+
+    Quem chama grava os metadados no mesmo commit da linha e só depois os põe
+    no cache (`_cache_session`): um token nunca fica sem metadados.
+    """
+    token = _session_token(data.get("session_id"))
+    with _session_meta_lock:
+        if token in _session_meta:
+            return token, None
+    meta = {k: data.get(k) for k in SESSION_META_FIELDS}
+    meta["session_id"] = data.get("session_id")
+    meta["user_agent"] = meta["user_agent"] or request.headers.get("User-Agent", "")
+    meta["referer"] = meta["referer"] or request.headers.get("Referer", "")
+    meta["origin"] = meta["origin"] or request.headers.get("Origin", "")
+    meta["created_at"] = dt.datetime.utcnow().isoformat() + "Z"
+    return token, meta
+
+def _resolve_session(client, token):
+    """Metadados de um session_token (cache da instância, depois Firestore)"""
+    with _session_meta_lock:
+        meta = _session_meta.get(token)
+    if meta is None and client is not None:
+        doc = client.collection(FS_SESSION_META_COLLECTION).document(token).get()
+        if doc.exists:
+            meta = doc.to_dict()
+            _cache_session(token, meta)
+    return meta
+
+_fs_client = None
+_fs_client_lock = threading.Lock()
+
+def _client():
+    """Cliente do Firestore do processo, criado no primeiro uso (canais gRPC não sobrevivem ao fork)"""
+    global _fs_client
+    if _fs_client is None:
+        with _fs_client_lock:
+            if _fs_client is None:
+                _fs_client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
+    return _fs_client
+
+def warm_up(create_client=True):
+    """Antecipa o custo do primeiro /collect; chamado pelos hooks do gunicorn.conf.py.
+
+    No mestre (preload, antes do fork) só importa google.cloud.firestore, que os
+    workers herdam já carregado; em cada worker (post_fork) cria o cliente.
+    """
+    if not FS_AVAILABLE:
+        return False
+    try:
+        firestore.load()
+        if create_client:
+            _client()
+        return True
+    except Exception as e:
+        print(f"⚠️ Warm-up do Firestore falhou ({e}); o cliente será criado na primeira requisição")
+        return False
+
+_replica = None
+_replica_lock = threading.Lock()
+
+def _start_replica():
+    global _replica
+    with _replica_lock:
+        if _replica is None:
+            client = _client()
+            _replica = replica.default_replica(client, {"responses": FS_COLLECTION,
+                                                        "sessions": FS_SESSIONS_COLLECTION})
+            if REPLICA_SNAPSHOT_PATH:
+                if _replica.restore_snapshot(REPLICA_SNAPSHOT_PATH):
+                    print(f"✅ Réplica restaurada do snapshot {REPLICA_SNAPSHOT_PATH}")
+                if REPLICA_SNAPSHOT_SECONDS > 0:
+                    jobs.schedule("replica_snapshot", REPLICA_SNAPSHOT_SECONDS, _save_replica_snapshot,
+                                  params={"path": REPLICA_SNAPSHOT_PATH})
+            _replica.start()
+    return _replica
+
+def _save_replica_snapshot(job):
+    if not _replica.ready:
+        return {"skipped": "replica_not_ready"}
+    return {"bytes": _replica.save_snapshot(REPLICA_SNAPSHOT_PATH)}
+
+def _ready_replica():
+    """Réplica em memória pronta para leitura, ou None (leitura vai ao Firestore)"""
+    if not REPLICA_ENABLED:
+        return None
+    mirror = _replica or _start_replica()
+    return mirror if mirror.ready else None
 
 def _corsify(r):
     origin = request.headers.get("Origin", "*")
@@ -28,7 +295,7 @@ def _corsify(r):
             allow = ALLOWED_ORIGINS[0]
     r.headers["Access-Control-Allow-Origin"] = allow
     r.headers["Vary"] = "Origin"
-    r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+    r.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Idempotency-Key"
     r.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS"
     r.headers["Access-Control-Max-Age"] = "3600"
     return r
@@ -43,95 +310,250 @@ def collect():
     if request.method == "OPTIONS":
         return _corsify(make_response(("", 204)))
 
-    data = request.get_json(silent=True) or {}
-    
-    # Check if this is progressive data (single question) or complete data
-    is_progressive = "question_number" in data
-    is_complete = data.get("is_complete", False)
-    
-    print(f"MAIN: is_progressive={is_progressive}, is_complete={is_complete}, data_keys={list(data.keys())}")
+    # force=True: aceita também text/plain e navigator.sendBeacon (requisições
+    # "simples", sem preflight CORS) com o mesmo JSON no corpo
+    data = request.get_json(silent=True, force=True)
+    if not isinstance(data, dict):
+        data = {}
     
     # Se tem question_number, é sempre progressivo (mesmo que is_complete=true)
-    if is_progressive:
-        print("MAIN: Chamando handle_progressive_data")
+    if "question_number" in data:
         return handle_progressive_data(data)
     else:
-        print("MAIN: Chamando handle_complete_data")
         return handle_complete_data(data)
 
+def _progressive_error(data):
+    """Valida uma resposta progressiva; retorna o erro (dict) ou None"""
+    required_fields = ["session_id", "question_number", "answer"]
+    missing = [field for field in required_fields if not data.get(field)]
+    if missing:
+        return {"error": "missing_fields", "missing": missing}
+
+    question_number = data.get("question_number")
+    if not isinstance(question_number, int) or question_number < 1 or question_number > 6:
+        return {"error": "invalid_question_number"}
+    audience_type = data.get("audience_type")
+    if audience_type is not None and audience_type not in schema.AUDIENCE_TYPES:
+        return {"error": "invalid_audience_type"}
+    return None
+
+def _request_metadata():
+    """Metadados da requisição usados quando o corpo não os traz"""
+    return {
+        "user_agent": request.headers.get("User-Agent", ""),
+        "referer": request.headers.get("Referer", ""),
+        "origin": request.headers.get("Origin", ""),
+    }
+
+def _build_progressive_rows(data, doc_id, session_token=None):
+    """Monta a linha progressiva e, se for a última pergunta, o registro completo.
+
+    Retorna (row, complete_row ou None, session_token, metadados novos da sessão
+    ou None); os metadados novos vão no mesmo batch da linha.
+    """
+    row = {
+        "id": doc_id,
+        "session_id": data.get("session_id"),
+        "question_number": data.get("question_number"),
+        "answer": data.get("answer"),
+        "is_complete": data.get("is_complete", False),
+        "timestamp": data.get("timestamp", dt.datetime.utcnow().isoformat() + "Z"),
+        "completion_timestamp": data.get("completion_timestamp"),
+        "campaign_id": data.get("campaign_id"),
+        "audience_type": data.get("audience_type"),
+        "line_item_id": data.get("line_item_id"),
+        "creative_id": data.get("creative_id"),
+        "page_url": data.get("page_url"),
+        "user_agent": data.get("user_agent", request.headers.get("User-Agent", "")),
+        "referer": request.headers.get("Referer", ""),
+        "origin": request.headers.get("Origin", ""),
+        "all_answers": data.get("all_answers"),  # Only present for last question
+        "received_at": dt.datetime.utcnow().isoformat() + "Z",  # Watermark da reconciliação
+    }
+
+    session_meta = None
+    if data.get("handshake") and not session_token:
+        session_token, session_meta = _register_session(data)
+    if session_token:
+        # Metadados ficam uma vez em session_meta em vez de repetidos em cada linha
+        for field in SESSION_META_FIELDS:
+            row.pop(field, None)
+        for field in SESSION_ROW_FIELDS:
+            row[field] = data.get(field)
+        row["session_token"] = session_token
+
+    complete_row = None
+    if data.get("is_complete"):
+        complete_doc_id = _doc_id(data.get("session_id"), "complete")
+        complete_row = schema.response_record(
+            complete_doc_id,
+            {**data, "answers": data.get("all_answers") or {}, "is_complete": True},
+            source="progressive",
+            ts=data.get("timestamp"),
+            metadata=_request_metadata(),
+        )
+    return row, complete_row, session_token, session_meta
+
+def _merge_update(target, update):
+    """Junta dois updates de merge do mesmo documento (mapas aninhados campo a campo)"""
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            target[key].update(value)
+        else:
+            target[key] = value
+
+def _session_index_update(row, data):
+    """Merge no índice de sessões (`sessions/{id}`) para uma resposta progressiva.
+
+    Mesmo documento consolidado pelo reconcile.py; as respostas entram por campo
+    (answers.qN), então reenvios e respostas fora de ordem não apagam as demais.
+    """
+    question = f"q{row['question_number']}"
+    update = {
+        "session_id": row["session_id"],
+        "answers": {**(data.get("all_answers") or {}), question: row["answer"]} if row["is_complete"]
+                   else {question: row["answer"]},
+        "answer_timestamps": {question: row["timestamp"]},
+        "device": schema.device_type(data.get("user_agent") or request.headers.get("User-Agent", "")),
+        "updated_at": row["received_at"],
+    }
+    for field in SESSION_ROW_FIELDS:
+        if data.get(field):
+            update[field] = data.get(field)
+    if row["is_complete"]:
+        update["is_complete"] = True
+        update["completion_timestamp"] = row["completion_timestamp"]
+    return _doc_id(row["session_id"], "session"), update
+
+def _session_clock_for(client, row, session_doc_id):
+    """Timestamps das respostas anteriores da sessão, lidos antes do commit desta resposta.
+
+    Vem do cache da instância; só sem a sessão no cache lê `answer_timestamps`
+    do índice de sessões. Na q1 de uma sessão não concluída não há resposta
+    anterior possível e a leitura é dispensada.
+    """
+    with _session_clock_lock:
+        clock = _session_clock.get(row["session_id"])
+    if clock is not None:
+        return dict(clock)
+    if row["question_number"] == 1 and not row["is_complete"]:
+        return {}
+    clock = {}
+    doc = client.collection(FS_SESSIONS_COLLECTION).document(session_doc_id).get()
+    if doc.exists:
+        stored = doc.to_dict()
+        clock = dict(stored.get("answer_timestamps") or {})
+        clock["complete"] = bool(stored.get("is_complete"))
+    return clock
+
+def _record_dwell(row, clock, session_update):
+    """Mede o tempo desde a resposta anterior da sessão e, na última, o tempo até concluir.
+
+    Chamado só depois do commit: um retry de um commit que falhou não conta
+    duas vezes. `clock` vem de `_session_clock_for`; o cache é atualizado com o
+    mesmo `session_update` gravado no índice. Reenvios da mesma pergunta não
+    contam de novo.
+    """
+    session_id = row["session_id"]
+    question = f"q{row['question_number']}"
+    current = reconcile._parse_ts(row["timestamp"])
+    answered = [t for t in (reconcile._parse_ts(v) for k, v in clock.items() if k.startswith("q")) if t]
+    if current is not None:
+        key = (row.get("campaign_id"), row.get("audience_type"))
+        test = _test_marker(session_id)
+        day = current.date().isoformat()
+        earlier = [t for t in answered if t <= current]
+        if question not in clock and earlier:
+            seconds = (current - max(earlier)).total_seconds()
+            if seconds <= DWELL_MAX_SECONDS:
+                _dwell_sketches.add((*key, question, day, test), seconds)
+        if row["is_complete"] and not clock.get("complete"):
+            done = reconcile._parse_ts(row.get("completion_timestamp")) or current
+            seconds = (done - min(answered + [current])).total_seconds()
+            if 0 <= seconds <= DWELL_MAX_SECONDS:
+                _dwell_sketches.add((*key, "complete", day, test), seconds)
+    for answered_question, ts in (session_update.get("answer_timestamps") or {}).items():
+        clock.setdefault(answered_question, ts)
+    clock["complete"] = clock.get("complete") or bool(session_update.get("is_complete"))
+
+    with _session_clock_lock:
+        _session_clock[session_id] = clock
+        _session_clock.move_to_end(session_id)
+        while len(_session_clock) > IDEMPOTENCY_CACHE_SIZE:
+            _session_clock.popitem(last=False)
+
 def handle_progressive_data(data):
     """Handle progressive data collection (single question at a time)"""
     try:
-        print(f"PROGRESSIVE: Iniciando handle_progressive_data com dados: {data}")
+        client = None
+        if FS_AVAILABLE:
+            client = _client()
+
+        # Protocolo compacto: depois do handshake a resposta traz só token, pergunta e resposta
+        session_token = data.get("session_token")
+        if session_token:
+            meta = _resolve_session(client, session_token)
+            if meta is None:
+                return _corsify(make_response((
+                    jsonify({"ok": False, "error": "invalid_session_token"}), 400
+                )))
+            data = {**meta, **data}
         
         # Validate progressive data
-        required_fields = ["session_id", "question_number", "answer"]
-        missing = [field for field in required_fields if not data.get(field)]
-        if missing:
+        error = _progressive_error(data)
+        if error:
             return _corsify(make_response((
-                jsonify({"ok": False, "error": "missing_fields", "missing": missing}), 400
+                jsonify({"ok": False, **error}), 400
             )))
 
         question_number = data.get("question_number")
-        if not isinstance(question_number, int) or question_number < 1 or question_number > 6:
+        doc_id = _doc_id(data.get("session_id"), question_number)
+        fingerprint = (data.get("answer"), bool(data.get("is_complete")))
+        cache_key = (FS_PROGRESSIVE_COLLECTION, doc_id)
+        if _recent_keys.seen(cache_key, fingerprint):
             return _corsify(make_response((
-                jsonify({"ok": False, "error": "invalid_question_number"}), 400
+                jsonify({
+                    "ok": True,
+                    "stored": "duplicate",
+                    "id": doc_id,
+                    "type": "progressive",
+                    "question_number": question_number,
+                    "is_complete": data.get("is_complete", False)
+                }), 200
             )))
 
-        doc_id = str(uuid.uuid4())
-        row = {
-            "id": doc_id,
-            "session_id": data.get("session_id"),
-            "question_number": question_number,
-            "answer": data.get("answer"),
-            "is_complete": data.get("is_complete", False),
-            "timestamp": data.get("timestamp", dt.datetime.utcnow().isoformat() + "Z"),
-            "completion_timestamp": data.get("completion_timestamp"),
-            "campaign_id": data.get("campaign_id"),
-            "line_item_id": data.get("line_item_id"),
-            "creative_id": data.get("creative_id"),
-            "page_url": data.get("page_url"),
-            "user_agent": data.get("user_agent", request.headers.get("User-Agent", "")),
-            "referer": request.headers.get("Referer", ""),
-            "origin": request.headers.get("Origin", ""),
-            "all_answers": data.get("all_answers"),  # Only present for last question
-        }
+        row, complete_row, session_token, session_meta = _build_progressive_rows(data, doc_id, session_token)
 
         stored = "log_only"
-        if FS_AVAILABLE:
-            client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
-            client.collection(FS_PROGRESSIVE_COLLECTION).document(doc_id).set(row)
+        if client is not None:
+            # Linha, metadados do handshake, índice da sessão e (na última pergunta) registro completo num único commit
+            batch = client.batch()
+            batch.set(client.collection(FS_PROGRESSIVE_COLLECTION).document(doc_id), row)
+            if session_meta is not None:
+                batch.set(client.collection(FS_SESSION_META_COLLECTION).document(session_token), session_meta)
+            session_doc_id, session_update = _session_index_update(row, data)
+            batch.set(client.collection(FS_SESSIONS_COLLECTION).document(session_doc_id), session_update, merge=True)
             stored = "firestore"
-            
+            clock = None
+            try:
+                clock = _session_clock_for(client, row, session_doc_id)
+            except Exception as e:
+                print(f"⚠️ Dwell não registrado ({e})")
+
         # Se for a última pergunta (is_complete=True), também salvar na coleção principal
-        print(f"DEBUG: is_complete={data.get('is_complete')}, type={type(data.get('is_complete'))}, all_answers={data.get('all_answers')}")
         is_complete = data.get("is_complete")
-        print(f"DEBUG: is_complete truthy check: {bool(is_complete)}")
-        print(f"DEBUG: is_complete == True: {is_complete == True}")
-        print(f"DEBUG: is_complete == 'true': {is_complete == 'true'}")
-        print(f"DEBUG: str(is_complete): {str(is_complete)}")
-        if is_complete:
-            print("DEBUG: Entrando na condição is_complete")
-            complete_doc_id = str(uuid.uuid4())
-            complete_row = {
-                "id": complete_doc_id,
-                "ts": data.get("timestamp", dt.datetime.utcnow().isoformat() + "Z"),
-                "session_id": data.get("session_id"),
-                "campaign_id": data.get("campaign_id"),
-                "line_item_id": data.get("line_item_id"),
-                "creative_id": data.get("creative_id"),
-                "page_url": data.get("page_url"),
-                "ua": data.get("user_agent", request.headers.get("User-Agent", "")),
-                "referer": request.headers.get("Referer", ""),
-                "origin": request.headers.get("Origin", ""),
-                "is_complete": True,
-                "completion_timestamp": data.get("completion_timestamp"),
-                "audience_type": data.get("audience_type"),
-                # Adicionar todas as respostas
-                **data.get("all_answers", {})
-            }
-            client.collection(FS_COLLECTION).document(complete_doc_id).set(complete_row)
-            stored = "firestore_both"
+        if complete_row is not None:
+            if client is not None:
+                batch.set(client.collection(FS_COLLECTION).document(complete_row["id"]), complete_row)
+                stored = "firestore_both"
+        if client is not None:
+            batch.commit()
+            if clock is not None:
+                _record_dwell(row, clock, session_update)
+        if session_meta is not None:
+            _cache_session(session_token, session_meta)
+
+        _recent_keys.add(cache_key, fingerprint)
 
         return _corsify(make_response((
             jsonify({
@@ -141,6 +563,7 @@ def handle_progressive_data(data):
                 "type": "progressive",
                 "question_number": question_number,
                 "is_complete": data.get("is_complete", False),
+                "session_token": session_token,
                 "debug": {
                     "is_complete_value": data.get("is_complete"),
                     "is_complete_type": str(type(data.get("is_complete"))),
@@ -157,46 +580,442 @@ def handle_progressive_data(data):
             jsonify({"ok": False, "error": str(e)}), 500
         )))
 
+@app.route("/replay", methods=["POST", "OPTIONS"])
+def replay():
+    """Reenvio em lote das respostas progressivas guardadas no localStorage do criativo.
+
+    Corpo: {"answers": [payload, ...]} com o mesmo formato do /collect progressivo.
+    Deduplica por (session_id, question_number), mantém o timestamp original de
+    cada resposta e grava tudo em um único batch.
+    """
+    if request.method == "OPTIONS":
+        return _corsify(make_response(("", 204)))
+
+    body = request.get_json(silent=True, force=True)
+    items = body.get("answers") if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "invalid_payload"}), 400
+        )))
+    if len(items) > REPLAY_MAX_ITEMS:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "too_many_items", "max": REPLAY_MAX_ITEMS}), 400
+        )))
+
+    try:
+        client = None
+        if FS_AVAILABLE:
+            client = _client()
+
+        results = []
+        writes = {}
+        metas = {}
+        session_updates = {}
+        for index, data in enumerate(items):
+            if not isinstance(data, dict):
+                results.append({"index": index, "ok": False, "error": "invalid_item"})
+                continue
+
+            session_token = data.get("session_token")
+            if session_token:
+                meta = _resolve_session(client, session_token)
+                if meta is None and not data.get("session_id"):
+                    results.append({"index": index, "ok": False, "error": "invalid_session_token"})
+                    continue
+                if meta is None:
+                    # Token desconhecido: a linha é gravada pelo session_id, sem o token que não resolve
+                    session_token = None
+                    data = {k: v for k, v in data.items() if k != "session_token"}
+                data = {**(meta or {}), **data}
+
+            error = _progressive_error(data)
+            if error:
+                results.append({"index": index, "ok": False, **error})
+                continue
+
+            doc_id = _doc_id(data.get("session_id"), data.get("question_number"))
+            fingerprint = (data.get("answer"), bool(data.get("is_complete")))
+            cache_key = (FS_PROGRESSIVE_COLLECTION, doc_id)
+            if _recent_keys.seen(cache_key, fingerprint):
+                results.append({"index": index, "ok": True, "id": doc_id, "stored": "duplicate"})
+                continue
+
+            row, complete_row, session_token, session_meta = _build_progressive_rows(data, doc_id, session_token)
+            row["replayed"] = True
+            # Itens repetidos no mesmo lote: o último prevalece
+            writes[doc_id] = (row, complete_row, cache_key, fingerprint)
+            if session_meta is not None:
+                metas[session_token] = session_meta
+            session_doc_id, session_update = _session_index_update(row, data)
+            _merge_update(session_updates.setdefault(session_doc_id, {}), session_update)
+            results.append({"index": index, "ok": True, "id": doc_id,
+                            "stored": "firestore" if client is not None else "log_only"})
+
+        if client is not None and writes:
+            batch = client.batch()
+            for doc_id, (row, complete_row, _, _) in writes.items():
+                batch.set(client.collection(FS_PROGRESSIVE_COLLECTION).document(doc_id), row)
+                if complete_row is not None:
+                    batch.set(client.collection(FS_COLLECTION).document(complete_row["id"]), complete_row)
+            for token, meta in metas.items():
+                batch.set(client.collection(FS_SESSION_META_COLLECTION).document(token), meta)
+            # Um merge por sessão, com as respostas do lote acumuladas
+            for session_doc_id, session_update in session_updates.items():
+                batch.set(client.collection(FS_SESSIONS_COLLECTION).document(session_doc_id), session_update,
+                          merge=True)
+            batch.commit()
+        for token, meta in metas.items():
+            _cache_session(token, meta)
+        for _, _, cache_key, fingerprint in writes.values():
+            _recent_keys.add(cache_key, fingerprint)
+
+        return _corsify(make_response((
+            jsonify({
+                "ok": True,
+                "accepted": len(writes),
+                "duplicates": sum(1 for r in results if r.get("stored") == "duplicate"),
+                "rejected": sum(1 for r in results if not r["ok"]),
+                "results": results
+            }), 200
+        )))
+
+    except Exception as e:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": str(e)}), 500
+        )))
+
 def handle_complete_data(data):
     """Handle complete data collection (all questions at once)"""
     try:
+        # Aceita as respostas planas (v1/v2) ou aninhadas em `answers`
+        if isinstance(data.get("answers"), dict):
+            data = {**data["answers"], **data}
+
         # Validate complete data
-        required = [f"q{i}" for i in range(1, 7)]
+        required = list(schema.QUESTIONS)
         missing = [k for k in required if not data.get(k)]
         if missing:
             return _corsify(make_response((
                 jsonify({"ok": False, "error": "missing_answers", "missing": missing}), 400
             )))
 
-        doc_id = str(uuid.uuid4())
-        row = {
-            "id": doc_id,
-            "ts": dt.datetime.utcnow().isoformat(timespec="seconds") + "Z",
-            "q1": data.get("q1"), "q2": data.get("q2"), "q3": data.get("q3"),
-            "q4": data.get("q4"), "q5": data.get("q5"), "q6": data.get("q6"),
-            "session_id": data.get("session_id"),
-            "campaign_id": data.get("campaign_id"),
-            "line_item_id": data.get("line_item_id"),
-            "creative_id": data.get("creative_id"),
-            "page_url": data.get("page_url"),
-            "ua": request.headers.get("User-Agent", ""),
-            "referer": request.headers.get("Referer", ""),
-            "origin": request.headers.get("Origin", ""),
-            "extra": data.get("extra"),
-            "is_complete": data.get("is_complete", True),
-            "completion_timestamp": data.get("completion_timestamp", dt.datetime.utcnow().isoformat() + "Z"),
-        }
+        # Opcional para os criativos v1; se vier (criativos v2), precisa ser válido
+        audience_type = data.get("audience_type")
+        if audience_type is not None and audience_type not in schema.AUDIENCE_TYPES:
+            return _corsify(make_response((
+                jsonify({"ok": False, "error": "invalid_audience_type"}), 400
+            )))
+
+        # Idempotency-Key explícito > session_id > id aleatório (sem deduplicação)
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key:
+            doc_id = _doc_id("key", idempotency_key)
+        elif data.get("session_id"):
+            doc_id = _doc_id(data.get("session_id"), "complete")
+        else:
+            doc_id = str(uuid.uuid4())
+        fingerprint = tuple(data.get(k) for k in required)
+        cache_key = (FS_COLLECTION, doc_id)
+        if _recent_keys.seen(cache_key, fingerprint):
+            return _corsify(make_response((
+                jsonify({"ok": True, "stored": "duplicate", "id": doc_id, "type": "complete"}), 200
+            )))
+
+        row = schema.response_record(doc_id, data, source="collect", metadata=_request_metadata())
+        row["completion_timestamp"] = row["completion_timestamp"] or dt.datetime.utcnow().isoformat() + "Z"
 
         stored = "log_only"
         if FS_AVAILABLE:
-            client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
+            client = _client()
             client.collection(FS_COLLECTION).document(doc_id).set(row)
             stored = "firestore"
 
+        _recent_keys.add(cache_key, fingerprint)
+
+        return _corsify(make_response((
+            jsonify({"ok": True, "stored": stored, "id": doc_id, "type": "complete",
+                     "audience_type": audience_type}), 200
+        )))
+
+    except Exception as e:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": str(e)}), 500
+        )))
+
+def _filtered_query(client, collection, time_field):
+    """Aplica os filtros da querystring direto na consulta do Firestore.
+
+    Filtros: session_prefix, campaign_id, audience_type, since/until (ISO, em
+    `time_field`) e limit. Retorna (query, count_only).
+    """
+    query = client.collection(collection)
+    campaign_id = request.args.get("campaign_id")
+    audience_type = request.args.get("audience_type")
+    session_prefix = request.args.get("session_prefix")
+    since = request.args.get("since")
+    until = request.args.get("until")
+
+    if campaign_id:
+        query = query.where("campaign_id", "==", campaign_id)
+    if audience_type:
+        query = query.where("audience_type", "==", audience_type)
+    if session_prefix:
+        start, end = cleanup.prefix_range(session_prefix)
+        query = query.where("session_id", ">=", start).where("session_id", "<", end)
+    if since:
+        query = query.where(time_field, ">=", since)
+    if until:
+        query = query.where(time_field, "<", until)
+
+    count_only = request.args.get("count_only") in ("1", "true")
+    if count_only:
+        return query, True
+
+    # Com filtro de intervalo em session_id a ordenação precisa começar por ele
+    if session_prefix:
+        query = query.order_by("session_id")
+    query = query.order_by(time_field, direction=firestore.Query.DESCENDING)
+    limit = request.args.get("limit", type=int)
+    if limit:
+        query = query.limit(limit)
+    return query, False
+
+def flush_events():
+    """Grava os contadores pendentes do /event como incrementos, em batches; retorna quantos documentos"""
+    items = list(_event_counters.drain().items())
+    written = 0
+    try:
+        client = _client() if items else None
+        updated_at = dt.datetime.utcnow().isoformat() + "Z"
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            batch = client.batch()
+            for (creative_id, line_item_id, minute, test), fields in chunk:
+                data = _marked({"creative_id": creative_id, "line_item_id": line_item_id, "minute": minute,
+                                "day": minute[:10], "updated_at": updated_at}, test)
+                for field, n in fields.items():
+                    parent, _, child = field.partition(".")
+                    if child:
+                        data.setdefault(parent, {})[child] = firestore.Increment(n)
+                    else:
+                        data[field] = firestore.Increment(n)
+                parts = (creative_id, line_item_id, minute) + ((test,) if test else ())
+                ref = client.collection(FS_EVENTS_COLLECTION).document(_doc_id(*parts))
+                batch.set(ref, data, merge=True)
+            batch.commit()
+            written += len(chunk)
+    except Exception:
+        _event_counters.restore(dict(items[written:]))
+        raise
+    return written
+
+def flush_dwell():
+    """Grava os sketches pendentes de dwell como incrementos por bucket; retorna quantos documentos"""
+    items = list(_dwell_sketches.drain().items())
+    written = 0
+    try:
+        client = _client() if items else None
+        updated_at = dt.datetime.utcnow().isoformat() + "Z"
+        for start in range(0, len(items), 500):
+            chunk = items[start:start + 500]
+            batch = client.batch()
+            for (campaign_id, audience_type, metric, day, test), pending in chunk:
+                data = _marked({"campaign_id": campaign_id, "audience_type": audience_type, "metric": metric,
+                                "day": day, "updated_at": updated_at,
+                                **{field: firestore.Increment(value) for field, value in
+                                   (("zero", pending.zero), ("count", pending.count), ("total", pending.total))},
+                                "buckets": {str(i): firestore.Increment(n) for i, n in pending.buckets.items()}}, test)
+                parts = (campaign_id, audience_type, metric, day) + ((test,) if test else ())
+                ref = client.collection(FS_DWELL_COLLECTION).document(_doc_id(*parts))
+                batch.set(ref, data, merge=True)
+            batch.commit()
+            written += len(chunk)
+    except Exception:
+        _dwell_sketches.restore(dict(items[written:]))
+        raise
+    return written
+
+def flush_counters():
+    """Contadores do /event e sketches de dwell pendentes (agendador e saída do worker)"""
+    return {"events": flush_events(), "dwell": flush_dwell()}
+
+_counters_flushed_at = time.monotonic()
+_counters_flush_lock = threading.Lock()
+
+def _run_counters_flush(job):
+    global _counters_flushed_at
+    _counters_flushed_at = time.monotonic()
+    return flush_counters()
+
+@app.after_request
+def _flush_counters_if_due(response):
+    """Grava os contadores pendentes na primeira requisição depois de EVENT_FLUSH_SECONDS.
+
+    Com a CPU limitada às requisições (padrão do Cloud Run) o agendador quase
+    não roda entre elas; aqui a gravação acontece antes da resposta, enquanto a
+    instância tem CPU. Só uma requisição por vez faz o flush.
+    """
+    global _counters_flushed_at
+    if (not FS_AVAILABLE or EVENT_FLUSH_SECONDS <= 0
+            or time.monotonic() - _counters_flushed_at < EVENT_FLUSH_SECONDS):
+        return response
+    if not _counters_flush_lock.acquire(blocking=False):
+        return response
+    try:
+        _counters_flushed_at = time.monotonic()
+        flush_counters()
+    except Exception as e:
+        print(f"⚠️ Contadores não gravados ({e}); ficam para o próximo ciclo")
+    finally:
+        _counters_flush_lock.release()
+    return response
+
+def _event_dimension(value):
+    return str(value)[:100] if value not in (None, "") else None
+
+@app.route("/event", methods=["GET", "POST", "OPTIONS"])
+def track_event():
+    """Beacon dos criativos (impression, slide_view, cta_click), sem escrita por evento.
+
+    Aceita query string (pixel) ou JSON no corpo (sendBeacon/text/plain). Só soma
+    em memória; os contadores vão para o Firestore a cada EVENT_FLUSH_SECONDS.
+    Com `session_id` de teste (prefixo test_), os eventos vão para documentos
+    separados, que a limpeza das sessões de teste remove.
+    """
+    if request.method == "OPTIONS":
+        return _corsify(make_response(("", 204)))
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    body = request.get_json(silent=True, force=True) if request.method == "POST" else None
+    data = {**request.args.to_dict(), **(body if isinstance(body, dict) else {})}
+    event = data.get("event")
+    if event not in EVENT_TYPES:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "invalid_event", "allowed": list(EVENT_TYPES)}), 400
+        )))
+    fields = [event]
+    if data.get("slide") not in (None, ""):
+        try:
+            slide = int(data["slide"])
+        except (TypeError, ValueError):
+            slide = -1
+        if not 0 <= slide <= EVENT_MAX_SLIDE:
+            return _corsify(make_response((
+                jsonify({"ok": False, "error": "invalid_slide"}), 400
+            )))
+        if event == "slide_view":
+            fields.append(f"slides.{slide}")
+
+    key = (_event_dimension(data.get("creative_id")), _event_dimension(data.get("line_item_id")),
+           dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M"), _test_marker(data.get("session_id")))
+    if _event_counters.add(key, *fields) >= EVENT_MAX_KEYS:
+        jobs.submit("counters_flush", _run_counters_flush)
+    return _corsify(make_response(("", 204)))
+
+@app.route("/events", methods=["GET"])
+def event_counts():
+    """Totais gravados do /event por evento, slide, criativo e dia.
+
+    Filtros opcionais: since/until (dia, inclusive), creative_id e line_item_id.
+    `pending` são os eventos desta instância ainda não gravados.
+    """
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    try:
+        client = _client()
+        query = client.collection(FS_EVENTS_COLLECTION)
+        for field in ("creative_id", "line_item_id"):
+            if request.args.get(field):
+                query = query.where(field, "==", request.args.get(field))
+        if request.args.get("since"):
+            query = query.where("day", ">=", request.args.get("since")[:10])
+        if request.args.get("until"):
+            query = query.where("day", "<=", request.args.get("until")[:10])
+
+        totals = {event: 0 for event in EVENT_TYPES}
+        slides, by_creative, by_day = {}, {}, {}
+        for doc in query.stream():
+            data = doc.to_dict()
+            creative = by_creative.setdefault((data.get("creative_id"), data.get("line_item_id")),
+                                              {event: 0 for event in EVENT_TYPES})
+            day = by_day.setdefault(data.get("day"), {event: 0 for event in EVENT_TYPES})
+            for event in EVENT_TYPES:
+                n = data.get(event) or 0
+                totals[event] += n
+                creative[event] += n
+                day[event] += n
+            for slide, n in (data.get("slides") or {}).items():
+                slides[slide] = slides.get(slide, 0) + n
+
+        return _corsify(make_response((
+            jsonify({
+                "ok": True,
+                "totals": totals,
+                "slides": dict(sorted(slides.items(), key=lambda item: int(item[0]))),
+                "by_creative": [{"creative_id": c, "line_item_id": l, **counts}
+                                for (c, l), counts in sorted(by_creative.items(), key=lambda item: str(item[0]))],
+                "by_day": dict(sorted(by_day.items(), key=lambda item: str(item[0]))),
+                "pending": _event_counters.pending(),
+            }), 200
+        )))
+    except Exception as e:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": str(e)}), 500
+        )))
+
+@app.route("/dwell-times", methods=["GET"])
+def dwell_times():
+    """Quantis (p50/p90/p99, em segundos) do tempo por pergunta e do tempo até concluir.
+
+    `questions.qN` é o intervalo entre a resposta anterior da sessão e a qN (q1
+    não tem anterior); `complete` vai da primeira resposta até a conclusão.
+    Filtros opcionais: campaign_id, audience_type e since/until (dia, inclusive).
+    Lê um sketch por (campanha, público, métrica, dia) e mescla, sem tocar nas respostas.
+    """
+    if not FS_AVAILABLE:
         return _corsify(make_response((
-            jsonify({"ok": True, "stored": stored, "id": doc_id, "type": "complete"}), 200
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
         )))
 
+    try:
+        client = _client()
+        query = client.collection(FS_DWELL_COLLECTION)
+        for field in ("campaign_id", "audience_type"):
+            if request.args.get(field):
+                query = query.where(field, "==", request.args.get(field))
+        if request.args.get("since"):
+            query = query.where("day", ">=", request.args.get("since")[:10])
+        if request.args.get("until"):
+            query = query.where("day", "<=", request.args.get("until")[:10])
+
+        metrics, by_audience = {}, {}
+        for doc in query.stream():
+            data = doc.to_dict()
+            pending = sketch.Sketch.from_dict(data)
+            metrics.setdefault(data.get("metric"), sketch.Sketch()).merge(pending)
+            audience = by_audience.setdefault(data.get("audience_type") or "unknown", {})
+            audience.setdefault(data.get("metric"), sketch.Sketch()).merge(pending)
+
+        def _summaries(sketches):
+            return {
+                "questions": {metric: sketches[metric].summary()
+                              for metric in sorted(sketches, key=str) if str(metric).startswith("q")},
+                "complete": sketches.get("complete", sketch.Sketch()).summary(),
+            }
+
+        return _corsify(make_response((
+            jsonify({
+                "ok": True,
+                **_summaries(metrics),
+                "by_audience": {audience: _summaries(sketches) for audience, sketches in sorted(by_audience.items())},
+            }), 200
+        )))
     except Exception as e:
         return _corsify(make_response((
             jsonify({"ok": False, "error": str(e)}), 500
@@ -204,41 +1023,35 @@ def handle_complete_data(data):
 
 @app.route("/responses", methods=["GET"])
 def list_responses():
-    """Endpoint para listar todas as respostas coletadas (completas)"""
+    """Endpoint para listar as respostas coletadas (completas), com filtros opcionais"""
     if not FS_AVAILABLE:
         return _corsify(make_response((
             jsonify({"ok": False, "error": "firestore_not_available"}), 500
         )))
     
     try:
-        client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
-        docs = client.collection(FS_COLLECTION).order_by('ts', direction=firestore.Query.DESCENDING).stream()
-        
-        responses = []
-        for doc in docs:
-            data = doc.to_dict()
-            responses.append({
-                "id": doc.id,
-                "timestamp": data.get("ts"),
-                "session_id": data.get("session_id"),
-                "campaign_id": data.get("campaign_id"),
-                "answers": {
-                    "q1": data.get("q1"),
-                    "q2": data.get("q2"),
-                    "q3": data.get("q3"),
-                    "q4": data.get("q4"),
-                    "q5": data.get("q5"),
-                    "q6": data.get("q6")
-                },
-                "metadata": {
-                    "user_agent": data.get("ua", "")[:100] if data.get("ua") else None,
-                    "referer": data.get("referer"),
-                    "origin": data.get("origin"),
-                    "page_url": data.get("page_url"),
-                    "is_complete": data.get("is_complete", True)
-                }
-            })
+        mirror = _ready_replica()
+        if mirror is not None:
+            count, records = mirror.query_responses(
+                count_only=request.args.get("count_only") in ("1", "true"),
+                limit=request.args.get("limit", type=int),
+                **{k: request.args.get(k) for k in ("campaign_id", "audience_type", "session_prefix", "since", "until")})
+            body = {"ok": True, "count": count, "source": "replica"}
+            if request.args.get("count_only") not in ("1", "true"):
+                body["responses"] = [schema.to_api(record) for record in records]
+            return _corsify(make_response((jsonify(body), 200)))
+
+        client = _client()
+        query, count_only = _filtered_query(client, FS_COLLECTION, 'ts')
+        if count_only:
+            return _corsify(make_response((
+                jsonify({"ok": True, "count": cleanup.count(query)}), 200
+            )))
+        docs = query.stream()
         
+        # Documentos legados (v1/v2 ainda não migrados) saem no mesmo formato
+        responses = [schema.to_api(schema.normalize(doc.id, doc.to_dict())) for doc in docs]
+
         return _corsify(make_response((
             jsonify({"ok": True, "count": len(responses), "responses": responses}), 200
         )))
@@ -250,15 +1063,20 @@ def list_responses():
 
 @app.route("/progressive-responses", methods=["GET"])
 def list_progressive_responses():
-    """Endpoint para listar todas as respostas progressivas"""
+    """Endpoint para listar as respostas progressivas, com filtros opcionais"""
     if not FS_AVAILABLE:
         return _corsify(make_response((
             jsonify({"ok": False, "error": "firestore_not_available"}), 500
         )))
     
     try:
-        client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
-        docs = client.collection(FS_PROGRESSIVE_COLLECTION).order_by('timestamp', direction=firestore.Query.DESCENDING).stream()
+        client = _client()
+        query, count_only = _filtered_query(client, FS_PROGRESSIVE_COLLECTION, 'timestamp')
+        if count_only:
+            return _corsify(make_response((
+                jsonify({"ok": True, "count": cleanup.count(query)}), 200
+            )))
+        docs = query.stream()
         
         responses = []
         for doc in docs:
@@ -272,6 +1090,7 @@ def list_progressive_responses():
                 "timestamp": data.get("timestamp"),
                 "completion_timestamp": data.get("completion_timestamp"),
                 "campaign_id": data.get("campaign_id"),
+                "audience_type": data.get("audience_type"),
                 "all_answers": data.get("all_answers")
             })
         
@@ -284,76 +1103,129 @@ def list_progressive_responses():
             jsonify({"ok": False, "error": str(e)}), 500
         )))
 
+def _session_cursor(session):
+    return f"{session['updated_at']}|{session['id']}"
+
+def _start_after(query, cursor):
+    """Aplica um cursor `updated_at|doc_id` (ou só `updated_at`) à consulta ordenada"""
+    updated_at, _, doc_id = cursor.partition("|")
+    if doc_id:
+        return query.start_after({"updated_at": updated_at, "__name__": doc_id})
+    return query.where("updated_at", ">", updated_at)
+
+@app.route("/sessions", methods=["GET"])
+def list_sessions():
+    """Sessões progressivas já agrupadas, a partir do índice mantido na ingestão.
+
+    Filtros: campaign_id, audience_type e limit. Sem `since`, pagina da sessão
+    atualizada mais recentemente para trás (`cursor` = next_cursor da página
+    anterior). Com `since` (next_since de uma leitura anterior), devolve só as
+    sessões alteradas depois dele, em ordem crescente, e `has_more` indica que
+    há outra página do delta.
+    """
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    try:
+        limit = min(request.args.get("limit", SESSIONS_PAGE_SIZE, type=int) or SESSIONS_PAGE_SIZE,
+                    SESSIONS_MAX_PAGE_SIZE)
+        since = request.args.get("since")
+        cursor = request.args.get("cursor")
+
+        mirror = _ready_replica()
+        if mirror is not None:
+            docs, has_more = mirror.query_sessions(request.args.get("campaign_id"), request.args.get("audience_type"),
+                                                   limit, since=since, cursor=cursor)
+            sessions = [reconcile.session_to_api(doc_id, data) for doc_id, data in docs]
+        else:
+            client = _client()
+            query = client.collection(FS_SESSIONS_COLLECTION)
+            for field in ("campaign_id", "audience_type"):
+                if request.args.get(field):
+                    query = query.where(field, "==", request.args.get(field))
+            direction = firestore.Query.ASCENDING if since else firestore.Query.DESCENDING
+            query = query.order_by("updated_at", direction=direction).order_by("__name__", direction=direction)
+            if since or cursor:
+                query = _start_after(query, since or cursor)
+            # Um a mais para saber se existe próxima página sem outra consulta
+            docs = list(query.limit(limit + 1).stream())
+            has_more = len(docs) > limit
+            sessions = [reconcile.session_to_api(doc.id, doc.to_dict()) for doc in docs[:limit]]
+
+        cursors = [_session_cursor(s) for s in sessions]
+        body = {"ok": True, "count": len(sessions), "sessions": sessions, "has_more": has_more}
+        if since:
+            body["next_since"] = cursors[-1] if cursors else since
+        else:
+            body["next_cursor"] = cursors[-1] if has_more else None
+            # Ponto de partida dos deltas (`since`) do dashboard
+            body["next_since"] = cursors[0] if cursors and not cursor else None
+        return _corsify(make_response((jsonify(body), 200)))
+
+    except Exception as e:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": str(e)}), 500
+        )))
+
+def _progressive_analytics(progressive):
+    """Formato do /analytics a partir da parte progressiva de rollups.summarize"""
+    total_sessions = progressive["sessions"]
+    drop_off_stats = {}
+    for question_num in range(1, 7):
+        answered_count = progressive["answered_by_question"].get(str(question_num), 0)
+        drop_off_stats[question_num] = {
+            "answered": answered_count,
+            "drop_off_rate": ((total_sessions - answered_count) / total_sessions * 100) if total_sessions > 0 else 0
+        }
+
+    question_stats = {}
+    for counters in progressive["by_hour"].values():
+        for question, answers in (counters.get("answers") or {}).items():
+            stats = question_stats.setdefault(int(question[1:]), {"total": 0, "answers": {}})
+            for answer, n in answers.items():
+                stats["total"] += n
+                stats["answers"][answer] = stats["answers"].get(answer, 0) + n
+
+    return {
+        "total_sessions": total_sessions,
+        "completed_sessions": progressive["completed_sessions"],
+        "completion_rate": progressive["completion_rate"],
+        "drop_off_by_question": drop_off_stats,
+        "question_statistics": dict(sorted(question_stats.items())),
+        "by_audience": {audience: {"total_sessions": totals["sessions"],
+                                   "completed_sessions": totals["completed_sessions"],
+                                   "completion_rate": totals["completion_rate"]}
+                        for audience, totals in progressive["by_audience"].items()},
+    }
+
 @app.route("/analytics", methods=["GET"])
 def get_analytics():
-    """Endpoint para obter analytics das respostas progressivas"""
+    """Endpoint para obter analytics das respostas progressivas.
+
+    Lido dos rollups diários (contadores por campanha e público), sem varrer as
+    linhas: filtros opcionais campaign_id e audience_type. Como antes dos
+    rollups, campanhas de teste entram por padrão (`include_test=0` as tira). Os
+    números acompanham a última atualização dos rollups (até
+    ROLLUP_REFRESH_SECONDS mais o tempo do job). `by_audience` traz os mesmos
+    contadores por público.
+    """
     if not FS_AVAILABLE:
         return _corsify(make_response((
             jsonify({"ok": False, "error": "firestore_not_available"}), 500
         )))
     
     try:
-        client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
-        
-        # Get progressive responses
-        progressive_docs = client.collection(FS_PROGRESSIVE_COLLECTION).stream()
-        
-        # Group by session_id to analyze completion rates
-        sessions = {}
-        question_stats = {}
-        
-        for doc in progressive_docs:
-            data = doc.to_dict()
-            session_id = data.get("session_id")
-            question_number = data.get("question_number")
-            
-            if session_id not in sessions:
-                sessions[session_id] = {
-                    "questions_answered": set(),
-                    "is_complete": False,
-                    "completion_timestamp": None
-                }
-            
-            sessions[session_id]["questions_answered"].add(question_number)
-            if data.get("is_complete"):
-                sessions[session_id]["is_complete"] = True
-                sessions[session_id]["completion_timestamp"] = data.get("completion_timestamp")
-            
-            # Question statistics
-            if question_number not in question_stats:
-                question_stats[question_number] = {"total": 0, "answers": {}}
-            
-            question_stats[question_number]["total"] += 1
-            answer = data.get("answer")
-            if answer not in question_stats[question_number]["answers"]:
-                question_stats[question_number]["answers"][answer] = 0
-            question_stats[question_number]["answers"][answer] += 1
-        
-        # Calculate completion rates
-        total_sessions = len(sessions)
-        completed_sessions = sum(1 for s in sessions.values() if s["is_complete"])
-        completion_rate = (completed_sessions / total_sessions * 100) if total_sessions > 0 else 0
-        
-        # Calculate drop-off rates by question
-        drop_off_stats = {}
-        for question_num in range(1, 7):
-            answered_count = sum(1 for s in sessions.values() if question_num in s["questions_answered"])
-            drop_off_stats[question_num] = {
-                "answered": answered_count,
-                "drop_off_rate": ((total_sessions - answered_count) / total_sessions * 100) if total_sessions > 0 else 0
-            }
-        
+        client = _client()
+        _refresh_rollups_if_stale()
+        summary = rollups.summarize(client, campaign_id=request.args.get("campaign_id"),
+                                    audience_type=request.args.get("audience_type"),
+                                    include_test=request.args.get("include_test") not in ("0", "false"))
+        analytics = _progressive_analytics(summary["progressive"])
+
         return _corsify(make_response((
-            jsonify({
-                "ok": True,
-                "analytics": {
-                    "total_sessions": total_sessions,
-                    "completed_sessions": completed_sessions,
-                    "completion_rate": round(completion_rate, 2),
-                    "drop_off_by_question": drop_off_stats,
-                    "question_statistics": question_stats
-                }
-            }), 200
+            jsonify({"ok": True, "analytics": analytics}), 200
         )))
         
     except Exception as e:
@@ -363,7 +1235,10 @@ def get_analytics():
 
 @app.route("/cleanup-test-sessions", methods=["POST", "OPTIONS"])
 def cleanup_test_sessions():
-    """Endpoint para remover todas as sessões de teste que começam com 'test_'"""
+    """Remove em background as sessões de teste (session_id começando com 'test_').
+
+    Com `?dry_run=1` apenas conta os documentos que seriam removidos.
+    """
     if request.method == "OPTIONS":
         return _corsify(make_response(("", 204)))
     
@@ -373,38 +1248,36 @@ def cleanup_test_sessions():
                 jsonify({"ok": False, "error": "Firestore não disponível"}), 500
             )))
         
-        client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
-        
-        # 1. Remover da coleção principal
-        responses_ref = client.collection(FS_COLLECTION)
-        test_responses = responses_ref.where('session_id', '>=', 'test_').where('session_id', '<', 'test`').stream()
-        
-        deleted_responses = 0
-        for doc in test_responses:
-            doc.reference.delete()
-            deleted_responses += 1
-        
-        # 2. Remover da coleção progressiva
-        progressive_ref = client.collection(FS_PROGRESSIVE_COLLECTION)
-        test_progressive = progressive_ref.where('session_id', '>=', 'test_').where('session_id', '<', 'test`').stream()
-        
-        deleted_progressive = 0
-        for doc in test_progressive:
-            doc.reference.delete()
-            deleted_progressive += 1
-        
-        total_deleted = deleted_responses + deleted_progressive
-        
+        client = _client()
+        # Agregados (dwell, eventos) das sessões de teste ficam em documentos marcados (_test_marker)
+        collections = {"responses": FS_COLLECTION, "progressive": FS_PROGRESSIVE_COLLECTION,
+                       "sessions": FS_SESSIONS_COLLECTION, "session_meta": FS_SESSION_META_COLLECTION,
+                       "dwell": FS_DWELL_COLLECTION, "events": FS_EVENTS_COLLECTION}
+
+        if request.args.get("dry_run") in ("1", "true"):
+            counts = cleanup.count_test_sessions(client, collections)
+            return _corsify(make_response((
+                jsonify({
+                    "ok": True,
+                    "dry_run": True,
+                    "to_delete": {**counts, "total": sum(counts.values())}
+                }), 200
+            )))
+
+        job = jobs.submit("cleanup_test_sessions", _run_cleanup, client, collections)
+        if job is None:
+            return _corsify(make_response((
+                jsonify({"ok": False, "error": "already_running",
+                         "job": jobs.latest("cleanup_test_sessions").to_dict()}), 409
+            )))
+
         return _corsify(make_response((
             jsonify({
                 "ok": True,
-                "message": "Sessões de teste removidas com sucesso",
-                "deleted": {
-                    "responses": deleted_responses,
-                    "progressive": deleted_progressive,
-                    "total": total_deleted
-                }
-            }), 200
+                "message": "Remoção das sessões de teste iniciada",
+                "job_id": job.id,
+                "status_url": f"/jobs/{job.id}"
+            }), 202
         )))
         
     except Exception as e:
@@ -412,5 +1285,200 @@ def cleanup_test_sessions():
             jsonify({"ok": False, "error": str(e)}), 500
         )))
 
+def _run_cleanup(job, client, collections):
+    """Remove as sessões de teste e recalcula os rollups dos dias afetados"""
+    day_fields = {name: time_field for name, (_, time_field) in rollups.SOURCES.items()}
+    result = cleanup.delete_test_sessions(job, client, collections, day_fields=day_fields)
+    result["rollup_days"] = rollups.rebuild_days(client, result.pop("days"))
+    return result
+
+def _run_reconcile(job, full):
+    client = _client()
+    return reconcile.reconcile_sessions(client, _doc_id, full=full)
+
+@app.route("/reconcile-sessions", methods=["GET", "POST", "OPTIONS"])
+def reconcile_sessions():
+    """Dispara (POST) ou consulta (GET) a consolidação de sessões em background"""
+    if request.method == "OPTIONS":
+        return _corsify(make_response(("", 204)))
+
+    if request.method == "GET":
+        job = jobs.latest("reconcile_sessions")
+        return _corsify(make_response((
+            jsonify({"ok": True, "job": job.to_dict() if job else None}), 200
+        )))
+
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    full = request.args.get("full") in ("1", "true")
+    job = jobs.submit("reconcile_sessions", _run_reconcile, full, params={"full": full})
+    if job is None:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "already_running"}), 409
+        )))
+
+    return _corsify(make_response((
+        jsonify({"ok": True, "status": "started", "full": full,
+                 "job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+    )))
+
+_rollups_started_at = None
+
+def _run_rollups(job, full, interval=0):
+    """Atualização dos rollups pelo lease (rollups.run_leased): uma instância por vez no serviço"""
+    global _rollups_started_at
+    _rollups_started_at = time.monotonic()
+    client = _client()
+    return rollups.run_leased(client, full=full, interval=interval)
+
+def _refresh_rollups_if_stale():
+    """Agenda a atualização incremental dos rollups sem bloquear a requisição"""
+    if _rollups_started_at is None or time.monotonic() - _rollups_started_at > ROLLUP_REFRESH_SECONDS:
+        jobs.submit("rollups", _run_rollups, False, ROLLUP_REFRESH_SECONDS, params={"full": False})
+
+_scheduler_started = False
+
+@app.before_request
+def _start_schedulers():
+    """Liga os agendadores (rollups, contadores do /event e dwell) na primeira requisição do worker"""
+    global _scheduler_started
+    if _scheduler_started or not FS_AVAILABLE:
+        return
+    _scheduler_started = True
+    if ROLLUP_SCHEDULER_SECONDS > 0:
+        jobs.schedule("rollups", ROLLUP_SCHEDULER_SECONDS, _run_rollups, False, ROLLUP_SCHEDULER_SECONDS,
+                      params={"full": False})
+    if EVENT_FLUSH_SECONDS > 0:
+        jobs.schedule("counters_flush", EVENT_FLUSH_SECONDS, _run_counters_flush)
+
+@app.route("/rollups", methods=["GET", "POST", "OPTIONS"])
+def update_rollups():
+    """Dispara (POST) ou consulta (GET) a atualização dos rollups diários"""
+    if request.method == "OPTIONS":
+        return _corsify(make_response(("", 204)))
+
+    if request.method == "GET":
+        job = jobs.latest("rollups")
+        return _corsify(make_response((
+            jsonify({"ok": True, "job": job.to_dict() if job else None}), 200
+        )))
+
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    full = request.args.get("full") in ("1", "true")
+    job = jobs.submit("rollups", _run_rollups, full, params={"full": full})
+    if job is None:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "already_running"}), 409
+        )))
+
+    return _corsify(make_response((
+        jsonify({"ok": True, "status": "started", "full": full,
+                 "job_id": job.id, "status_url": f"/jobs/{job.id}"}), 202
+    )))
+
+@app.route("/dashboard-summary", methods=["GET"])
+def dashboard_summary():
+    """Agregados do dashboard a partir dos rollups diários, com filtros opcionais.
+
+    Filtros: campaign_id, audience_type, since/until (dias ISO, until exclusivo) e
+    include_test=1 para manter as campanhas de teste.
+    """
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    try:
+        client = _client()
+        _refresh_rollups_if_stale()
+        filters = {
+            "campaign_id": request.args.get("campaign_id"),
+            "audience_type": request.args.get("audience_type"),
+            "since": request.args.get("since"),
+            "until": request.args.get("until"),
+        }
+        summary = rollups.summarize(client, include_test=request.args.get("include_test") in ("1", "true"),
+                                    **filters)
+        checkpoint = rollups.load_checkpoint(client)
+        return _corsify(make_response((
+            jsonify({"ok": True, "filters": filters, "rollups_updated_at": checkpoint.get("updated_at"),
+                     **summary}), 200
+        )))
+
+    except Exception as e:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": str(e)}), 500
+        )))
+
+@app.route("/rollups/timeseries", methods=["GET"])
+def rollups_timeseries():
+    """Série temporal (granularity=day|hour) dos rollups, com os filtros do /dashboard-summary.
+
+    `question` (q1..q6) limita a distribuição de respostas a uma pergunta.
+    """
+    if not FS_AVAILABLE:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "firestore_not_available"}), 500
+        )))
+
+    granularity = request.args.get("granularity", "day")
+    if granularity not in ("day", "hour"):
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "invalid_granularity"}), 400
+        )))
+
+    try:
+        client = _client()
+        _refresh_rollups_if_stale()
+        filters = {
+            "campaign_id": request.args.get("campaign_id"),
+            "audience_type": request.args.get("audience_type"),
+            "question": request.args.get("question"),
+            "since": request.args.get("since"),
+            "until": request.args.get("until"),
+        }
+        series = rollups.timeseries(client, granularity, include_test=request.args.get("include_test") in ("1", "true"),
+                                    **filters)
+        return _corsify(make_response((
+            jsonify({"ok": True, "granularity": granularity, "filters": filters, "count": len(series),
+                     "series": series}), 200
+        )))
+
+    except Exception as e:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": str(e)}), 500
+        )))
+
+@app.route("/replica", methods=["GET"])
+def replica_status():
+    """Estado da réplica em memória desta instância"""
+    if not REPLICA_ENABLED:
+        return _corsify(make_response((
+            jsonify({"ok": True, "enabled": False}), 200
+        )))
+    status = (_replica or _start_replica()).status()
+    return _corsify(make_response((
+        jsonify({"ok": True, "enabled": True, **status}), 200
+    )))
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Status e progresso de um job em background desta instância"""
+    job = jobs.get(job_id)
+    if job is None:
+        return _corsify(make_response((
+            jsonify({"ok": False, "error": "job_not_found"}), 404
+        )))
+    return _corsify(make_response((
+        jsonify({"ok": True, "job": job.to_dict()}), 200
+    )))
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
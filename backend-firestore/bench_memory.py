@@ -0,0 +1,146 @@
+"""
+Benchmark de memória por linha: dicts (como chegam do Firestore) contra o
+ColumnStore usado pela réplica em memória (rowstore.py), nas duas coleções
+replicadas (`responses` e `sessions`).
+
+Os dois lados guardam o mesmo conjunto de campos: o dict recebe só os campos
+das colunas da réplica (RESPONSE_COLUMNS / SESSION_COLUMNS), como numa leitura
+com máscara de campos.
+
+Uso: python bench_memory.py [--rows 100000]
+"""
+
+import gc
+import sys
+import random
+import hashlib
+import tracemalloc
+import datetime as dt
+
+import schema
+from rowstore import ColumnStore
+from replica import RESPONSE_COLUMNS, SESSION_COLUMNS
+
+ANSWERS = {
+    "q1": ["muito_agil", "agil", "pouco_agil", "nada_agil"],
+    "q2": ["muitas_parcerias", "algumas_parcerias", "poucas_parcerias", "nenhuma_parceria"],
+    "q3": ["sim", "nao", "nao_sei"],
+    "q4": ["muito_importante", "importante", "pouco_importante"],
+    "q5": ["sim", "nao", "talvez"],
+    "q6": ["muito_provavel", "provavel", "pouco_provavel", "improvavel"],
+}
+USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148"
+
+
+def _copy(text):
+    """Nova string com o mesmo conteúdo, como cada documento decodificado traz a sua"""
+    return text.encode().decode()
+
+
+def _iso(when):
+    return when.isoformat(timespec="milliseconds") + "Z"
+
+
+def response_docs(count):
+    """Documentos sintéticos no esquema normalizado de `responses`"""
+    start = dt.datetime(2025, 1, 1)
+    for i in range(count):
+        session_id = f"session_{i}_{random.randrange(10**9)}"
+        doc_id = hashlib.sha1(f"{session_id}:complete".encode()).hexdigest()
+        when = start + dt.timedelta(seconds=i)
+        yield doc_id, schema.response_record(doc_id, {
+            "answers": {q: _copy(random.choice(values)) for q, values in ANSWERS.items()},
+            "session_id": session_id,
+            "campaign_id": _copy("sebrae_2025"),
+            "audience_type": _copy(random.choice(["small_business", "general_public"])),
+            "user_agent": _copy(USER_AGENT),
+            "referer": _copy("https://dv360.example/"),
+            "origin": _copy("https://dv360.example"),
+            "page_url": _copy("https://dv360.example/creative/index.html"),
+        }, source="progressive", ts=_iso(when), received_at=_iso(when + dt.timedelta(milliseconds=350)))
+
+
+def session_docs(count):
+    """Documentos sintéticos do índice `sessions` (ingestão + reconciliação)"""
+    start = dt.datetime(2025, 1, 1)
+    for i in range(count):
+        session_id = f"session_{i}_{random.randrange(10**9)}"
+        answered = random.randint(1, 6)
+        when = start + dt.timedelta(seconds=i)
+        questions = list(ANSWERS)[:answered]
+        yield hashlib.sha1(f"{session_id}:session".encode()).hexdigest(), {
+            "session_id": session_id,
+            "campaign_id": _copy("sebrae_2025"),
+            "audience_type": _copy(random.choice(["small_business", "general_public"])),
+            "device": _copy(schema.device_type(USER_AGENT)),
+            "answers": {q: _copy(random.choice(ANSWERS[q])) for q in questions},
+            "answer_timestamps": {q: _iso(when + dt.timedelta(seconds=5 * n)) for n, q in enumerate(questions)},
+            "is_complete": answered == 6,
+            "completion_timestamp": _iso(when + dt.timedelta(seconds=30)) if answered == 6 else None,
+            "updated_at": _iso(when + dt.timedelta(seconds=5 * answered)),
+        }
+
+
+def project(data, columns, keep_none=()):
+    """Só os campos das colunas (None omitido, exceto em `keep_none`), como o ColumnStore devolve"""
+    record = {}
+    for path, _ in columns:
+        keys = path.split(".")
+        value = data
+        for key in keys:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None and not any(path == p or path.startswith(p + ".") for p in keep_none):
+            continue
+        target = record
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return record
+
+
+def measure(build, rows):
+    """Bytes que continuam alocados (tracemalloc) na estrutura montada com as linhas"""
+    gc.collect()
+    tracemalloc.start()
+    target = build(rows)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used, target
+
+
+def as_dicts(columns, keep_none):
+    def build(rows):
+        return {doc_id: project(data, columns, keep_none) for doc_id, data in rows}
+    return build
+
+
+def as_columns(columns, keep_none):
+    def build(rows):
+        store = ColumnStore(columns, keep_none)
+        for doc_id, data in rows:
+            store[doc_id] = data
+        return store
+    return build
+
+
+# Coleção -> (gerador, colunas, keep_none), como em replica.default_replica
+COLLECTIONS = {
+    "responses": (response_docs, RESPONSE_COLUMNS, ("answers",)),
+    "sessions": (session_docs, SESSION_COLUMNS, ()),
+}
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[sys.argv.index("--rows") + 1]) if "--rows" in sys.argv else 100_000
+    for collection, (generate, columns, keep_none) in COLLECTIONS.items():
+        print(f"📊 Memória por documento de {collection} ({count} documentos)")
+        results = {}
+        for name, build in (("dict", as_dicts(columns, keep_none)), ("columns", as_columns(columns, keep_none))):
+            random.seed(42)
+            used, target = measure(build, generate(count))
+            results[name] = used / count
+            print(f"   {name:8s} {used / 2**20:8.1f} MiB  {used / count:7.0f} bytes/doc  "
+                  f"~{2**30 / (used / count) / 1e6:5.1f} mi docs/GiB")
+            del target
+        print(f"✅ ColumnStore usa {results['columns'] / results['dict']:.0%} da memória dos dicts")
@@ -0,0 +1,78 @@
+"""
+Benchmark de cold start do coletor: tempo até o primeiro /collect com sucesso.
+
+Sobe o gunicorn com o gunicorn.conf.py (como no Dockerfile) e envia um /collect
+progressivo a cada 20 ms até receber 200; mede do spawn do processo até essa
+resposta. Precisa de credenciais do Firestore ou do emulador
+(FIRESTORE_EMULATOR_HOST); as sessões usam o prefixo test_ (limpas pelo /cleanup).
+Também mede a importação do app_progressive num interpretador novo.
+
+Uso: python bench_startup.py [--runs 5] [--port 8090] [--no-preload]
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _arg(name, default):
+    return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+def import_seconds():
+    """Tempo de `import app_progressive` num processo novo (firestore adiado)"""
+    code = "import time; t = time.perf_counter(); import app_progressive; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _collect(port):
+    body = json.dumps({"session_id": f"test_bench_{uuid.uuid4().hex[:12]}", "question_number": 1,
+                       "answer": "sim", "campaign_id": "bench", "audience_type": "small_business"}).encode()
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/collect", data=body,
+                                 headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status
+
+
+def first_collect_seconds(port, preload, timeout=60):
+    """Segundos do spawn do gunicorn até o primeiro /collect com 200"""
+    env = {**os.environ, "PORT": str(port), "GUNICORN_PRELOAD": "1" if preload else "0"}
+    start = time.perf_counter()
+    server = subprocess.Popen(["gunicorn", "--config", "gunicorn.conf.py", "app_progressive:app"],
+                              cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if _collect(port) == 200:
+                    return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"sem /collect com sucesso em {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    runs = _arg("--runs", 5)
+    port = _arg("--port", 8090)
+    preload = "--no-preload" not in sys.argv
+
+    print(f"📦 import app_progressive: {import_seconds() * 1000:.0f} ms")
+    print(f"🚀 Tempo até o primeiro /collect ({runs} execuções, preload={'sim' if preload else 'não'})")
+    times = []
+    for i in range(runs):
+        seconds = first_collect_seconds(port, preload)
+        times.append(seconds)
+        print(f"   #{i + 1}: {seconds * 1000:.0f} ms")
+    print(f"✅ mediana {statistics.median(times) * 1000:.0f} ms, melhor {min(times) * 1000:.0f} ms")
@@ -0,0 +1,94 @@
+"""
+Remoção em lote das sessões de teste (session_id com prefixo `test_`).
+
+As referências são lidas por consulta de intervalo em `session_id` e apagadas
+em batches de até 500 escritas, com paralelismo limitado entre as coleções.
+Com `day_fields`, a remoção também devolve os dias (UTC) das linhas apagadas,
+para os rollups desses dias serem recalculados.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import schema
+
+CLEANUP_BATCH_SIZE = int(os.environ.get("CLEANUP_BATCH_SIZE", "500"))
+CLEANUP_WORKERS = int(os.environ.get("CLEANUP_WORKERS", "4"))
+
+TEST_PREFIX = "test_"
+
+
+def prefix_range(prefix):
+    """Limites [início, fim) de uma consulta de intervalo que equivale a startswith(prefix)"""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def prefix_query(client, collection, prefix):
+    start, end = prefix_range(prefix)
+    return client.collection(collection).where("session_id", ">=", start).where("session_id", "<", end)
+
+
+def count(query):
+    """Contagem via aggregation query (não baixa os documentos)"""
+    result = query.count(alias="total").get()
+    return int(result[0][0].value)
+
+
+def count_test_sessions(client, collections, prefix=TEST_PREFIX):
+    return {name: count(prefix_query(client, collection, prefix)) for name, collection in collections.items()}
+
+
+def _delete_refs(client, refs):
+    batch = client.batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.commit()
+    return len(refs)
+
+
+def delete_test_sessions(job, client, collections, prefix=TEST_PREFIX,
+                         batch_size=CLEANUP_BATCH_SIZE, workers=CLEANUP_WORKERS, day_fields=None):
+    """Apaga os documentos de teste de todas as coleções; progresso em `job.progress`.
+
+    `collections` mapeia o nome exibido no relatório para a coleção do Firestore.
+    `day_fields` mapeia o nome para o campo de data do evento; os dias vistos
+    voltam em `days`.
+    """
+    day_fields = day_fields or {}
+    deleted = {name: 0 for name in collections}
+    days = set()
+    pending = {}
+
+    def _collect(futures):
+        for future in futures:
+            name = pending.pop(future)
+            n = future.result()
+            deleted[name] += n
+            job.incr(name, n)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cleanup") as executor:
+        for name, collection in collections.items():
+            refs = []
+            day_field = day_fields.get(name)
+            # Só o necessário para obter as referências (e o dia da linha)
+            fields = ["session_id", day_field] if day_field else ["session_id"]
+            for doc in prefix_query(client, collection, prefix).select(fields).stream():
+                refs.append(doc.reference)
+                if day_field:
+                    value = schema.iso(doc.get(day_field))
+                    if isinstance(value, str):
+                        days.add(value[:10])
+                if len(refs) >= batch_size:
+                    pending[executor.submit(_delete_refs, client, refs)] = name
+                    refs = []
+                    # Limita os batches em voo (memória e cota de escrita)
+                    if len(pending) >= workers * 2:
+                        _collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            if refs:
+                pending[executor.submit(_delete_refs, client, refs)] = name
+        _collect(wait(pending).done)
+
+    result = {**deleted, "total": sum(deleted.values())}
+    if day_fields:
+        result["days"] = sorted(days)
+    return result
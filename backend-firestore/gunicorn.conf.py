@@ -0,0 +1,37 @@
+"""
+Configuração do gunicorn do coletor (Dockerfile: gunicorn --config gunicorn.conf.py).
+
+Com preload (padrão), o mestre importa o app e o google.cloud.firestore uma vez e
+os workers herdam tudo no fork. O cliente do Firestore (canais gRPC) é criado
+depois do fork, em cada worker, antes de ele aceitar requisições.
+GUNICORN_PRELOAD=0 volta ao carregamento por worker (comparação no bench_startup.py).
+"""
+
+import os
+
+bind = f":{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+timeout = 120
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") in ("1", "true")
+
+
+def when_ready(server):
+    # Mestre, antes de criar os workers: só a importação (nenhum canal gRPC antes do fork)
+    if preload_app:
+        import app_progressive
+        app_progressive.warm_up(create_client=False)
+
+
+def post_fork(server, worker):
+    import app_progressive
+    app_progressive.warm_up()
+
+
+def worker_exit(server, worker):
+    # Contadores do /event e sketches de dwell ainda em memória (SIGTERM do Cloud Run ao reduzir instâncias)
+    import app_progressive
+    try:
+        app_progressive.flush_counters()
+    except Exception as e:
+        print(f"⚠️ Contadores não gravados na saída ({e})")
@@ -0,0 +1,124 @@
+"""
+Registro em memória de jobs em background (por instância).
+
+Cada job roda em uma thread do pool e expõe status, progresso e resultado
+para o endpoint `/jobs/<job_id>`. `schedule` repete um job em intervalo fixo
+(agendador da instância, numa thread daemon).
+"""
+
+import os
+import uuid
+import threading
+import datetime as dt
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "2"))
+JOBS_HISTORY = int(os.environ.get("JOBS_HISTORY", "100"))
+
+_executor = ThreadPoolExecutor(max_workers=JOBS_MAX_WORKERS, thread_name_prefix="job")
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_schedules = {}
+
+
+def _utcnow():
+    return dt.datetime.utcnow().isoformat() + "Z"
+
+
+class Job:
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "pending"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = _utcnow()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def incr(self, key, amount=1):
+        """Incrementa um contador de progresso (seguro entre threads)"""
+        with self._lock:
+            self.progress[key] = self.progress.get(key, 0) + amount
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "params": self.params,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+def _run(job, fn, args):
+    job.status = "running"
+    try:
+        job.result = fn(job, *args)
+        job.status = "done"
+    except Exception as e:
+        job.error = str(e)
+        job.status = "error"
+    finally:
+        job.finished_at = _utcnow()
+
+
+def submit(kind, fn, *args, params=None):
+    """Agenda `fn(job, *args)`; retorna None se já houver um job do mesmo tipo ativo"""
+    with _lock:
+        if any(j.kind == kind and j.status in ("pending", "running") for j in _jobs.values()):
+            return None
+        job = Job(kind, params or {})
+        _jobs[job.id] = job
+        while len(_jobs) > JOBS_HISTORY:
+            _jobs.popitem(last=False)
+    _executor.submit(_run, job, fn, args)
+    return job
+
+
+def get(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def latest(kind):
+    with _lock:
+        for job in reversed(_jobs.values()):
+            if job.kind == kind:
+                return job
+    return None
+
+
+def schedule(kind, interval, fn, *args, params=None):
+    """Agenda `submit(kind, fn, *args)` a cada `interval` segundos; idempotente por tipo.
+
+    Se a execução anterior ainda estiver ativa, o ciclo é pulado (mesma regra do
+    submit). Retorna o Event que para o agendamento.
+    """
+    with _lock:
+        if kind in _schedules:
+            return _schedules[kind]
+        stop = threading.Event()
+        _schedules[kind] = stop
+
+    def _loop():
+        while not stop.wait(interval):
+            submit(kind, fn, *args, params=params)
+
+    threading.Thread(target=_loop, name=f"schedule-{kind}", daemon=True).start()
+    return stop
+
+
+def unschedule(kind):
+    with _lock:
+        stop = _schedules.pop(kind, None)
+    if stop is not None:
+        stop.set()
@@ -0,0 +1,39 @@
+"""
+Importação adiada de módulos pesados.
+
+`google.cloud.firestore` puxa grpc e protobuf (centenas de ms no cold start).
+Os apps usam `LazyModule` no lugar do import direto: o módulo só é importado no
+primeiro acesso a um atributo (firestore.Client, firestore.Query), e
+`available` verifica se ele está instalado sem importá-lo.
+"""
+
+import importlib
+import importlib.util
+
+
+def available(name):
+    """True se o módulo está instalado (não executa o módulo)"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        return False
+
+
+class LazyModule:
+    """Representante de um módulo que só é importado no primeiro uso"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
@@ -0,0 +1,317 @@
+"""
+Substituto em memória do cliente do Firestore, para testes e execução local.
+
+Implementa só o subconjunto usado pelos backends: coleções, documentos,
+consultas com where/order_by/limit/select/start_after, contagem por
+aggregation, batches, get_all e Increment. Os dados são copiados na escrita e na leitura, como no Firestore.
+`create` e `update` com `write_option(last_update_time=...)` falham como as
+precondições do Firestore (exceções com os nomes das de google.api_core).
+"""
+
+import copy
+import threading
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+
+def _get_field(data, path):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            return _MISSING
+        data = data[part]
+    return data
+
+
+def _value(doc_id, data, field):
+    # "__name__" é o ID do documento, como FieldPath.document_id() no Firestore
+    return doc_id if field == "__name__" else _get_field(data, field)
+
+
+class AlreadyExists(Exception):
+    """create() de um documento que já existe"""
+
+
+class FailedPrecondition(Exception):
+    """update() com last_update_time diferente do atual"""
+
+
+class _WriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+def _sort_key(value):
+    return (value is not None, value if value is not None else 0)
+
+
+class Increment:
+    """Como firestore.Increment: soma ao valor gravado (0 se ausente ou não numérico)"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _merge(target, updates):
+    for key, value in updates.items():
+        if isinstance(value, Increment):
+            current = target.get(key)
+            target[key] = (current if isinstance(current, (int, float)) else 0) + value.value
+        elif isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, fields=None, cursor=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._fields = fields
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {"filters": self._filters, "orders": self._orders, "limit": self._limit,
+                 "fields": self._fields, "cursor": self._cursor}
+        state.update(changes)
+        return Query(self._client, self._collection, **state)
+
+    def where(self, field, op, value):
+        if op not in _OPS:
+            raise ValueError(f"operador não suportado: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def order_by(self, field, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def start_after(self, values):
+        """Cursor: dict {campo: valor} dos campos de order_by ou um DocumentSnapshot"""
+        if isinstance(values, DocumentSnapshot):
+            values = {field: _value(values.id, values._data or {}, field) for field, _ in self._orders}
+        return self._copy(cursor=dict(values))
+
+    def _matches(self, doc_id, data):
+        for field, op, value in self._filters:
+            current = _value(doc_id, data, field)
+            # Como no Firestore: documentos sem o campo não entram no filtro
+            if current is _MISSING or not _OPS[op](current, value):
+                return False
+        return all(_value(doc_id, data, field) is not _MISSING for field, _ in self._orders)
+
+    def _after_cursor(self, doc_id, data):
+        for field, direction in self._orders:
+            current, cursor = _sort_key(_value(doc_id, data, field)), _sort_key(self._cursor.get(field))
+            if current != cursor:
+                return current > cursor if direction == self.ASCENDING else current < cursor
+        return False
+
+    def stream(self):
+        docs = [(doc_id, data) for doc_id, data in self._client._snapshot(self._collection)
+                if self._matches(doc_id, data)]
+        # Desempate implícito por ID, na direção do último order_by (como no Firestore)
+        docs.sort(key=lambda item: item[0],
+                  reverse=bool(self._orders) and self._orders[-1][1] == self.DESCENDING)
+        for field, direction in reversed(self._orders):
+            # None ordena antes dos demais valores, como no Firestore
+            docs.sort(key=lambda item: _sort_key(_value(item[0], item[1], field)),
+                      reverse=direction == self.DESCENDING)
+        if self._cursor is not None:
+            docs = [item for item in docs if self._after_cursor(*item)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            if self._fields is not None:
+                data = {f: data[f] for f in self._fields if f in data}
+            yield DocumentSnapshot(self._client.collection(self._collection).document(doc_id), data)
+
+    def get(self):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return _CountQuery(self, alias)
+
+
+class _AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class _CountQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        return [[_AggregationResult(self._alias, sum(1 for _ in self._query.stream()))]]
+
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self._collection, doc_id or self._client._new_id())
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def set(self, data, merge=False):
+        self._client._write(self._collection, self.id, data, merge)
+
+    def create(self, data):
+        with self._client._lock:
+            if self._client._read(self._collection, self.id) is not None:
+                raise AlreadyExists(f"documento já existe: {self.path}")
+            self._client._write(self._collection, self.id, data, False)
+
+    def update(self, data, option=None):
+        with self._client._lock:
+            if self._client._read(self._collection, self.id) is None:
+                raise KeyError(f"documento não encontrado: {self.path}")
+            if option is not None and option.last_update_time != self._client._updated(self._collection, self.id):
+                raise FailedPrecondition(f"documento alterado: {self.path}")
+            self._client._write(self._collection, self.id, data, True)
+
+    def delete(self):
+        self._client._delete(self._collection, self.id)
+
+    def get(self):
+        with self._client._lock:
+            return DocumentSnapshot(self, self._client._read(self._collection, self.id),
+                                    self._client._updated(self._collection, self.id))
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        value = _get_field(self._data or {}, field)
+        return None if value is _MISSING else value
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data, merge=False):
+        self._ops.append((reference.set, (copy.deepcopy(data), merge)))
+
+    def update(self, reference, data):
+        self._ops.append((reference.update, (copy.deepcopy(data),)))
+
+    def delete(self, reference):
+        self._ops.append((reference.delete, ()))
+
+    def commit(self):
+        # Aplicado sob o lock do cliente: atômico para os leitores
+        with self._client._lock:
+            for fn, args in self._ops:
+                fn(*args)
+        self._ops = []
+
+
+class Client:
+    """Cliente em memória; uma instância compartilhada faz o papel do projeto"""
+
+    def __init__(self, project=None):
+        self.project = project
+        self._collections = {}
+        self._lock = threading.RLock()
+        self._ids = 0
+        self._writes = 0
+        self._update_times = {}
+
+    def _new_id(self):
+        with self._lock:
+            self._ids += 1
+            return f"auto{self._ids:016d}"
+
+    def _snapshot(self, collection):
+        with self._lock:
+            return [(doc_id, copy.deepcopy(data)) for doc_id, data in self._collections.get(collection, {}).items()]
+
+    def _read(self, collection, doc_id):
+        with self._lock:
+            data = self._collections.get(collection, {}).get(doc_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _updated(self, collection, doc_id):
+        return self._update_times.get((collection, doc_id))
+
+    def _write(self, collection, doc_id, data, merge):
+        with self._lock:
+            docs = self._collections.setdefault(collection, {})
+            if not (merge and doc_id in docs):
+                docs[doc_id] = {}
+            _merge(docs[doc_id], data)
+            # Contador no lugar do timestamp do servidor: muda a cada escrita
+            self._writes += 1
+            self._update_times[(collection, doc_id)] = self._writes
+
+    def _delete(self, collection, doc_id):
+        with self._lock:
+            self._collections.get(collection, {}).pop(doc_id, None)
+            self._update_times.pop((collection, doc_id), None)
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def write_option(self, last_update_time):
+        return _WriteOption(last_update_time)
+
+    def get_all(self, references):
+        for reference in references:
+            yield reference.get()
+
+    def collections(self):
+        with self._lock:
+            return [CollectionReference(self, name) for name in self._collections]
+
+    def reset(self):
+        with self._lock:
+            self._collections.clear()
+            self._update_times.clear()
@@ -0,0 +1,132 @@
+"""
+Migração dos documentos legados para o esquema normalizado (schema.py).
+
+- v1: documentos de `responses` sem `schema_version` são reescritos no lugar
+- v2: documentos de `responses_v2` são copiados para `responses` com o mesmo ID
+
+A leitura é paginada pelo ID do documento; cada página é gravada em batches de
+até 500 escritas com MIGRATE_WORKERS commits em paralelo, e o cursor vai para
+`_checkpoints/migrate_<origem>` ao fim da página. Se o job cair, a próxima
+execução continua do último checkpoint; as escritas são determinísticas (mesmo
+ID, mesmo conteúdo), então repetir uma página é seguro.
+
+Roda como Cloud Run Job:
+
+    python migrate.py                  # v1 e v2, retomando dos checkpoints
+    python migrate.py --source v2
+    python migrate.py --restart        # ignora os checkpoints
+    python migrate.py --dry-run        # só conta o que seria migrado
+"""
+
+import os
+import sys
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
+import schema
+
+PROJECT_ID = os.environ.get("PROJECT_ID")
+FS_COLLECTION = os.environ.get("FS_COLLECTION", "responses")
+FS_V2_COLLECTION = os.environ.get("FS_V2_COLLECTION", "responses_v2")
+FS_CHECKPOINTS_COLLECTION = os.environ.get("FS_CHECKPOINTS_COLLECTION", "_checkpoints")
+MIGRATE_BATCH_SIZE = int(os.environ.get("MIGRATE_BATCH_SIZE", "500"))
+MIGRATE_WORKERS = int(os.environ.get("MIGRATE_WORKERS", "4"))
+MIGRATE_PAGE_SIZE = int(os.environ.get("MIGRATE_PAGE_SIZE", str(MIGRATE_BATCH_SIZE * MIGRATE_WORKERS)))
+
+# Origem -> coleção lida; o destino é sempre FS_COLLECTION
+SOURCES = {"v1": FS_COLLECTION, "v2": FS_V2_COLLECTION}
+
+
+def _utcnow():
+    return dt.datetime.utcnow().isoformat() + "Z"
+
+
+def _checkpoint_ref(client, source):
+    return client.collection(FS_CHECKPOINTS_COLLECTION).document(f"migrate_{source}")
+
+
+def load_checkpoint(client, source):
+    doc = _checkpoint_ref(client, source).get()
+    return (doc.to_dict() or {}) if doc.exists else {}
+
+
+def save_checkpoint(client, source, cursor, stats, done=False):
+    _checkpoint_ref(client, source).set({
+        "cursor": cursor,
+        "done": done,
+        "schema_version": schema.SCHEMA_VERSION,
+        "updated_at": _utcnow(),
+        "stats": stats,
+    })
+
+
+def _commit(client, records):
+    batch = client.batch()
+    for record in records:
+        batch.set(client.collection(FS_COLLECTION).document(record["id"]), record)
+    batch.commit()
+    return len(records)
+
+
+def migrate_source(client, source, restart=False, dry_run=False, page_size=MIGRATE_PAGE_SIZE,
+                   batch_size=MIGRATE_BATCH_SIZE, workers=MIGRATE_WORKERS):
+    """Migra uma origem ('v1' ou 'v2') a partir do checkpoint; retorna as estatísticas"""
+    collection = SOURCES[source]
+    checkpoint = {} if restart or dry_run else load_checkpoint(client, source)
+    cursor = checkpoint.get("cursor")
+    stats = {"read": 0, "migrated": 0, "skipped": 0, "resumed_from": cursor, "started_at": _utcnow()}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="migrate") as executor:
+        while True:
+            query = client.collection(collection).order_by("__name__")
+            if cursor:
+                query = query.start_after({"__name__": cursor})
+            docs = list(query.limit(page_size).stream())
+            if not docs:
+                break
+
+            records = []
+            for doc in docs:
+                data = doc.to_dict() or {}
+                if schema.legacy_version(data) is None:
+                    stats["skipped"] += 1
+                    continue
+                record = schema.normalize(doc.id, data)
+                record["id"] = doc.id
+                records.append(record)
+
+            if dry_run:
+                stats["migrated"] += len(records)
+            elif records:
+                chunks = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+                stats["migrated"] += sum(executor.map(lambda chunk: _commit(client, chunk), chunks))
+
+            stats["read"] += len(docs)
+            cursor = docs[-1].id
+            if not dry_run:
+                # Só depois de todos os batches da página: o cursor nunca passa de algo não gravado
+                save_checkpoint(client, source, cursor, stats)
+            print(f"   {source}: {stats['read']} lidos, {stats['migrated']} migrados (cursor {cursor})")
+
+            if len(docs) < page_size:
+                break
+
+    stats["finished_at"] = _utcnow()
+    if not dry_run:
+        save_checkpoint(client, source, cursor, stats, done=True)
+    return stats
+
+
+def migrate(client, sources=("v1", "v2"), **options):
+    return {source: migrate_source(client, source, **options) for source in sources}
+
+
+if __name__ == "__main__":
+    from google.cloud import firestore
+
+    sources = tuple(SOURCES)
+    if "--source" in sys.argv:
+        sources = (sys.argv[sys.argv.index("--source") + 1],)
+    client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
+    result = migrate(client, sources, restart="--restart" in sys.argv, dry_run="--dry-run" in sys.argv)
+    print(f"Migração concluída: {result}")
@@ -0,0 +1,308 @@
+"""
+Job de reconciliação de sessões: consolida as linhas de `progressive_responses`
+em um documento por sessão (respostas, tempos e status de conclusão).
+
+Roda de forma incremental a partir de um watermark em `received_at`, salvo em
+uma coleção de checkpoints. Pode ser disparado pelo endpoint
+`/reconcile-sessions` ou como Cloud Run Job:
+
+    python reconcile.py           # incremental
+    python reconcile.py --full    # reprocessa toda a coleção
+"""
+
+import os
+import sys
+import datetime as dt
+
+import schema
+
+PROJECT_ID = os.environ.get("PROJECT_ID")
+FS_COLLECTION = os.environ.get("FS_COLLECTION", "responses")
+FS_PROGRESSIVE_COLLECTION = os.environ.get("FS_PROGRESSIVE_COLLECTION", "progressive_responses")
+FS_SESSIONS_COLLECTION = os.environ.get("FS_SESSIONS_COLLECTION", "sessions")
+FS_SESSION_META_COLLECTION = os.environ.get("FS_SESSION_META_COLLECTION", "session_meta")
+FS_CHECKPOINTS_COLLECTION = os.environ.get("FS_CHECKPOINTS_COLLECTION", "_checkpoints")
+RECONCILE_BATCH_SIZE = int(os.environ.get("RECONCILE_BATCH_SIZE", "500"))
+# Janela relida antes do watermark: received_at vem do relógio de cada instância e
+# uma linha pode ser gravada depois que o watermark já passou dela
+RECONCILE_OVERLAP_SECONDS = int(os.environ.get("RECONCILE_OVERLAP_SECONDS", "60"))
+
+CHECKPOINT_ID = "reconcile_sessions"
+TOTAL_QUESTIONS = 6
+# Limite do operador "in" do Firestore
+IN_QUERY_LIMIT = 30
+
+
+def _utcnow():
+    return dt.datetime.utcnow().isoformat() + "Z"
+
+
+def _parse_ts(value):
+    """Converte timestamps ISO (com ou sem 'Z') em datetime; None se inválido"""
+    if not value:
+        return None
+    if isinstance(value, dt.datetime):
+        return value.replace(tzinfo=None)
+    try:
+        return dt.datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _shift(watermark, seconds):
+    parsed = _parse_ts(watermark)
+    return (parsed - dt.timedelta(seconds=seconds)).isoformat() + "Z" if parsed else watermark
+
+
+def load_watermark(client):
+    doc = client.collection(FS_CHECKPOINTS_COLLECTION).document(CHECKPOINT_ID).get()
+    if doc.exists:
+        return (doc.to_dict() or {}).get("watermark")
+    return None
+
+
+def save_watermark(client, watermark, stats):
+    client.collection(FS_CHECKPOINTS_COLLECTION).document(CHECKPOINT_ID).set({
+        "watermark": watermark,
+        "updated_at": _utcnow(),
+        "last_run": stats,
+    })
+
+
+def build_session(session_id, rows, meta=None):
+    """Monta o documento consolidado de uma sessão a partir das suas linhas progressivas.
+
+    `meta` são os metadados do handshake (session_meta), quando a sessão usou o
+    protocolo compacto e as linhas não os repetem.
+    """
+    rows = sorted(rows, key=lambda r: (r.get("timestamp") or "", r.get("question_number") or 0))
+
+    answers = {}
+    answer_timestamps = {}
+    completion_timestamp = None
+    flagged_complete = False
+    user_agent = next((r["user_agent"] for r in rows if r.get("user_agent")), (meta or {}).get("user_agent"))
+    meta = {k: v for k, v in (meta or {}).items()
+            if k in ("campaign_id", "audience_type", "line_item_id", "creative_id", "page_url") and v}
+    for row in rows:
+        question_number = row.get("question_number")
+        if isinstance(question_number, int) and 1 <= question_number <= TOTAL_QUESTIONS:
+            # A última resposta de cada pergunta prevalece
+            answers[f"q{question_number}"] = row.get("answer")
+            answer_timestamps[f"q{question_number}"] = row.get("timestamp")
+        if row.get("is_complete"):
+            flagged_complete = True
+            completion_timestamp = row.get("completion_timestamp") or completion_timestamp
+            for key, value in (row.get("all_answers") or {}).items():
+                answers.setdefault(key, value)
+        for key in ("campaign_id", "audience_type", "line_item_id", "creative_id", "page_url"):
+            if row.get(key):
+                meta[key] = row.get(key)
+
+    timestamps = [t for t in (_parse_ts(r.get("timestamp")) for r in rows) if t]
+    first_at = min(timestamps) if timestamps else None
+    last_at = max(timestamps) if timestamps else None
+    questions_answered = sorted(int(k[1:]) for k in answers if k[1:].isdigit())
+
+    return {
+        "session_id": session_id,
+        **meta,
+        "answers": answers,
+        "answer_timestamps": answer_timestamps,
+        "questions_answered": questions_answered,
+        "device": schema.device_type(user_agent),
+        "is_complete": flagged_complete or len(questions_answered) == TOTAL_QUESTIONS,
+        "completion_timestamp": completion_timestamp,
+        "first_answer_at": first_at.isoformat() + "Z" if first_at else None,
+        "last_answer_at": last_at.isoformat() + "Z" if last_at else None,
+        "duration_seconds": (last_at - first_at).total_seconds() if first_at else None,
+        "row_count": len(rows),
+        "updated_at": _utcnow(),
+    }
+
+
+def session_to_api(doc_id, data):
+    """Formato de saída do GET /sessions (documento do índice ou consolidado)"""
+    answers = {k: v for k, v in (data.get("answers") or {}).items() if v}
+    answer_timestamps = data.get("answer_timestamps") or {}
+    mask = schema.answered_mask(answers)
+    timestamps = sorted(str(t) for t in answer_timestamps.values() if t)
+    return {
+        "id": doc_id,
+        "session_id": data.get("session_id"),
+        "campaign_id": data.get("campaign_id"),
+        "audience_type": data.get("audience_type"),
+        "device": data.get("device"),
+        "answers": answers,
+        "answer_timestamps": answer_timestamps,
+        "answered_mask": mask,
+        "answered_count": bin(mask).count("1"),
+        "is_complete": bool(data.get("is_complete")) or mask == (1 << TOTAL_QUESTIONS) - 1,
+        "completion_timestamp": data.get("completion_timestamp"),
+        "first_answer_at": timestamps[0] if timestamps else None,
+        "last_answer_at": timestamps[-1] if timestamps else None,
+        "updated_at": data.get("updated_at"),
+    }
+
+
+def _fetch_session_rows(client, session_ids):
+    """Busca todas as linhas progressivas das sessões informadas (consultas 'in' em lotes)"""
+    rows = {sid: [] for sid in session_ids}
+    ids = list(session_ids)
+    for start in range(0, len(ids), IN_QUERY_LIMIT):
+        chunk = ids[start:start + IN_QUERY_LIMIT]
+        docs = client.collection(FS_PROGRESSIVE_COLLECTION).where("session_id", "in", chunk).stream()
+        for doc in docs:
+            data = doc.to_dict()
+            rows[data.get("session_id")].append(data)
+    return rows
+
+
+def _fetch_session_meta(client, rows_by_session):
+    """Metadados do handshake das sessões que usaram session_token, por session_id"""
+    tokens = {}
+    for session_id, rows in rows_by_session.items():
+        for row in rows:
+            if row.get("session_token"):
+                tokens[row["session_token"]] = session_id
+                break
+    if not tokens:
+        return {}
+    refs = [client.collection(FS_SESSION_META_COLLECTION).document(t) for t in tokens]
+    return {tokens[snap.id]: snap.to_dict() for snap in client.get_all(refs) if snap.exists}
+
+
+def _merged(stored, update):
+    """Documento resultante de um set(merge=True): mapas aninhados campo a campo"""
+    result = dict(stored)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = _merged(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def _unchanged(stored, session):
+    """True se o merge da sessão não muda o documento gravado (ignorando updated_at)"""
+    if stored is None:
+        return False
+    stored = {k: v for k, v in stored.items() if k != "updated_at"}
+    return _merged(stored, {k: v for k, v in session.items() if k != "updated_at"}) == stored
+
+
+def _write_sessions(client, sessions, doc_id):
+    """Grava os documentos consolidados que mudaram e os registros completos faltantes.
+
+    Sessões relidas (janela de sobreposição) sem mudança não são regravadas: o
+    `updated_at` delas não avança e o delta do /sessions (`since=`) não as reenvia.
+    """
+    refs = {session["session_id"]: client.collection(FS_SESSIONS_COLLECTION).document(
+        doc_id(session["session_id"], "session")) for session in sessions}
+    stored = {snap.id: snap.to_dict() for snap in client.get_all(list(refs.values())) if snap.exists}
+    batch = client.batch()
+    for session in sessions:
+        session_id = session["session_id"]
+        ref = refs[session_id]
+        if not _unchanged(stored.get(ref.id), session):
+            # merge: respostas gravadas pela ingestão durante o job não são apagadas
+            batch.set(ref, session, merge=True)
+        if session["is_complete"]:
+            # Mesmo ID usado na ingestão: se o POST final chegou, vira upsert
+            complete_doc_id = doc_id(session_id, "complete")
+            record = schema.response_record(
+                complete_doc_id, session, source="progressive",
+                ts=session["completion_timestamp"] or session["last_answer_at"])
+            record["reconciled"] = True
+            # merge: não apaga o que a ingestão gravou e a sessão não tem (user_agent, ...)
+            record["metadata"] = {k: v for k, v in record["metadata"].items() if v}
+            for key in ("extra", "line_item_id", "creative_id"):
+                if record[key] is None:
+                    del record[key]
+            batch.set(client.collection(FS_COLLECTION).document(complete_doc_id), record, merge=True)
+    batch.commit()
+
+
+def reconcile_sessions(client, doc_id, full=False, batch_size=RECONCILE_BATCH_SIZE):
+    """Processa as linhas novas desde o watermark e atualiza as sessões afetadas.
+
+    `doc_id` é a função de IDs determinísticos da API, para que o registro
+    completo gerado aqui coincida com o gravado na ingestão.
+    """
+    stats = {"rows": 0, "sessions": 0, "started_at": _utcnow()}
+    if full:
+        return _reconcile_full(client, doc_id, stats)
+
+    watermark = load_watermark(client)
+    # Relê a janela de sobreposição; sessões sem mudança não são regravadas (_write_sessions)
+    base = client.collection(FS_PROGRESSIVE_COLLECTION)
+    if watermark:
+        base = base.where("received_at", ">", _shift(watermark, RECONCILE_OVERLAP_SECONDS))
+    base = base.order_by("received_at")
+    cursor = None
+    while True:
+        query = base.start_after(cursor) if cursor is not None else base
+        docs = list(query.limit(batch_size).stream())
+        if not docs:
+            break
+
+        session_ids = set()
+        for doc in docs:
+            data = doc.to_dict()
+            if data.get("session_id"):
+                session_ids.add(data["session_id"])
+            received_at = data.get("received_at")
+            if received_at and (watermark is None or received_at > watermark):
+                watermark = received_at
+        rows_by_session = _fetch_session_rows(client, session_ids)
+        metas = _fetch_session_meta(client, rows_by_session)
+        sessions = [build_session(sid, rows, metas.get(sid)) for sid, rows in rows_by_session.items() if rows]
+        for start in range(0, len(sessions), 200):
+            # Até 2 escritas por sessão, dentro do limite de 500 por batch
+            _write_sessions(client, sessions[start:start + 200], doc_id)
+
+        cursor = docs[-1]
+        stats["rows"] += len(docs)
+        stats["sessions"] += len(sessions)
+        save_watermark(client, watermark, stats)
+
+        if len(docs) < batch_size:
+            break
+
+    stats["finished_at"] = _utcnow()
+    stats["watermark"] = watermark
+    return stats
+
+
+def _reconcile_full(client, doc_id, stats):
+    """Reprocessa a coleção inteira (inclui linhas antigas sem `received_at`)"""
+    rows_by_session = {}
+    watermark = None
+    for doc in client.collection(FS_PROGRESSIVE_COLLECTION).stream():
+        data = doc.to_dict()
+        stats["rows"] += 1
+        if data.get("session_id"):
+            rows_by_session.setdefault(data["session_id"], []).append(data)
+        received_at = data.get("received_at")
+        if received_at and (watermark is None or received_at > watermark):
+            watermark = received_at
+
+    metas = _fetch_session_meta(client, rows_by_session)
+    sessions = [build_session(sid, rows, metas.get(sid)) for sid, rows in rows_by_session.items()]
+    for start in range(0, len(sessions), 200):
+        _write_sessions(client, sessions[start:start + 200], doc_id)
+    stats["sessions"] = len(sessions)
+    save_watermark(client, watermark, stats)
+
+    stats["finished_at"] = _utcnow()
+    stats["watermark"] = watermark
+    return stats
+
+
+if __name__ == "__main__":
+    from google.cloud import firestore
+    from app_progressive import _doc_id
+
+    client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
+    result = reconcile_sessions(client, _doc_id, full="--full" in sys.argv)
+    print(f"Reconciliação concluída: {result}")
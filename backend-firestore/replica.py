@@ -0,0 +1,402 @@
+"""
+Réplica em memória das coleções de leitura (`responses` e `sessions`), opcional
+por instância (REPLICA_ENABLED=1). O /analytics sai dos rollups, então as linhas
+de `progressive_responses` não são replicadas.
+
+Com o cliente do Firestore, cada coleção é mantida por um listener `on_snapshot`
+(adições, alterações e remoções chegam pelo stream). Sem listener (memstore ou
+cliente sem suporte), uma thread lê o delta a cada REPLICA_POLL_SECONDS pelo
+campo de watermark de cada coleção e recarrega tudo a cada
+REPLICA_RESYNC_SECONDS, o que também captura remoções e documentos antigos sem
+watermark.
+
+As consultas usam índices ordenados (bisect) por `ts` e `updated_at`: as
+listagens com filtro de intervalo e limite não varrem a coleção. Os documentos
+ficam em colunas compactas (rowstore.py), só com os campos que as leituras usam.
+
+Com um snapshot em disco (save_snapshot), uma instância nova mapeia o arquivo
+(mmap), copia as colunas direto para as arrays e aplica só o delta desde o
+watermark de cada coleção, sem reler as coleções inteiras. Nesse caso o listener
+só vê o delta (não as remoções de documentos antigos), então a réplica também
+recarrega tudo a cada REPLICA_RESYNC_SECONDS.
+"""
+
+import os
+import mmap
+import time
+import pickle
+import struct
+import threading
+import datetime as dt
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+import schema
+from rowstore import ColumnStore
+
+REPLICA_POLL_SECONDS = float(os.environ.get("REPLICA_POLL_SECONDS", "5"))
+REPLICA_RESYNC_SECONDS = float(os.environ.get("REPLICA_RESYNC_SECONDS", "3600"))
+# Margem sobre o watermark para escritas concorrentes de outras instâncias
+REPLICA_OVERLAP_SECONDS = int(os.environ.get("REPLICA_OVERLAP_SECONDS", "60"))
+
+# Snapshot em disco: [SNAPSHOT_MAGIC][arrays das colunas][cabeçalho pickle][offset do cabeçalho, 8 bytes]
+SNAPSHOT_MAGIC = b"SMREPL01"
+
+# Campos guardados por coleção (rowstore.ColumnStore); só o que as consultas e saídas usam
+RESPONSE_COLUMNS = [
+    ("id", "str"), ("schema_version", "small"), ("ts", "time"), ("session_id", "str"),
+    ("campaign_id", "code"), ("audience_type", "code"),
+    *[(f"answers.{q}", "code") for q in schema.QUESTIONS],
+    ("is_complete", "bool"),
+    *[(f"metadata.{field}", "code") for field in schema.METADATA_FIELDS],
+]
+SESSION_COLUMNS = [
+    ("session_id", "str"), ("campaign_id", "code"), ("audience_type", "code"), ("device", "code"),
+    *[(f"answers.{q}", "code") for q in schema.QUESTIONS],
+    *[(f"answer_timestamps.{q}", "time") for q in schema.QUESTIONS],
+    ("is_complete", "bool"), ("completion_timestamp", "time"), ("updated_at", "time"),
+]
+
+# Maior que qualquer ID de documento: (valor, _MAX_ID) fica depois de todos os IDs com o mesmo valor
+_MAX_ID = "\U0010ffff"
+
+
+def _shift(watermark, seconds):
+    try:
+        parsed = dt.datetime.fromisoformat(str(watermark).replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return watermark
+    return (parsed - dt.timedelta(seconds=seconds)).isoformat() + "Z"
+
+
+class Mirror:
+    """Espelho de uma coleção: documentos por ID, índice ordenado e watermark.
+
+    Com `columns` os documentos ficam num ColumnStore; sem, num dict.
+    """
+
+    def __init__(self, collection, watermark_field, sort_field=None, transform=None, columns=None,
+                 keep_none=()):
+        self.collection = collection
+        self.watermark_field = watermark_field
+        self.sort_field = sort_field
+        self.transform = transform
+        self.columns = columns
+        self.keep_none = keep_none
+        self.docs = ColumnStore(columns, keep_none) if columns else {}
+        self.keys = []  # (valor de sort_field, doc_id), ordenado
+        self.watermark = None
+
+    def _sort_value(self, record):
+        return schema.iso(record.get(self.sort_field)) if self.sort_field else None
+
+    def apply(self, doc_id, data):
+        self.remove(doc_id)
+        record = self.transform(doc_id, data) if self.transform else data
+        self.docs[doc_id] = record
+        value = self._sort_value(record)
+        if value is not None:
+            insort(self.keys, (value, doc_id))
+        mark = data.get(self.watermark_field)
+        if mark and (self.watermark is None or mark > self.watermark):
+            self.watermark = mark
+
+    def remove(self, doc_id):
+        old = self.docs.pop(doc_id, None)
+        if old is None:
+            return
+        value = self._sort_value(old)
+        if value is not None:
+            i = bisect_left(self.keys, (value, doc_id))
+            if i < len(self.keys) and self.keys[i] == (value, doc_id):
+                del self.keys[i]
+
+    def empty_copy(self):
+        return Mirror(self.collection, self.watermark_field, self.sort_field, self.transform,
+                      self.columns, self.keep_none)
+
+    def dump(self):
+        """(estado, arrays) do espelho para o snapshot"""
+        state = {"collection": self.collection, "columns": self.columns, "keep_none": self.keep_none,
+                 "watermark": self.watermark, "keys": self.keys}
+        if isinstance(self.docs, ColumnStore):
+            state["docs"], arrays = self.docs.dump()
+        else:
+            state["docs"], arrays = self.docs, []
+        return state, arrays
+
+    def restored(self, state, arrays):
+        """Cópia do espelho com o conteúdo do snapshot; None se o snapshot é de outro formato"""
+        if (state["collection"], state["columns"], state["keep_none"]) != (self.collection, self.columns,
+                                                                            self.keep_none):
+            return None
+        copy = self.empty_copy()
+        copy.watermark = state["watermark"]
+        copy.keys = state["keys"]
+        if self.columns:
+            copy.docs = ColumnStore.restore(self.columns, self.keep_none, state["docs"], arrays)
+        else:
+            copy.docs = state["docs"]
+        return copy
+
+
+class Replica:
+    """Conjunto de espelhos de uma instância, com carga, delta e consultas"""
+
+    def __init__(self, client, mirrors):
+        self.client = client
+        self.mirrors = mirrors
+        self.lock = threading.RLock()
+        self.ready = False
+        self.mode = None
+        self.loaded_at = None
+        self.polled_at = None
+        self.snapshot = {}
+        self._synced = set()
+        self._watches = []
+        self._stop = threading.Event()
+
+    # --- manutenção ----------------------------------------------------------
+
+    def load(self):
+        """Carga completa; troca os espelhos de uma vez (leituras não veem carga parcial)"""
+        fresh = {}
+        for name, mirror in self.mirrors.items():
+            copy = mirror.empty_copy()
+            for doc in self.client.collection(mirror.collection).stream():
+                copy.apply(doc.id, doc.to_dict() or {})
+            fresh[name] = copy
+        with self.lock:
+            self.mirrors = fresh
+            self.ready = True
+            self.loaded_at = time.time()
+
+    def poll(self):
+        """Aplica os documentos gravados desde o watermark de cada espelho; retorna quantos"""
+        applied = 0
+        for name, mirror in self.mirrors.items():
+            query = self.client.collection(mirror.collection)
+            if mirror.watermark:
+                query = query.where(mirror.watermark_field, ">", _shift(mirror.watermark, REPLICA_OVERLAP_SECONDS))
+            docs = list(query.stream())
+            with self.lock:
+                for doc in docs:
+                    self.mirrors[name].apply(doc.id, doc.to_dict() or {})
+            applied += len(docs)
+        self.polled_at = time.time()
+        return applied
+
+    def save_snapshot(self, path):
+        """Grava colunas, índices e watermarks em `path` (troca atômica); retorna os bytes gravados"""
+        with self.lock:
+            header = {"saved_at": time.time(), "loaded_at": self.loaded_at, "mirrors": {}}
+            blobs = []
+            offset = len(SNAPSHOT_MAGIC)
+            for name, mirror in self.mirrors.items():
+                state, arrays = mirror.dump()
+                state["arrays"] = []
+                for values in arrays:
+                    blob = values.tobytes()
+                    state["arrays"].append((values.typecode, offset, len(blob)))
+                    blobs.append(blob)
+                    offset += len(blob)
+                header["mirrors"][name] = state
+            header_blob = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            for blob in blobs:
+                f.write(blob)
+            f.write(header_blob)
+            f.write(struct.pack("<Q", offset))
+        os.replace(tmp, path)
+        size = offset + len(header_blob) + 8
+        self.snapshot.update({"path": path, "saved_at": header["saved_at"], "bytes": size})
+        return size
+
+    def restore_snapshot(self, path):
+        """Carrega o snapshot de `path` (mmap) e marca a réplica como pronta.
+
+        Retorna False, sem alterar nada, se o arquivo não existe, está corrompido
+        ou foi gravado com outras colunas (deploy com outro esquema).
+        """
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                    return False
+                (offset,) = struct.unpack("<Q", data[-8:])
+                header = pickle.loads(data[offset:-8])
+                fresh = {}
+                with memoryview(data) as view:
+                    for name, mirror in self.mirrors.items():
+                        state = header["mirrors"].get(name)
+                        if state is None:
+                            return False
+                        arrays = []
+                        for typecode, start, size in state["arrays"]:
+                            values = array(typecode)
+                            values.frombytes(view[start:start + size])
+                            arrays.append(values)
+                        fresh[name] = mirror.restored(state, arrays)
+                        if fresh[name] is None:
+                            return False
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"⚠️ Réplica: snapshot {path} ignorado ({e})")
+            return False
+        with self.lock:
+            self.mirrors = fresh
+            self.ready = True
+            self.loaded_at = header["loaded_at"]
+        self.snapshot.update({"path": path, "restored_from": header["saved_at"]})
+        return True
+
+    def _on_snapshot(self, name):
+        def callback(snapshot, changes, read_time):
+            with self.lock:
+                mirror = self.mirrors[name]
+                for change in changes:
+                    if change.type.name == "REMOVED":
+                        mirror.remove(change.document.id)
+                    else:
+                        mirror.apply(change.document.id, change.document.to_dict() or {})
+                self._synced.add(name)
+                self.ready = self.ready or len(self._synced) == len(self.mirrors)
+                self.polled_at = time.time()
+        return callback
+
+    def start(self, poll_seconds=REPLICA_POLL_SECONDS, resync_seconds=REPLICA_RESYNC_SECONDS):
+        """Liga a réplica em background (listeners ou polling); não bloqueia"""
+        refs = {name: self.client.collection(m.collection) for name, m in self.mirrors.items()}
+        if all(hasattr(ref, "on_snapshot") for ref in refs.values()):
+            self.mode = "listener"
+            restored = self.ready
+            if restored:
+                # Restaurada do snapshot: o listener só recebe o que mudou desde o watermark
+                refs = {name: ref.where(self.mirrors[name].watermark_field, ">",
+                                        _shift(self.mirrors[name].watermark, REPLICA_OVERLAP_SECONDS))
+                        if self.mirrors[name].watermark else ref
+                        for name, ref in refs.items()}
+            self._watches = [ref.on_snapshot(self._on_snapshot(name)) for name, ref in refs.items()]
+            if restored:
+                # O listener filtrado não vê remoções de documentos anteriores ao watermark
+                # (/cleanup-test-sessions): recarga completa periódica, como no polling
+                threading.Thread(target=self._resync_loop, args=(resync_seconds,), name="replica-resync",
+                                 daemon=True).start()
+            return
+
+        self.mode = "polling"
+
+        def _loop():
+            if self.ready:
+                self.poll()
+            else:
+                self.load()
+            while not self._stop.wait(poll_seconds):
+                try:
+                    if time.time() - self.loaded_at > resync_seconds:
+                        self.load()
+                    else:
+                        self.poll()
+                except Exception as e:
+                    print(f"⚠️ Réplica: falha na atualização ({e})")
+
+        threading.Thread(target=_loop, name="replica", daemon=True).start()
+
+    def _resync_loop(self, resync_seconds):
+        while not self._stop.wait(resync_seconds):
+            try:
+                self.load()
+                # Mudanças entregues pelo listener durante a carga foram para os espelhos substituídos
+                self.poll()
+            except Exception as e:
+                print(f"⚠️ Réplica: falha na recarga ({e})")
+
+    def stop(self):
+        self._stop.set()
+        for watch in self._watches:
+            watch.unsubscribe()
+
+    def status(self):
+        with self.lock:
+            return {
+                "ready": self.ready,
+                "mode": self.mode,
+                "loaded_at": self.loaded_at,
+                "polled_at": self.polled_at,
+                "snapshot": self.snapshot,
+                "collections": {name: {"docs": len(m.docs), "watermark": m.watermark}
+                                for name, m in self.mirrors.items()},
+            }
+
+    # --- consultas -----------------------------------------------------------
+
+    def query_responses(self, campaign_id=None, audience_type=None, session_prefix=None,
+                        since=None, until=None, limit=None, count_only=False):
+        """Mesmos filtros e ordem do /responses no Firestore; retorna (count, records)"""
+        with self.lock:
+            mirror = self.mirrors["responses"]
+            keys = mirror.keys
+            lo = bisect_left(keys, (since,)) if since else 0
+            hi = bisect_left(keys, (until,)) if until else len(keys)
+            records = []
+            # Do mais recente para o mais antigo; sem prefixo, o limite encerra a varredura
+            for i in range(hi - 1, lo - 1, -1):
+                record = mirror.docs[keys[i][1]]
+                if campaign_id and record.get("campaign_id") != campaign_id:
+                    continue
+                if audience_type and record.get("audience_type") != audience_type:
+                    continue
+                if session_prefix and not str(record.get("session_id") or "").startswith(session_prefix):
+                    continue
+                records.append(record)
+                if limit and not count_only and not session_prefix and len(records) == limit:
+                    break
+        if count_only:
+            return len(records), []
+        if session_prefix:
+            # Como no Firestore: o filtro de intervalo em session_id ordena primeiro por ele
+            records.sort(key=lambda r: r.get("session_id") or "")
+            records = records[:limit] if limit else records
+        return len(records), records
+
+    def query_sessions(self, campaign_id=None, audience_type=None, limit=100, since=None, cursor=None):
+        """Mesma paginação do /sessions; retorna ([(doc_id, data)], has_more)"""
+        with self.lock:
+            mirror = self.mirrors["sessions"]
+            keys = mirror.keys
+            if since:
+                updated_at, _, doc_id = since.partition("|")
+                positions = range(bisect_right(keys, (updated_at, doc_id or _MAX_ID)), len(keys))
+            elif cursor:
+                updated_at, _, doc_id = cursor.partition("|")
+                if doc_id:
+                    positions = range(bisect_left(keys, (updated_at, doc_id)) - 1, -1, -1)
+                else:
+                    positions = range(len(keys) - 1, bisect_right(keys, (updated_at, _MAX_ID)) - 1, -1)
+            else:
+                positions = range(len(keys) - 1, -1, -1)
+
+            found = []
+            for i in positions:
+                data = mirror.docs[keys[i][1]]
+                if campaign_id and data.get("campaign_id") != campaign_id:
+                    continue
+                if audience_type and data.get("audience_type") != audience_type:
+                    continue
+                found.append((keys[i][1], data))
+                if len(found) > limit:
+                    break
+        return found[:limit], len(found) > limit
+
+
+def default_replica(client, collections):
+    """Réplica das coleções de leitura; `collections` mapeia o nome lógico para a coleção"""
+    return Replica(client, {
+        "responses": Mirror(collections["responses"], "received_at", sort_field="ts",
+                            transform=schema.normalize, columns=RESPONSE_COLUMNS, keep_none=("answers",)),
+        "sessions": Mirror(collections["sessions"], "updated_at", sort_field="updated_at",
+                           columns=SESSION_COLUMNS),
+    })
@@ -0,0 +1,541 @@
+"""
+Rollups dos agregados do dashboard: `rollups_hourly` (um documento por hora UTC)
+e `rollups_daily` (um documento por dia UTC).
+
+Cada documento traz uma lista de buckets por (campaign_id, audience_type) com os
+contadores das respostas completas (perguntas, dispositivos) e das progressivas
+(linhas, sessões, funil por pergunta e, por hora, linhas e respostas por
+pergunta). O `/dashboard-summary` e as séries temporais somam os documentos
+diários do intervalo: o custo depende do número de dias, não de respostas.
+
+A atualização é incremental: as linhas gravadas desde o watermark (`received_at`)
+indicam as horas afetadas, e cada hora afetada é recalculada por inteiro a partir
+das coleções de origem (reenvios e upserts não contam duas vezes). Enquanto o
+dia está aberto, o documento diário é a compactação dos horários para os
+contadores por linha. Os contadores por sessão (sessões, conclusões e funil por
+pergunta) não existem nos horários: uma sessão que conclui na hora seguinte
+contaria como abandono na anterior. Eles são calculados só por dia, relendo as
+linhas do dia aberto (só os campos do funil) a cada compactação. Depois de
+ROLLUP_CLOSE_GRACE_SECONDS do fim do dia, o dia é fechado: o documento diário é
+recalculado de uma vez (sessões exatas) com `closed=True` e os horários dele são
+apagados. Sessões que cruzam a meia-noite UTC contam nos dois dias.
+
+Só uma instância atualiza por vez (`run_leased`): um documento de lease em
+`_checkpoints`, tomado com precondição (create / last_update_time), elege o
+executor. Os demais workers e instâncias pulam a rodada, e quem terminou segura
+o lease pelo intervalo pedido, o que limita as releituras do dia aberto a uma
+por intervalo no serviço inteiro.
+
+    python rollups.py           # incremental
+    python rollups.py --full    # recalcula todos os dias
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import datetime as dt
+
+import schema
+import reconcile
+
+PROJECT_ID = os.environ.get("PROJECT_ID")
+FS_COLLECTION = os.environ.get("FS_COLLECTION", "responses")
+FS_PROGRESSIVE_COLLECTION = os.environ.get("FS_PROGRESSIVE_COLLECTION", "progressive_responses")
+FS_ROLLUPS_COLLECTION = os.environ.get("FS_ROLLUPS_COLLECTION", "rollups_daily")
+FS_ROLLUPS_HOURLY_COLLECTION = os.environ.get("FS_ROLLUPS_HOURLY_COLLECTION", "rollups_hourly")
+FS_CHECKPOINTS_COLLECTION = os.environ.get("FS_CHECKPOINTS_COLLECTION", "_checkpoints")
+# Margem sobre o watermark para escritas concorrentes de outras instâncias
+ROLLUP_OVERLAP_SECONDS = int(os.environ.get("ROLLUP_OVERLAP_SECONDS", "60"))
+# Espera depois da meia-noite antes de fechar o dia (reenvios do localStorage chegam atrasados)
+ROLLUP_CLOSE_GRACE_SECONDS = int(os.environ.get("ROLLUP_CLOSE_GRACE_SECONDS", "7200"))
+
+# Validade do lease de quem está rodando (maior que a duração de uma atualização)
+ROLLUP_LEASE_SECONDS = int(os.environ.get("ROLLUP_LEASE_SECONDS", "900"))
+
+CHECKPOINT_ID = "rollups_daily"
+LEASE_ID = "rollups_lease"
+# Falhas de precondição (nomes de google.api_core.exceptions e do memstore): outra instância gravou antes
+LEASE_CONFLICTS = ("AlreadyExists", "FailedPrecondition", "Conflict", "Aborted")
+UNKNOWN_AUDIENCE = "unknown"
+DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}")
+HOUR_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}")
+# Campos de identificação do bucket (não são contadores)
+BUCKET_KEYS = ("campaign_id", "audience_type")
+
+# Campos das linhas progressivas lidos para os contadores por sessão do dia aberto
+SESSION_FIELDS = ["session_id", "session_token", "question_number", "is_complete", "campaign_id", "audience_type"]
+
+# Coleção de origem -> (coleção, campo de data do evento)
+SOURCES = {
+    "responses": (FS_COLLECTION, "ts"),
+    "progressive": (FS_PROGRESSIVE_COLLECTION, "timestamp"),
+}
+
+
+def _utcnow():
+    return dt.datetime.utcnow().isoformat() + "Z"
+
+
+def _day(value):
+    value = schema.iso(value)
+    if isinstance(value, str) and DAY_PATTERN.match(value):
+        return value[:10]
+    return None
+
+
+def _hour(value):
+    value = schema.iso(value)
+    if isinstance(value, str) and HOUR_PATTERN.match(value):
+        return value[:13]
+    return None
+
+
+def _next_day(day):
+    return (dt.date.fromisoformat(day) + dt.timedelta(days=1)).isoformat()
+
+
+def _next_hour(hour):
+    return (dt.datetime.strptime(hour, "%Y-%m-%dT%H") + dt.timedelta(hours=1)).strftime("%Y-%m-%dT%H")
+
+
+def is_finished(day, now=None):
+    """True se o dia já acabou há mais de ROLLUP_CLOSE_GRACE_SECONDS"""
+    now = now or dt.datetime.utcnow()
+    end = dt.datetime.fromisoformat(_next_day(day))
+    return now >= end + dt.timedelta(seconds=ROLLUP_CLOSE_GRACE_SECONDS)
+
+
+def _incr(counter, key, amount=1):
+    counter[key] = counter.get(key, 0) + amount
+
+
+def _new_bucket(campaign_id, audience_type):
+    return {
+        "campaign_id": campaign_id,
+        "audience_type": audience_type,
+        "responses": 0,
+        "questions": {},
+        "devices": {},
+        "progressive_rows": 0,
+        "progressive_complete_rows": 0,
+        "sessions": 0,
+        "completed_sessions": 0,
+        "answered": {},
+        "abandoned": {},
+        "hours": {},
+        "progressive_devices": {},
+    }
+
+
+def _hour_counters(bucket, timestamp):
+    return bucket["hours"].setdefault(str(schema.iso(timestamp))[11:13],
+                                      {"responses": 0, "rows": 0, "complete": 0, "answers": {}})
+
+
+def _bucket_getter(buckets):
+    def bucket(data):
+        key = (data.get("campaign_id"), data.get("audience_type") or UNKNOWN_AUDIENCE)
+        if key not in buckets:
+            buckets[key] = _new_bucket(*key)
+        return buckets[key]
+    return bucket
+
+
+def _progressive_sessions(client, start, end, fields=None):
+    """Linhas progressivas com data do evento em [start, end), por sessão, e os metadados do handshake"""
+    rows_by_session = {}
+    query = client.collection(FS_PROGRESSIVE_COLLECTION).where("timestamp", ">=", start).where("timestamp", "<", end)
+    if fields:
+        query = query.select(fields)
+    for doc in query.stream():
+        data = doc.to_dict()
+        rows_by_session.setdefault(data.get("session_id"), []).append(data)
+    # Protocolo compacto: user_agent e demais metadados ficam em session_meta
+    return rows_by_session, reconcile._fetch_session_meta(client, rows_by_session)
+
+
+def _session_dims(rows, meta):
+    return {k: next((r[k] for r in rows if r.get(k)), meta.get(k)) for k in BUCKET_KEYS}
+
+
+def _add_session_counters(b, rows):
+    """Sessões, conclusões e funil por pergunta de uma sessão (todas as linhas dela no período)"""
+    complete = any(row.get("is_complete") for row in rows)
+    questions = {row["question_number"] for row in rows if isinstance(row.get("question_number"), int)}
+    b["sessions"] += 1
+    b["completed_sessions"] += int(complete)
+    for question in questions:
+        _incr(b["answered"], str(question))
+        if not complete:
+            _incr(b["abandoned"], str(question))
+
+
+def _build_buckets(client, start, end, sessions=True):
+    """Buckets das linhas com data do evento em [start, end) (dia ou hora, em texto ISO).
+
+    Com `sessions=False` (horários) ficam só os contadores por linha.
+    """
+    buckets = {}
+    bucket = _bucket_getter(buckets)
+
+    query = client.collection(FS_COLLECTION).where("ts", ">=", start).where("ts", "<", end)
+    for doc in query.stream():
+        record = schema.normalize(doc.id, doc.to_dict())
+        b = bucket(record)
+        b["responses"] += 1
+        _hour_counters(b, record.get("ts"))["responses"] += 1
+        for question, answer in (record.get("answers") or {}).items():
+            if answer:
+                _incr(b["questions"].setdefault(question, {}), str(answer))
+        _incr(b["devices"], schema.device_type((record.get("metadata") or {}).get("user_agent")))
+
+    rows_by_session, metas = _progressive_sessions(client, start, end)
+    for session_id, rows in rows_by_session.items():
+        meta = metas.get(session_id) or {}
+        b = bucket(_session_dims(rows, meta))
+        for row in rows:
+            b["progressive_rows"] += 1
+            hour = _hour_counters(b, row.get("timestamp"))
+            hour["rows"] += 1
+            if row.get("answer") and isinstance(row.get("question_number"), int):
+                _incr(hour["answers"].setdefault(f"q{row['question_number']}", {}), str(row["answer"]))
+            if row.get("is_complete"):
+                b["progressive_complete_rows"] += 1
+                hour["complete"] += 1
+            _incr(b["progressive_devices"], schema.device_type(row.get("user_agent") or meta.get("user_agent")))
+        if sessions:
+            _add_session_counters(b, rows)
+
+    return list(buckets.values())
+
+
+def build_day(client, day):
+    """Recalcula o documento de um dia fechado a partir das coleções de origem"""
+    return {"day": day, "closed": True, "updated_at": _utcnow(),
+            "buckets": _build_buckets(client, day, _next_day(day))}
+
+
+def build_hour(client, hour):
+    """Recalcula o documento de uma hora a partir das coleções de origem (sem contadores por sessão)"""
+    return {"hour": hour, "day": hour[:10], "updated_at": _utcnow(),
+            "buckets": _build_buckets(client, hour, _next_hour(hour), sessions=False)}
+
+
+def _merge_buckets(target, buckets):
+    for b in buckets:
+        key = tuple(b.get(k) for k in BUCKET_KEYS)
+        if key not in target:
+            target[key] = _new_bucket(*key)
+        _add(target[key], {k: v for k, v in b.items() if k not in BUCKET_KEYS})
+
+
+def compact_day(client, day):
+    """Documento de um dia aberto: soma dos horários mais os contadores por sessão do dia"""
+    merged = {}
+    for doc in client.collection(FS_ROLLUPS_HOURLY_COLLECTION).where("day", "==", day).stream():
+        _merge_buckets(merged, doc.to_dict().get("buckets") or [])
+    # Chaves como em _merge_buckets (audience_type já normalizado nos horários)
+    bucket = _bucket_getter(merged)
+    rows_by_session, metas = _progressive_sessions(client, day, _next_day(day), SESSION_FIELDS)
+    for session_id, rows in rows_by_session.items():
+        _add_session_counters(bucket(_session_dims(rows, metas.get(session_id) or {})), rows)
+    return {"day": day, "closed": False, "updated_at": _utcnow(), "buckets": list(merged.values())}
+
+
+def close_day(client, day):
+    """Fecha o dia: documento diário exato e remoção dos horários (compactação)"""
+    client.collection(FS_ROLLUPS_COLLECTION).document(day).set(build_day(client, day))
+    refs = [doc.reference for doc in
+            client.collection(FS_ROLLUPS_HOURLY_COLLECTION).where("day", "==", day).select([]).stream()]
+    for start in range(0, len(refs), 500):
+        batch = client.batch()
+        for ref in refs[start:start + 500]:
+            batch.delete(ref)
+        batch.commit()
+    return len(refs)
+
+
+def rebuild_days(client, days, now=None):
+    """Recalcula os rollups de dias cujas linhas foram apagadas (ex.: sessões de teste).
+
+    O watermark não vê remoções: dias encerrados são fechados de novo (exatos) e
+    dias abertos têm os horários existentes e o documento diário recalculados.
+    """
+    rebuilt = []
+    for day in sorted(d for d in days if d and DAY_PATTERN.match(d)):
+        if is_finished(day, now):
+            close_day(client, day)
+        else:
+            hourly = client.collection(FS_ROLLUPS_HOURLY_COLLECTION)
+            for doc in hourly.where("day", "==", day).select([]).stream():
+                hourly.document(doc.id).set(build_hour(client, doc.id))
+            client.collection(FS_ROLLUPS_COLLECTION).document(day).set(compact_day(client, day))
+        rebuilt.append(day)
+    return rebuilt
+
+
+def load_checkpoint(client):
+    doc = client.collection(FS_CHECKPOINTS_COLLECTION).document(CHECKPOINT_ID).get()
+    return (doc.to_dict() or {}) if doc.exists else {}
+
+
+def save_checkpoint(client, watermarks, stats):
+    # O watermark só avança, mesmo que uma execução antiga termine depois de outra
+    stored = load_checkpoint(client).get("watermarks") or {}
+    watermarks = {name: max((w for w in (mark, stored.get(name)) if w), default=None)
+                  for name, mark in {**stored, **watermarks}.items()}
+    client.collection(FS_CHECKPOINTS_COLLECTION).document(CHECKPOINT_ID).set({
+        "watermarks": watermarks,
+        "updated_at": _utcnow(),
+        "last_run": stats,
+    })
+
+
+def _lease_conflict(error):
+    return type(error).__name__ in LEASE_CONFLICTS
+
+
+def acquire_lease(client, owner, seconds=ROLLUP_LEASE_SECONDS, now=None):
+    """Toma o lease dos rollups por `seconds` se ele estiver livre; False se outra instância o tem"""
+    now = time.time() if now is None else now
+    ref = client.collection(FS_CHECKPOINTS_COLLECTION).document(LEASE_ID)
+    lease = {"owner": owner, "expires_at": now + seconds, "acquired_at": _utcnow()}
+    snap = ref.get()
+    try:
+        if not snap.exists:
+            ref.create(lease)
+        elif (snap.get("expires_at") or 0) <= now:
+            ref.update(lease, option=client.write_option(last_update_time=snap.update_time))
+        else:
+            return False
+    except Exception as e:
+        if _lease_conflict(e):
+            return False
+        raise
+    return True
+
+
+def release_lease(client, owner, until=0):
+    """Devolve o lease de `owner`; ele continua reservado até `until` (epoch), se no futuro"""
+    ref = client.collection(FS_CHECKPOINTS_COLLECTION).document(LEASE_ID)
+    snap = ref.get()
+    if not snap.exists or snap.get("owner") != owner:
+        return False
+    try:
+        ref.update({"expires_at": until}, option=client.write_option(last_update_time=snap.update_time))
+    except Exception as e:
+        if _lease_conflict(e):
+            return False
+        raise
+    return True
+
+
+def run_leased(client, full=False, interval=0):
+    """update_rollups só se esta instância tomar o lease; senão {"skipped": "leased"}.
+
+    Depois de rodar, o lease fica reservado até 90% de `interval` contado do
+    início: a próxima rodada (de qualquer worker ou instância) só vem depois
+    disso, e o próximo tique do mesmo agendador já a encontra livre.
+    """
+    owner = uuid.uuid4().hex
+    started = time.time()
+    if not acquire_lease(client, owner, now=started):
+        return {"skipped": "leased"}
+    try:
+        stats = update_rollups(client, full=full)
+    except Exception:
+        release_lease(client, owner)
+        raise
+    release_lease(client, owner, started + 0.9 * interval)
+    return stats
+
+
+def _shift(watermark, seconds):
+    parsed = reconcile._parse_ts(watermark)
+    return (parsed - dt.timedelta(seconds=seconds)).isoformat() + "Z" if parsed else watermark
+
+
+def update_rollups(client, full=False, now=None):
+    """Recalcula as horas com linhas novas desde o watermark (ou tudo, com `full`) e fecha os dias encerrados"""
+    stats = {"hours": 0, "days": 0, "closed": 0, "started_at": _utcnow()}
+    checkpoint = {} if full else load_checkpoint(client)
+    watermarks = dict(checkpoint.get("watermarks") or {})
+    hours = set()
+
+    for name, (collection, time_field) in SOURCES.items():
+        watermark = watermarks.get(name)
+        query = client.collection(collection)
+        # Sem checkpoint (primeira execução): varre tudo, inclusive documentos sem received_at
+        if checkpoint and watermark:
+            query = query.where("received_at", ">", _shift(watermark, ROLLUP_OVERLAP_SECONDS))
+        for doc in query.select([time_field, "received_at"]).stream():
+            data = doc.to_dict()
+            hour = _hour(data.get(time_field))
+            if hour:
+                hours.add(hour)
+            received_at = data.get("received_at")
+            if received_at and (watermark is None or received_at > watermark):
+                watermark = received_at
+        watermarks[name] = watermark
+
+    days = {hour[:10] for hour in hours}
+    for day in sorted(days):
+        if is_finished(day, now):
+            # Dia encerrado (ou linha atrasada de um dia fechado): recálculo exato, sem horários
+            close_day(client, day)
+            stats["closed"] += 1
+            continue
+        for hour in sorted(h for h in hours if h.startswith(day)):
+            client.collection(FS_ROLLUPS_HOURLY_COLLECTION).document(hour).set(build_hour(client, hour))
+            stats["hours"] += 1
+        client.collection(FS_ROLLUPS_COLLECTION).document(day).set(compact_day(client, day))
+    stats["days"] = len(days)
+
+    # Dias que ficaram abertos e terminaram sem linhas novas
+    for doc in client.collection(FS_ROLLUPS_COLLECTION).where("closed", "==", False).stream():
+        if doc.id not in days and is_finished(doc.id, now):
+            close_day(client, doc.id)
+            stats["closed"] += 1
+
+    stats["finished_at"] = _utcnow()
+    save_checkpoint(client, watermarks, stats)
+    return stats
+
+
+def _add(target, source):
+    """Soma recursiva de contadores (dicts de inteiros)"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _add(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def _rate(part, total):
+    return round(part / total * 100, 2) if total else 0
+
+
+def summarize(client, since=None, until=None, campaign_id=None, audience_type=None, include_test=False):
+    """Agregados do dashboard no intervalo [since, until) de dias, com filtros de campanha e público"""
+    query = client.collection(FS_ROLLUPS_COLLECTION)
+    if since:
+        query = query.where("day", ">=", since[:10])
+    if until:
+        query = query.where("day", "<", until[:10])
+
+    responses = {"total": 0, "by_audience": {}, "by_day": {}, "questions": {}, "questions_by_audience": {},
+                 "devices": {}}
+    progressive = {"rows": 0, "complete_rows": 0, "sessions": 0, "completed_sessions": 0, "by_audience": {},
+                   "answered_by_question": {}, "abandoned_by_question": {}, "by_hour": {}, "campaigns": {},
+                   "devices": {}}
+    days = 0
+    for doc in query.stream():
+        data = doc.to_dict()
+        days += 1
+        for b in data.get("buckets") or []:
+            campaign = b.get("campaign_id")
+            if campaign_id and campaign != campaign_id:
+                continue
+            if not include_test and campaign and "test" in campaign.lower():
+                continue
+            audience = b.get("audience_type") or UNKNOWN_AUDIENCE
+            if audience_type and audience != audience_type:
+                continue
+
+            if b["responses"]:
+                responses["total"] += b["responses"]
+                _incr(responses["by_audience"], audience, b["responses"])
+                _incr(responses["by_day"].setdefault(data["day"], {}), audience, b["responses"])
+                _add(responses["questions"], b["questions"])
+                _add(responses["questions_by_audience"].setdefault(audience, {}), b["questions"])
+                _add(responses["devices"], b["devices"])
+
+            if b["progressive_rows"]:
+                progressive["rows"] += b["progressive_rows"]
+                progressive["complete_rows"] += b["progressive_complete_rows"]
+                progressive["sessions"] += b["sessions"]
+                progressive["completed_sessions"] += b["completed_sessions"]
+                _add(progressive["by_audience"].setdefault(audience, {}),
+                     {"rows": b["progressive_rows"], "sessions": b["sessions"],
+                      "completed_sessions": b["completed_sessions"], "answered_by_question": b["answered"],
+                      "abandoned_by_question": b["abandoned"]})
+                _add(progressive["answered_by_question"], b["answered"])
+                _add(progressive["abandoned_by_question"], b["abandoned"])
+                _add(progressive["by_hour"], b["hours"])
+                _add(progressive["campaigns"].setdefault(campaign or "unknown", {}), {
+                    "rows": b["progressive_rows"], "complete_rows": b["progressive_complete_rows"],
+                    "sessions": b["sessions"], "completed_sessions": b["completed_sessions"]})
+                _add(progressive["devices"], b["progressive_devices"])
+
+    progressive["abandoned_sessions"] = progressive["sessions"] - progressive["completed_sessions"]
+    for totals in [progressive, *progressive["by_audience"].values()]:
+        totals["completion_rate"] = _rate(totals["completed_sessions"], totals["sessions"])
+        totals["abandonment_rate_by_question"] = {
+            q: _rate(totals["abandoned_by_question"].get(q, 0), answered)
+            for q, answered in totals["answered_by_question"].items()
+        }
+    return {"days": days, "responses": responses, "progressive": progressive}
+
+
+def timeseries(client, granularity="day", since=None, until=None, campaign_id=None, audience_type=None,
+               question=None, include_test=False):
+    """Série temporal por dia ou por hora no intervalo [since, until), lida só dos documentos diários.
+
+    Os pontos por hora vêm da quebra `hours` de cada bucket; `question` (q1..q6)
+    limita a distribuição de respostas a uma pergunta.
+    """
+    query = client.collection(FS_ROLLUPS_COLLECTION)
+    if since:
+        query = query.where("day", ">=", since[:10])
+    if until:
+        # until com hora: o dia dele entra e o corte fica para o filtro por hora
+        query = query.where("day", "<=" if len(until) > 10 else "<", until[:10])
+
+    points = {}
+    for doc in query.stream():
+        data = doc.to_dict()
+        for b in data.get("buckets") or []:
+            campaign = b.get("campaign_id")
+            if campaign_id and campaign != campaign_id:
+                continue
+            if not include_test and campaign and "test" in campaign.lower():
+                continue
+            if audience_type and (b.get("audience_type") or UNKNOWN_AUDIENCE) != audience_type:
+                continue
+
+            if granularity == "hour":
+                for hour, counters in (b.get("hours") or {}).items():
+                    point = points.setdefault(f"{data['day']}T{hour}", {"responses": 0, "rows": 0, "complete": 0,
+                                                                       "answers": {}})
+                    answers = counters.get("answers") or {}
+                    if question:
+                        answers = {question: answers.get(question) or {}}
+                    _add(point, {**counters, "answers": answers})
+            else:
+                point = points.setdefault(data["day"], {"responses": 0, "rows": 0, "complete": 0, "sessions": 0,
+                                                        "completed_sessions": 0, "answers": {}})
+                answers = {}
+                for counters in (b.get("hours") or {}).values():
+                    _add(answers, counters.get("answers") or {})
+                if question:
+                    answers = {question: answers.get(question) or {}}
+                _add(point, {"responses": b["responses"], "rows": b["progressive_rows"],
+                             "complete": b["progressive_complete_rows"], "sessions": b["sessions"],
+                             "completed_sessions": b["completed_sessions"], "answers": answers})
+
+    series = [{"period": period, **point} for period, point in sorted(points.items())]
+    if granularity == "hour":
+        # Filtro fino do intervalo quando since/until trazem a hora
+        series = [p for p in series if (not since or p["period"] >= since[:13])
+                  and (not until or p["period"] < until[:13])]
+    return series
+
+
+if __name__ == "__main__":
+    from google.cloud import firestore
+
+    client = firestore.Client(project=PROJECT_ID) if PROJECT_ID else firestore.Client()
+    result = run_leased(client, full="--full" in sys.argv)
+    print(f"Rollups atualizados: {result}")
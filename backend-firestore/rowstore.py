@@ -0,0 +1,384 @@
+"""
+Armazenamento compacto de linhas em memória, em colunas (struct-of-arrays).
+
+Cada coluna é um `array` do tipo mais estreito que cabe o dado:
+- "code": strings repetidas (respostas como "muito_agil", campanha, público,
+  user agent) codificadas por dicionário; cada valor distinto existe uma vez
+- "str": strings únicas (IDs), numa lista
+- "small": inteiros pequenos (question_number) em int16
+- "bool": int8 (-1 = ausente)
+- "time": timestamps ISO como epoch em microssegundos (int64) mais a precisão
+  original (segundos, milissegundos, microssegundos), para devolver o mesmo texto
+
+Valores que não cabem no formato da coluna (legados, tipos inesperados) ficam
+num dicionário de exceções da coluna, sem perder fidelidade. Os campos são
+declarados por caminho ("answers.q1"); a leitura remonta o dict aninhado, sem as
+chaves ausentes. IDs sha1 em hex (os do _doc_id) são guardados em 20 bytes.
+
+Os códigos não são liberados nas remoções (valores distintos são poucos); uma
+recarga completa recomeça os dicionários. Ver bench_memory.py para o custo por
+linha.
+"""
+
+import re
+import sys
+import datetime as dt
+from array import array
+
+_EPOCH = dt.datetime(1970, 1, 1)
+_EPOCH_DAY = _EPOCH.toordinal()
+_ISO_UTC = re.compile(r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{3}|\d{6}))?Z$")
+
+# Marcadores das colunas numéricas
+_NONE = -1
+_OVERFLOW = -2
+_SMALL_NONE = -32768
+_SMALL_OVERFLOW = -32767
+
+
+class Dictionary:
+    """Codificação por dicionário: código 0 = None, cada valor distinto guardado uma vez"""
+
+    def __init__(self):
+        self._codes = {None: 0}
+        self._values = [None]
+
+    def encode(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            if isinstance(value, str):
+                value = sys.intern(value)
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def decode(self, code):
+        return self._values[code]
+
+    @classmethod
+    def from_values(cls, values):
+        dictionary = cls()
+        dictionary._values = [sys.intern(v) if isinstance(v, str) else v for v in values]
+        dictionary._codes = {value: code for code, value in enumerate(dictionary._values)}
+        return dictionary
+
+    def __len__(self):
+        return len(self._values) - 1
+
+
+class _Column:
+    __slots__ = ("path", "keys", "overflow")
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = path.split(".")
+        self.overflow = {}
+
+    def clear(self, slot):
+        self.overflow.pop(slot, None)
+        self.set(slot, None)
+
+    def arrays(self):
+        return [getattr(self, name) for name in self.ARRAYS]
+
+    def state(self):
+        return {"overflow": self.overflow}
+
+    def load(self, state, arrays):
+        self.overflow = state["overflow"]
+        for name, values in zip(self.ARRAYS, arrays):
+            setattr(self, name, values)
+
+
+class _CodeColumn(_Column):
+    __slots__ = ("values", "dictionary")
+    ARRAYS = ("values",)
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.values = array("I")
+        self.dictionary = Dictionary()
+
+    def append(self):
+        self.values.append(0)
+
+    def set(self, slot, value):
+        self.overflow.pop(slot, None)
+        try:
+            self.values[slot] = self.dictionary.encode(value)
+        except TypeError:
+            # Valor não hashable (lista, dict): guardado como veio
+            self.values[slot] = 0
+            self.overflow[slot] = value
+
+    def get(self, slot):
+        if slot in self.overflow:
+            return self.overflow[slot]
+        return self.dictionary.decode(self.values[slot])
+
+    def state(self):
+        return {**super().state(), "dictionary": self.dictionary._values}
+
+    def load(self, state, arrays):
+        super().load(state, arrays)
+        self.dictionary = Dictionary.from_values(state["dictionary"])
+
+
+class _StrColumn(_Column):
+    __slots__ = ("values",)
+    ARRAYS = ()
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.values = []
+
+    def append(self):
+        self.values.append(None)
+
+    def set(self, slot, value):
+        self.values[slot] = value
+
+    def get(self, slot):
+        return self.values[slot]
+
+    def state(self):
+        return {**super().state(), "values": self.values}
+
+    def load(self, state, arrays):
+        super().load(state, arrays)
+        self.values = state["values"]
+
+
+class _SmallColumn(_Column):
+    __slots__ = ("values",)
+    ARRAYS = ("values",)
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.values = array("h")
+
+    def append(self):
+        self.values.append(_SMALL_NONE)
+
+    def set(self, slot, value):
+        self.overflow.pop(slot, None)
+        if value is None:
+            self.values[slot] = _SMALL_NONE
+        elif type(value) is int and _SMALL_OVERFLOW < value < 32768:
+            self.values[slot] = value
+        else:
+            self.values[slot] = _SMALL_OVERFLOW
+            self.overflow[slot] = value
+
+    def get(self, slot):
+        value = self.values[slot]
+        if value == _SMALL_NONE:
+            return None
+        if value == _SMALL_OVERFLOW:
+            return self.overflow[slot]
+        return value
+
+
+class _BoolColumn(_Column):
+    __slots__ = ("values",)
+    ARRAYS = ("values",)
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.values = array("b")
+
+    def append(self):
+        self.values.append(_NONE)
+
+    def set(self, slot, value):
+        self.overflow.pop(slot, None)
+        if value is None:
+            self.values[slot] = _NONE
+        elif type(value) is bool:
+            self.values[slot] = int(value)
+        else:
+            self.values[slot] = _OVERFLOW
+            self.overflow[slot] = value
+
+    def get(self, slot):
+        value = self.values[slot]
+        if value == _NONE:
+            return None
+        if value == _OVERFLOW:
+            return self.overflow[slot]
+        return bool(value)
+
+
+class _TimeColumn(_Column):
+    __slots__ = ("micros", "precision")
+    ARRAYS = ("micros", "precision")
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.micros = array("q")
+        self.precision = array("b")
+
+    def append(self):
+        self.micros.append(0)
+        self.precision.append(_NONE)
+
+    def set(self, slot, value):
+        self.overflow.pop(slot, None)
+        match = _ISO_UTC.match(value) if isinstance(value, str) else None
+        if value is None:
+            self.precision[slot] = _NONE
+        elif match:
+            year, month, day, hour, minute, second, fraction = match.groups()
+            hour, minute, second = int(hour), int(minute), int(second)
+            try:
+                if hour > 23 or minute > 59 or second > 59:
+                    raise ValueError(value)
+                days = dt.date(int(year), int(month), int(day)).toordinal() - _EPOCH_DAY
+            except ValueError:
+                self.precision[slot] = _OVERFLOW
+                self.overflow[slot] = value
+                return
+            seconds = days * 86400 + hour * 3600 + minute * 60 + second
+            self.micros[slot] = seconds * 1_000_000 + (int(fraction.ljust(6, "0")) if fraction else 0)
+            self.precision[slot] = len(fraction) if fraction else 0
+        else:
+            # datetime, offset "+00:00" ou texto fora do padrão: guardado como veio
+            self.precision[slot] = _OVERFLOW
+            self.overflow[slot] = value
+
+    def get(self, slot):
+        precision = self.precision[slot]
+        if precision == _NONE:
+            return None
+        if precision == _OVERFLOW:
+            return self.overflow[slot]
+        seconds, micros = divmod(self.micros[slot], 1_000_000)
+        when = _EPOCH + dt.timedelta(seconds=seconds)
+        text = (f"{when.year:04d}-{when.month:02d}-{when.day:02d}"
+                f"T{when.hour:02d}:{when.minute:02d}:{when.second:02d}")
+        if precision:
+            text += "." + f"{micros:06d}"[:precision]
+        return text + "Z"
+
+
+_KINDS = {"code": _CodeColumn, "str": _StrColumn, "small": _SmallColumn, "bool": _BoolColumn,
+          "time": _TimeColumn}
+
+
+def _key(doc_id):
+    """IDs sha1 em hex (40 caracteres, os do _doc_id) viram 20 bytes; os demais ficam como vieram"""
+    if isinstance(doc_id, str) and len(doc_id) == 40:
+        try:
+            key = bytes.fromhex(doc_id)
+        except ValueError:
+            return doc_id
+        if key.hex() == doc_id:
+            return key
+    return doc_id
+
+
+def _doc_id(key):
+    return key.hex() if isinstance(key, bytes) else key
+
+
+def _get_path(data, keys):
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class ColumnStore:
+    """Linhas por ID de documento em colunas; interface de dict (get/[]/pop/items).
+
+    `columns` é uma lista de (caminho, tipo). Campos fora da lista não são
+    guardados. `keep_none` lista caminhos (ou prefixos, como "answers") cujas
+    chaves voltam mesmo com valor None.
+    """
+
+    def __init__(self, columns, keep_none=()):
+        self.columns = [_KINDS[kind](path) for path, kind in columns]
+        self.keep_none = tuple(keep_none)
+        self._slots = {}
+        self._ids = []
+        self._free = []
+        self._keep = [any(c.path == p or c.path.startswith(p + ".") for p in self.keep_none) for c in self.columns]
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, doc_id):
+        return _key(doc_id) in self._slots
+
+    def __setitem__(self, doc_id, record):
+        doc_id = _key(doc_id)
+        slot = self._slots.get(doc_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._ids)
+                self._ids.append(None)
+                for column in self.columns:
+                    column.append()
+            self._slots[doc_id] = slot
+            self._ids[slot] = doc_id
+        for column in self.columns:
+            column.set(slot, _get_path(record, column.keys))
+
+    def _decode(self, slot):
+        record = {}
+        for column, keep in zip(self.columns, self._keep):
+            value = column.get(slot)
+            if value is None and not keep:
+                continue
+            target = record
+            for key in column.keys[:-1]:
+                target = target.setdefault(key, {})
+            target[column.keys[-1]] = value
+        return record
+
+    def __getitem__(self, doc_id):
+        return self._decode(self._slots[_key(doc_id)])
+
+    def get(self, doc_id, default=None):
+        slot = self._slots.get(_key(doc_id))
+        return default if slot is None else self._decode(slot)
+
+    def pop(self, doc_id, default=None):
+        slot = self._slots.pop(_key(doc_id), None)
+        if slot is None:
+            return default
+        record = self._decode(slot)
+        for column in self.columns:
+            column.clear(slot)
+        self._ids[slot] = None
+        self._free.append(slot)
+        return record
+
+    def items(self):
+        for slot, key in enumerate(self._ids):
+            if key is not None:
+                yield _doc_id(key), self._decode(slot)
+
+    def values(self):
+        for _, record in self.items():
+            yield record
+
+    def dump(self):
+        """(estado, arrays) para o snapshot em disco; referências, não cópias (serializar em seguida)"""
+        state = {"ids": self._ids, "free": self._free, "columns": [column.state() for column in self.columns]}
+        return state, [values for column in self.columns for values in column.arrays()]
+
+    @classmethod
+    def restore(cls, columns, keep_none, state, arrays):
+        """ColumnStore a partir de `dump()`; `arrays` na mesma ordem"""
+        store = cls(columns, keep_none)
+        arrays = iter(arrays)
+        for column, column_state in zip(store.columns, state["columns"]):
+            column.load(column_state, [next(arrays) for _ in column.ARRAYS])
+        store._ids = state["ids"]
+        store._free = state["free"]
+        store._slots = {key: slot for slot, key in enumerate(store._ids) if key is not None}
+        return store
@@ -0,0 +1,117 @@
+"""
+Esquema normalizado e versionado das respostas completas (coleção `responses`).
+
+Os dois formatos legados convivem até a migração (migrate.py):
+- v1 (backend-firestore): q1..q6 no topo, `ts` ISO em texto, `ua`/`referer`/`origin`
+- v2 (backend-firestore-v2): `answers` aninhado, `timestamp` datetime, `audience_type`
+  e `metadata`
+
+Toda escrita nova usa `response_record`; as leituras passam por `normalize`, que
+aceita qualquer um dos três formatos.
+"""
+
+import datetime as dt
+
+SCHEMA_VERSION = 1
+QUESTIONS = tuple(f"q{i}" for i in range(1, 7))
+AUDIENCE_TYPES = ("small_business", "general_public")
+METADATA_FIELDS = ("user_agent", "referer", "origin", "page_url")
+DIMENSION_FIELDS = ("session_id", "campaign_id", "audience_type", "line_item_id", "creative_id")
+
+
+def iso(value):
+    """Timestamp em texto ISO com 'Z' (datetime do v2 ou texto do v1)"""
+    if isinstance(value, dt.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        return value.isoformat() + "Z"
+    return value
+
+
+def device_type(user_agent):
+    """Mesma classificação usada pelo dashboard"""
+    user_agent = user_agent or ""
+    if "Mobile" in user_agent:
+        return "Mobile"
+    if "Tablet" in user_agent:
+        return "Tablet"
+    return "Desktop"
+
+
+def answered_mask(answers):
+    """Bitmask das perguntas respondidas (bit 0 = q1)"""
+    mask = 0
+    for key, value in (answers or {}).items():
+        if value and key[1:].isdigit() and 1 <= int(key[1:]) <= len(QUESTIONS):
+            mask |= 1 << (int(key[1:]) - 1)
+    return mask
+
+
+def response_record(doc_id, data, source, ts=None, metadata=None, received_at=None):
+    """Documento normalizado de uma resposta completa.
+
+    `data` traz as respostas planas (q1..q6) ou em `answers`; `metadata` completa
+    os dados da requisição (user_agent, referer, origin) que não vieram no corpo.
+    `received_at` (hora da gravação) é o watermark dos jobs incrementais.
+    """
+    answers = data.get("answers") if isinstance(data.get("answers"), dict) else data
+    meta = {k: data.get(k) for k in METADATA_FIELDS}
+    for key, value in (metadata or {}).items():
+        meta[key] = meta.get(key) or value
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "id": doc_id,
+        "ts": iso(ts) or dt.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        **{k: data.get(k) for k in DIMENSION_FIELDS},
+        "answers": {q: answers.get(q) for q in QUESTIONS},
+        "is_complete": data.get("is_complete", True),
+        "completion_timestamp": iso(data.get("completion_timestamp")),
+        "source": source,
+        "metadata": meta,
+        "extra": data.get("extra"),
+        "received_at": received_at or dt.datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def legacy_version(data):
+    """'v1', 'v2' ou None (já normalizado)"""
+    if data.get("schema_version"):
+        return None
+    return "v2" if isinstance(data.get("answers"), dict) else "v1"
+
+
+def normalize(doc_id, data):
+    """Converte um documento de qualquer versão para o esquema normalizado"""
+    version = legacy_version(data)
+    if version is None:
+        return data
+    if version == "v2":
+        record = response_record(data.get("id") or doc_id, {**data, **(data.get("metadata") or {})},
+                                 source="v2", ts=data.get("timestamp"), received_at=data.get("received_at"))
+    else:
+        record = response_record(doc_id, data, source="v1", ts=data.get("ts"),
+                                 metadata={"user_agent": data.get("ua")}, received_at=data.get("received_at"))
+    if data.get("reconciled"):
+        record["reconciled"] = True
+    return record
+
+
+def to_api(record):
+    """Formato de saída do GET /responses"""
+    meta = record.get("metadata") or {}
+    return {
+        "id": record.get("id"),
+        "schema_version": record.get("schema_version"),
+        "timestamp": record.get("ts"),
+        "session_id": record.get("session_id"),
+        "campaign_id": record.get("campaign_id"),
+        "audience_type": record.get("audience_type"),
+        "answers": record.get("answers") or {},
+        "metadata": {
+            "user_agent": meta.get("user_agent", "")[:100] if meta.get("user_agent") else None,
+            "referer": meta.get("referer"),
+            "origin": meta.get("origin"),
+            "page_url": meta.get("page_url"),
+            "is_complete": record.get("is_complete", True),
+        },
+    }
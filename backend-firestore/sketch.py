@@ -0,0 +1,96 @@
+"""
+Sketch de quantis mesclável para tempos (dwell) em segundos.
+
+Histograma com buckets logarítmicos (como o DDSketch): o valor x cai no bucket
+ceil(log(x) / log(gamma)), com gamma = (1 + a) / (1 - a). Qualquer quantil sai
+com erro relativo de no máximo `a` (RELATIVE_ACCURACY, 2%). O sketch é só um
+conjunto de contadores por bucket, então mesclar é somar contadores. Por isso
+as instâncias gravam no Firestore com Increment e a soma de vários documentos
+(dias, campanhas) é exata.
+
+O tamanho não depende do número de valores: de 10 ms a 1 h são ~320 buckets.
+"""
+
+import math
+
+RELATIVE_ACCURACY = 0.02
+# Valores até MIN_VALUE (segundos) contam no bucket zero
+MIN_VALUE = 0.01
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+def bucket(value):
+    """Índice do bucket de um valor acima de MIN_VALUE"""
+    return math.ceil(math.log(value) / _LOG_GAMMA)
+
+
+def bucket_value(index):
+    """Representante do bucket (erro relativo <= RELATIVE_ACCURACY para todo valor dele)"""
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+class Sketch:
+    """Contadores por bucket; `add`, `merge` e `quantile`"""
+
+    __slots__ = ("buckets", "zero", "count", "total")
+
+    def __init__(self):
+        self.buckets = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value, count=1):
+        if value <= MIN_VALUE:
+            self.zero += count
+        else:
+            index = bucket(value)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other):
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def quantile(self, q):
+        """Valor no quantil q (0..1); None sem valores"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return bucket_value(index)
+        return bucket_value(max(self.buckets))
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        """{"count", "mean", "p50", "p90", "p99"} em segundos, arredondados"""
+        result = {"count": self.count, "mean": round(self.total / self.count, 3) if self.count else None}
+        for q in quantiles:
+            value = self.quantile(q)
+            result[f"p{round(q * 100)}"] = round(value, 3) if value is not None else None
+        return result
+
+    def to_dict(self):
+        """Formato do documento no Firestore (chaves de bucket em texto)"""
+        return {"buckets": {str(i): n for i, n in self.buckets.items()}, "zero": self.zero,
+                "count": self.count, "total": self.total}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.buckets = {int(i): n for i, n in (data.get("buckets") or {}).items() if n}
+        sketch.zero = data.get("zero") or 0
+        sketch.count = data.get("count") or 0
+        sketch.total = data.get("total") or 0.0
+        return sketch
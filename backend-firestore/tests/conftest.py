@@ -0,0 +1,81 @@
+"""
+Fixtures da suíte de contrato: os apps Flask rodam no processo, com o
+Firestore trocado pelo memstore (nada é gravado em produção).
+"""
+
+import os
+import sys
+import types
+import importlib.util
+from collections import OrderedDict
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import memstore  # noqa: E402
+import app as app_v1  # noqa: E402
+import app_progressive  # noqa: E402
+
+
+def _load_v2():
+    path = os.path.join(os.path.dirname(BACKEND_DIR), "backend-firestore-v2", "app.py")
+    spec = importlib.util.spec_from_file_location("app_v2", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+app_v2 = _load_v2()
+
+
+def _fake_firestore(store):
+    return types.SimpleNamespace(Client=lambda project=None: store, Query=memstore.Query,
+                                 Increment=memstore.Increment)
+
+
+@pytest.fixture
+def store():
+    return memstore.Client(project="test")
+
+
+@pytest.fixture
+def client(store, monkeypatch):
+    """Cliente de teste do app_progressive com estado por instância zerado"""
+    monkeypatch.setattr(app_progressive, "firestore", _fake_firestore(store), raising=False)
+    monkeypatch.setattr(app_progressive, "FS_AVAILABLE", True)
+    monkeypatch.setattr(app_progressive, "_fs_client", None)
+    monkeypatch.setattr(app_progressive, "ROLLUP_SCHEDULER_SECONDS", 0)
+    monkeypatch.setattr(app_progressive, "EVENT_FLUSH_SECONDS", 0)
+    monkeypatch.setattr(app_progressive, "_event_counters", app_progressive._EventCounters())
+    monkeypatch.setattr(app_progressive, "_dwell_sketches", app_progressive._DwellSketches())
+    monkeypatch.setattr(app_progressive, "_session_clock", OrderedDict())
+    monkeypatch.setattr(app_progressive, "_recent_keys",
+                        app_progressive._RecentKeys(app_progressive.IDEMPOTENCY_CACHE_SIZE,
+                                                    app_progressive.IDEMPOTENCY_TTL_SECONDS))
+    app_progressive._session_meta.clear()
+    app_progressive.app.config["TESTING"] = True
+    return app_progressive.app.test_client()
+
+
+@pytest.fixture
+def client_v1(store, monkeypatch):
+    monkeypatch.setattr(app_v1, "firestore", _fake_firestore(store), raising=False)
+    monkeypatch.setattr(app_v1, "FS_AVAILABLE", True)
+    app_v1.app.config["TESTING"] = True
+    return app_v1.app.test_client()
+
+
+@pytest.fixture
+def client_v2(store, monkeypatch):
+    monkeypatch.setattr(app_v2, "firestore", _fake_firestore(store), raising=False)
+    monkeypatch.setattr(app_v2, "FS_AVAILABLE", True)
+    monkeypatch.setattr(app_v2, "PROJECT_ID", "test")
+    app_v2.app.config["TESTING"] = True
+    return app_v2.app.test_client()
+
+
+@pytest.fixture
+def answers():
+    return {f"q{i}": f"resposta_{i}" for i in range(1, 7)}
@@ -0,0 +1,416 @@
+"""
+Contrato da API de coleta (progressiva, completa e v2) contra o memstore.
+
+    python -m pytest backend-firestore/tests -q
+"""
+
+import json
+import time
+
+import pytest
+
+import schema
+import memstore
+import app_progressive
+
+
+def _docs(store, collection):
+    return {doc.id: doc.to_dict() for doc in store.collection(collection).stream()}
+
+
+def _progressive(session_id, question_number, answer="sim", **extra):
+    return {"session_id": session_id, "question_number": question_number, "answer": answer,
+            "campaign_id": "camp_a", "audience_type": "small_business", **extra}
+
+
+def _wait_job(client, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").get_json()["job"]
+        if job["status"] in ("done", "error"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} não terminou")
+
+
+# --- /collect progressivo ---------------------------------------------------
+
+@pytest.mark.parametrize("question_number", range(1, 7))
+def test_progressive_answer_is_stored(client, store, question_number):
+    r = client.post("/collect", json=_progressive("s1", question_number))
+    body = r.get_json()
+    assert r.status_code == 200
+    assert body["ok"] and body["type"] == "progressive" and body["stored"] == "firestore"
+    row = _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)[body["id"]]
+    assert row["question_number"] == question_number
+    assert row["answer"] == "sim"
+    assert row["received_at"]
+
+
+@pytest.mark.parametrize("missing", ["session_id", "answer"])
+def test_progressive_missing_fields(client, missing):
+    payload = _progressive("s1", 1)
+    del payload[missing]
+    r = client.post("/collect", json=payload)
+    assert r.status_code == 400
+    assert r.get_json() == {"ok": False, "error": "missing_fields", "missing": [missing]}
+
+
+@pytest.mark.parametrize("question_number", [7, -1, "1", 2.5])
+def test_progressive_invalid_question_number(client, question_number):
+    r = client.post("/collect", json=_progressive("s1", question_number))
+    assert r.status_code == 400
+    assert r.get_json()["error"] == "invalid_question_number"
+
+
+def test_progressive_duplicate_is_not_rewritten(client, store):
+    first = client.post("/collect", json=_progressive("s1", 1)).get_json()
+    second = client.post("/collect", json=_progressive("s1", 1)).get_json()
+    assert second["stored"] == "duplicate" and second["id"] == first["id"]
+
+    changed = client.post("/collect", json=_progressive("s1", 1, answer="nao")).get_json()
+    assert changed["stored"] == "firestore"
+    assert _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)[first["id"]]["answer"] == "nao"
+
+
+def test_progressive_last_answer_writes_complete_record(client, store, answers):
+    payload = _progressive("s1", 6, is_complete=True, all_answers=answers,
+                           completion_timestamp="2025-01-01T00:00:00Z")
+    body = client.post("/collect", json=payload).get_json()
+    assert body["stored"] == "firestore_both"
+
+    complete = _docs(store, app_progressive.FS_COLLECTION)[app_progressive._doc_id("s1", "complete")]
+    assert complete["is_complete"] is True
+    assert complete["audience_type"] == "small_business"
+    assert complete["schema_version"] == schema.SCHEMA_VERSION
+    assert complete["answers"] == answers
+
+
+@pytest.mark.parametrize("content_type", ["text/plain;charset=UTF-8", "application/json"])
+def test_progressive_accepts_simple_requests(client, content_type):
+    r = client.post("/collect", data=json.dumps(_progressive("s1", 1)), content_type=content_type)
+    assert r.status_code == 200 and r.get_json()["ok"]
+
+
+def test_progressive_session_token_protocol(client, store):
+    first = client.post("/collect", json=_progressive("s1", 1, handshake=True, line_item_id="li")).get_json()
+    token = first["session_token"]
+    assert token
+
+    r = client.post("/collect", json={"session_token": token, "question_number": 2, "answer": "x"})
+    assert r.status_code == 200
+    row = _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)[r.get_json()["id"]]
+    assert row["session_id"] == "s1" and row["campaign_id"] == "camp_a"
+    assert "line_item_id" not in row
+    assert _docs(store, app_progressive.FS_SESSION_META_COLLECTION)[token]["line_item_id"] == "li"
+
+
+def test_progressive_handshake_meta_commits_with_row(client, store, monkeypatch):
+    commit = memstore.WriteBatch.commit
+    failures = [RuntimeError("deadline")]
+
+    def flaky_commit(self):
+        if failures:
+            raise failures.pop()
+        commit(self)
+
+    monkeypatch.setattr(memstore.WriteBatch, "commit", flaky_commit)
+    assert client.post("/collect", json=_progressive("s1", 1, handshake=True)).status_code == 500
+    assert _docs(store, app_progressive.FS_SESSION_META_COLLECTION) == {}
+    assert not app_progressive._session_meta
+
+    token = client.post("/collect", json=_progressive("s1", 1, handshake=True)).get_json()["session_token"]
+    assert _docs(store, app_progressive.FS_SESSION_META_COLLECTION)[token]["session_id"] == "s1"
+
+
+def test_progressive_stores_audience_type(client, store):
+    body = client.post("/collect", json=_progressive("s1", 1, audience_type="general_public")).get_json()
+    assert _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)[body["id"]]["audience_type"] == "general_public"
+
+    r = client.post("/collect", json=_progressive("s1", 2, audience_type="outro"))
+    assert r.status_code == 400
+    assert r.get_json()["error"] == "invalid_audience_type"
+
+
+def test_progressive_unknown_session_token(client):
+    r = client.post("/collect", json={"session_token": "nope", "question_number": 2, "answer": "x"})
+    assert r.status_code == 400
+    assert r.get_json()["error"] == "invalid_session_token"
+
+
+# --- /replay -----------------------------------------------------------------
+
+def test_replay_batch(client, store):
+    items = [_progressive("s2", 1), _progressive("s2", 2), _progressive("s2", 2, answer="ultima"),
+             {"session_id": "s2"}, "lixo"]
+    body = client.post("/replay", json={"answers": items}).get_json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 2
+    rows = _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)
+    assert rows[app_progressive._doc_id("s2", 2)]["answer"] == "ultima"
+    assert all(row["replayed"] for row in rows.values())
+
+    again = client.post("/replay", json={"answers": items[:2]}).get_json()
+    assert again["duplicates"] == 1 and again["accepted"] == 1
+
+
+def test_replay_unknown_token_with_session_id(client, store):
+    body = client.post("/replay", json={"answers": [_progressive("s3", 1, session_token="perdido")]}).get_json()
+    assert body["accepted"] == 1
+    row = _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)[app_progressive._doc_id("s3", 1)]
+    assert "session_token" not in row and row["session_id"] == "s3"
+
+
+@pytest.mark.parametrize("payload", [{}, {"answers": "x"}, None])
+def test_replay_invalid_payload(client, payload):
+    assert client.post("/replay", json=payload).status_code == 400
+
+
+# --- /collect completo -------------------------------------------------------
+
+def test_complete_is_stored(client, store, answers):
+    body = client.post("/collect", json={**answers, "session_id": "s3", "campaign_id": "camp_b"}).get_json()
+    assert body == {"ok": True, "stored": "firestore", "id": app_progressive._doc_id("s3", "complete"),
+                    "type": "complete", "audience_type": None}
+    row = _docs(store, app_progressive.FS_COLLECTION)[body["id"]]
+    assert row["campaign_id"] == "camp_b" and row["answers"]["q6"] == "resposta_6"
+    assert row["source"] == "collect"
+
+
+@pytest.mark.parametrize("payload", [
+    lambda answers: {**answers, "audience_type": "general_public"},
+    lambda answers: {"answers": answers, "audience_type": "general_public"},
+])
+def test_complete_accepts_v2_payloads(client, store, answers, payload):
+    body = client.post("/collect", json=payload(answers)).get_json()
+    assert body["ok"] and body["audience_type"] == "general_public"
+    row = _docs(store, app_progressive.FS_COLLECTION)[body["id"]]
+    assert row["answers"] == answers and row["audience_type"] == "general_public"
+
+
+def test_complete_invalid_audience(client, answers):
+    r = client.post("/collect", json={**answers, "audience_type": "outro"})
+    assert r.status_code == 400
+    assert r.get_json()["error"] == "invalid_audience_type"
+
+
+@pytest.mark.parametrize("missing", ["q1", "q6"])
+def test_complete_missing_answers(client, answers, missing):
+    del answers[missing]
+    r = client.post("/collect", json=answers)
+    assert r.status_code == 400
+    assert r.get_json()["missing"] == [missing]
+
+
+def test_complete_idempotency_key(client, store, answers):
+    headers = {"Idempotency-Key": "abc"}
+    first = client.post("/collect", json=answers, headers=headers).get_json()
+    second = client.post("/collect", json=answers, headers=headers).get_json()
+    assert second["stored"] == "duplicate" and second["id"] == first["id"]
+    assert len(_docs(store, app_progressive.FS_COLLECTION)) == 1
+
+
+def test_cors_preflight(client):
+    r = client.open("/collect", method="OPTIONS", headers={"Origin": "https://ads.example"})
+    assert r.status_code == 204
+    assert r.headers["Access-Control-Allow-Origin"] == "https://ads.example"
+    assert "Idempotency-Key" in r.headers["Access-Control-Allow-Headers"]
+
+
+# --- leitura -----------------------------------------------------------------
+
+@pytest.fixture
+def populated(client, answers):
+    for i, (session_id, campaign) in enumerate([("test_a", "camp_a"), ("test_b", "camp_b"), ("real_c", "camp_a")]):
+        client.post("/collect", json={**answers, "session_id": session_id, "campaign_id": campaign})
+        for q in (1, 2):
+            client.post("/collect", json={**_progressive(session_id, q), "campaign_id": campaign,
+                                          "timestamp": f"2025-01-0{i + 1}T00:00:0{q}Z"})
+    return client
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", 3),
+    ("?campaign_id=camp_a", 2),
+    ("?session_prefix=test_", 2),
+    ("?campaign_id=camp_a&session_prefix=test_", 1),
+])
+def test_list_responses_filters(populated, query, expected):
+    body = populated.get(f"/responses{query}").get_json()
+    assert body["count"] == expected
+    count = populated.get(f"/responses{query}{'&' if query else '?'}count_only=1").get_json()
+    assert count["count"] == expected
+
+
+def test_list_progressive_responses_order_and_limit(populated):
+    body = populated.get("/progressive-responses?limit=3").get_json()
+    timestamps = [r["timestamp"] for r in body["responses"]]
+    assert body["count"] == 3
+    assert timestamps == sorted(timestamps, reverse=True)
+    since = populated.get("/progressive-responses?since=2025-01-02").get_json()
+    assert {r["session_id"] for r in since["responses"]} == {"test_b", "real_c"}
+
+
+def _update_rollups(client):
+    job = _wait_job(client, client.post("/rollups").get_json()["job_id"])
+    assert job["status"] == "done", job["error"]
+
+
+def test_analytics(populated, answers):
+    populated.post("/collect", json=_progressive("real_c", 6, is_complete=True, all_answers=answers,
+                                                 timestamp="2025-01-03T00:00:06Z"))
+    _update_rollups(populated)
+    analytics = populated.get("/analytics").get_json()["analytics"]
+    assert analytics["total_sessions"] == 3
+    assert analytics["completed_sessions"] == 1
+    assert analytics["drop_off_by_question"]["1"]["answered"] == 3
+    assert analytics["question_statistics"]["1"] == {"total": 3, "answers": {"sim": 3}}
+    assert analytics["by_audience"]["small_business"]["completed_sessions"] == 1
+
+
+def test_analytics_audience_filter(populated):
+    populated.post("/collect", json=_progressive("gp", 1, audience_type="general_public",
+                                                 timestamp="2025-01-04T00:00:00Z"))
+    _update_rollups(populated)
+    analytics = populated.get("/analytics?audience_type=general_public").get_json()["analytics"]
+    assert analytics["total_sessions"] == 1
+    assert list(analytics["by_audience"]) == ["general_public"]
+    listed = populated.get("/progressive-responses?audience_type=general_public").get_json()
+    assert [r["session_id"] for r in listed["responses"]] == ["gp"]
+
+
+def test_analytics_includes_test_campaigns_by_default(client):
+    for session_id, campaign in (("s1", "camp_a"), ("s2", "camp_test")):
+        client.post("/collect", json=_progressive(session_id, 1, campaign_id=campaign,
+                                                  timestamp="2025-01-05T00:00:00Z"))
+    _update_rollups(client)
+    assert client.get("/analytics").get_json()["analytics"]["total_sessions"] == 2
+    assert client.get("/analytics?include_test=0").get_json()["analytics"]["total_sessions"] == 1
+
+
+def test_cleanup_test_sessions(populated, store):
+    populated.post("/collect", json=_progressive("test_d", 1, handshake=True))
+    for session_id in ("test_a", "real_c"):
+        populated.post("/event", json={"event": "impression", "creative_id": "cr_1", "session_id": session_id})
+    app_progressive.flush_counters()
+    _update_rollups(populated)
+    summary = populated.get("/dashboard-summary?include_test=1").get_json()
+    assert summary["progressive"]["sessions"] == 4 and summary["responses"]["total"] == 3
+
+    dry = populated.post("/cleanup-test-sessions?dry_run=1").get_json()
+    assert dry["to_delete"] == {"responses": 2, "progressive": 5, "sessions": 3, "session_meta": 1,
+                                "dwell": 2, "events": 1, "total": 14}
+
+    r = populated.post("/cleanup-test-sessions")
+    assert r.status_code == 202
+    job = _wait_job(populated, r.get_json()["job_id"])
+    assert job["status"] == "done" and job["result"]["total"] == 14
+    remaining = _docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION).values()
+    assert {row["session_id"] for row in remaining} == {"real_c"}
+    assert populated.get("/dwell-times").get_json()["questions"]["q2"]["count"] == 1
+    assert populated.get("/events").get_json()["totals"]["impression"] == 1
+    # Dias fechados (2025-01-0x) e o dia aberto recalculados sem as sessões de teste
+    assert {"2025-01-01", "2025-01-02"} <= set(job["result"]["rollup_days"])
+    summary = populated.get("/dashboard-summary?include_test=1").get_json()
+    assert summary["progressive"]["sessions"] == 1 and summary["responses"]["total"] == 1
+
+
+def test_reconcile_sessions(populated, store):
+    r = populated.post("/reconcile-sessions?full=1")
+    job = _wait_job(populated, r.get_json()["job_id"])
+    assert job["status"] == "done", job["error"]
+    sessions = {s["session_id"]: s for s in _docs(store, "sessions").values()}
+    assert sessions["real_c"]["questions_answered"] == [1, 2]
+    assert sessions["real_c"]["is_complete"] is False
+
+
+def test_reconcile_keeps_ingested_metadata(client, store):
+    for q in range(1, 6):
+        client.post("/collect", json=_progressive("s4", q), headers={"User-Agent": "UA/1"})
+    client.post("/collect", json=_progressive("s4", 6, is_complete=True, all_answers={"q1": "sim"}),
+                headers={"User-Agent": "UA/1"})
+    job = _wait_job(client, client.post("/reconcile-sessions?full=1").get_json()["job_id"])
+    assert job["status"] == "done", job["error"]
+    complete = _docs(store, app_progressive.FS_COLLECTION)[app_progressive._doc_id("s4", "complete")]
+    assert complete["reconciled"] and complete["schema_version"] == schema.SCHEMA_VERSION
+    assert complete["answers"] == {f"q{i}": "sim" for i in range(1, 7)}
+    assert complete["metadata"]["user_agent"] == "UA/1"
+
+
+def test_reconcile_rereads_late_rows_before_watermark(client, store):
+    import reconcile
+    client.post("/collect", json=_progressive("s5", 1))
+    stats = reconcile.reconcile_sessions(store, app_progressive._doc_id)
+    # Linha de outra instância, com relógio atrasado, gravada depois do watermark
+    late = (reconcile._parse_ts(stats["watermark"]) - reconcile.dt.timedelta(seconds=5)).isoformat() + "Z"
+    store.collection(app_progressive.FS_PROGRESSIVE_COLLECTION).document("tardia").set(
+        {"session_id": "s6", "question_number": 1, "answer": "sim", "received_at": late,
+         "timestamp": late, "is_complete": False})
+    assert reconcile.reconcile_sessions(store, app_progressive._doc_id)["watermark"] == stats["watermark"]
+    sessions = {s["session_id"]: s for s in _docs(store, "sessions").values()}
+    assert sessions["s6"]["questions_answered"] == [1]
+
+
+def test_reconcile_keeps_updated_at_of_unchanged_sessions(client, store, monkeypatch):
+    import reconcile
+    client.post("/collect", json=_progressive("s7", 1))
+    reconcile.reconcile_sessions(store, app_progressive._doc_id)
+    first = _docs(store, "sessions")[app_progressive._doc_id("s7", "session")]["updated_at"]
+
+    monkeypatch.setattr(reconcile, "_utcnow", lambda: "2099-01-01T00:00:00Z")
+    # Mesma linha relida na janela de sobreposição: nada muda
+    reconcile.reconcile_sessions(store, app_progressive._doc_id)
+    assert _docs(store, "sessions")[app_progressive._doc_id("s7", "session")]["updated_at"] == first
+    delta = client.get(f"/sessions?since={first}").get_json()
+    assert delta["sessions"] == []
+
+    client.post("/collect", json=_progressive("s7", 2))
+    reconcile.reconcile_sessions(store, app_progressive._doc_id)
+    assert _docs(store, "sessions")[app_progressive._doc_id("s7", "session")]["updated_at"] == "2099-01-01T00:00:00Z"
+
+
+def test_list_responses_reads_legacy_documents(client, store, answers):
+    store.collection(app_progressive.FS_COLLECTION).document("legado").set(
+        {"ts": "2024-01-01T00:00:00Z", "session_id": "antiga", "ua": "UA/0", **answers})
+    row = client.get("/responses").get_json()["responses"][0]
+    assert row["answers"] == answers
+    assert row["metadata"]["user_agent"] == "UA/0"
+    assert row["schema_version"] == schema.SCHEMA_VERSION
+
+
+# --- app v1 (app.py) -----------------------------------------------------------
+
+def test_v1_retries_upsert_same_document(client_v1, store, answers):
+    first = client_v1.post("/collect", json=_progressive("s1", 2)).get_json()
+    assert client_v1.post("/collect", json=_progressive("s1", 2)).get_json()["id"] == first["id"]
+    assert len(_docs(store, app_progressive.FS_PROGRESSIVE_COLLECTION)) == 1
+
+    complete = {**answers, "session_id": "s1"}
+    assert (client_v1.post("/collect", json=complete).get_json()["id"]
+            == client_v1.post("/collect", json=complete).get_json()["id"])
+    assert len(_docs(store, app_progressive.FS_COLLECTION)) == 1
+
+
+# --- backend v2 ----------------------------------------------------------------
+
+@pytest.mark.parametrize("audience_type", ["small_business", "general_public"])
+def test_v2_collect(client_v2, store, answers, audience_type):
+    body = client_v2.post("/collect", json={**answers, "audience_type": audience_type}).get_json()
+    assert body["ok"] and body["audience_type"] == audience_type
+    listed = client_v2.get("/responses").get_json()
+    assert listed["count"] == 1
+    assert listed["responses"][0]["answers"] == answers
+    assert listed["responses"][0]["timestamp"].startswith("20")
+
+
+@pytest.mark.parametrize("audience_type", [None, "", "outro"])
+def test_v2_invalid_audience(client_v2, answers, audience_type):
+    r = client_v2.post("/collect", json={**answers, "audience_type": audience_type})
+    assert r.status_code == 400
+    assert r.get_json()["error"] == "invalid_audience_type"
+
+
+def test_v2_missing_answers(client_v2, answers):
+    del answers["q3"]
+    r = client_v2.post("/collect", json={**answers, "audience_type": "small_business"})
+    assert r.status_code == 400 and r.get_json()["missing"] == ["q3"]
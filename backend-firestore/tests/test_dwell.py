@@ -0,0 +1,128 @@
+"""Tempo por pergunta e até concluir: sketches de quantis mescláveis."""
+
+import random
+
+import pytest
+
+import memstore
+import sketch
+import app_progressive
+from test_contract import _progressive, _docs
+
+
+def _answer(client, session_id, question, second, **extra):
+    ts = f"2026-03-02T10:{second // 60:02d}:{second % 60:02d}Z"
+    r = client.post("/collect", json=_progressive(session_id, question, timestamp=ts, **extra))
+    assert r.status_code == 200
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(2, 1) for _ in range(20000)]
+    s = sketch.Sketch()
+    for value in values:
+        s.add(value)
+    values.sort()
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(s.quantile(q) - exact) <= sketch.RELATIVE_ACCURACY * exact + 1e-9
+    assert s.summary()["count"] == 20000
+    assert sketch.Sketch().summary() == {"count": 0, "mean": None, "p50": None, "p90": None, "p99": None}
+
+
+def test_merge_equals_single_sketch_and_round_trips():
+    rng = random.Random(3)
+    values = [rng.uniform(0, 120) for _ in range(3000)]
+    whole, left, right = sketch.Sketch(), sketch.Sketch(), sketch.Sketch()
+    for i, value in enumerate(values):
+        whole.add(value)
+        (left if i % 2 else right).add(value)
+    merged = sketch.Sketch.from_dict(left.to_dict()).merge(sketch.Sketch.from_dict(right.to_dict()))
+    assert merged.buckets == whole.buckets and merged.count == whole.count
+    assert merged.summary() == whole.summary()
+
+
+def test_dwell_between_answers_and_until_completion(client, store):
+    _answer(client, "s1", 1, 0)
+    _answer(client, "s1", 2, 10)
+    _answer(client, "s1", 2, 50)  # reenvio da mesma pergunta não conta de novo
+    _answer(client, "s1", 3, 40, is_complete=True, completion_timestamp="2026-03-02T10:01:00Z")
+    pending = app_progressive._dwell_sketches.drain()
+    key = ("camp_a", "small_business")
+    assert pending[(*key, "q2", "2026-03-02", None)].total == 10
+    assert pending[(*key, "q3", "2026-03-02", None)].total == 30
+    assert pending[(*key, "complete", "2026-03-02", None)].total == 60
+    assert (*key, "q1", "2026-03-02", None) not in pending
+
+
+def test_dwell_uses_session_index_after_cache_miss(client, store):
+    _answer(client, "s2", 1, 0)
+    app_progressive._session_clock.clear()  # outra instância / worker reiniciado
+    _answer(client, "s2", 2, 25)
+    pending = app_progressive._dwell_sketches.drain()
+    assert pending[("camp_a", "small_business", "q2", "2026-03-02", None)].total == 25
+
+
+def test_flush_merges_instances_and_serves_quantiles(client, store):
+    for i, session_id in enumerate(("a", "b", "c", "d")):
+        _answer(client, session_id, 1, 0)
+        _answer(client, session_id, 2, 10 * (i + 1))
+        if i == 1:
+            # metade das sessões gravada por "outra instância" antes das demais
+            assert app_progressive.flush_counters() == {"events": 0, "dwell": 1}
+    app_progressive.flush_counters()
+
+    docs = _docs(store, app_progressive.FS_DWELL_COLLECTION)
+    assert len(docs) == 1 and next(iter(docs.values()))["count"] == 4
+
+    body = client.get("/dwell-times?campaign_id=camp_a&since=2026-03-01").get_json()
+    q2 = body["questions"]["q2"]
+    assert q2["count"] == 4 and q2["mean"] == 25
+    assert abs(q2["p50"] - 20) <= 20 * sketch.RELATIVE_ACCURACY
+    assert abs(q2["p90"] - 30) <= 30 * sketch.RELATIVE_ACCURACY
+    assert body["complete"]["count"] == 0
+    assert body["by_audience"]["small_business"]["questions"]["q2"] == q2
+    assert client.get("/dwell-times?until=2026-03-01").get_json()["questions"] == {}
+
+
+def test_failed_flush_keeps_sketches(client, monkeypatch):
+    _answer(client, "s3", 1, 0)
+    _answer(client, "s3", 2, 5)
+    monkeypatch.setattr(app_progressive, "_client", lambda: (_ for _ in ()).throw(RuntimeError("offline")))
+    with pytest.raises(RuntimeError):
+        app_progressive.flush_dwell()
+    assert app_progressive._dwell_sketches.drain()[("camp_a", "small_business", "q2", "2026-03-02", None)].count == 1
+
+
+def test_failed_commit_records_no_dwell(client, monkeypatch):
+    _answer(client, "s4", 1, 0)
+    commit = memstore.WriteBatch.commit
+    failures = [RuntimeError("deadline")]
+
+    def flaky_commit(self):
+        if failures:
+            raise failures.pop()
+        commit(self)
+
+    monkeypatch.setattr(memstore.WriteBatch, "commit", flaky_commit)
+    r = client.post("/collect", json=_progressive("s4", 2, timestamp="2026-03-02T10:00:15Z"))
+    assert r.status_code == 500
+    assert app_progressive._dwell_sketches.drain() == {}
+    _answer(client, "s4", 2, 15)  # retry do cliente conta uma vez só
+    assert app_progressive._dwell_sketches.drain()[("camp_a", "small_business", "q2", "2026-03-02", None)].count == 1
+
+
+def test_first_answer_skips_session_lookup(client, store, monkeypatch):
+    reads = []
+    get = memstore.DocumentReference.get
+
+    def counting_get(self):
+        if self._collection == app_progressive.FS_SESSIONS_COLLECTION:
+            reads.append(self.id)
+        return get(self)
+
+    monkeypatch.setattr(memstore.DocumentReference, "get", counting_get)
+    _answer(client, "s5", 1, 0)
+    _answer(client, "s5", 2, 20)
+    assert reads == []
+    assert app_progressive._dwell_sketches.drain()[("camp_a", "small_business", "q2", "2026-03-02", None)].total == 20
@@ -0,0 +1,78 @@
+"""Beacon /event: contadores em memória gravados em lote como incrementos."""
+
+import pytest
+
+import app_progressive
+from test_contract import _docs
+
+
+def _event(client, event, **params):
+    return client.post("/event", json={"event": event, "creative_id": "cr_1", "line_item_id": "li_1", **params})
+
+
+def test_events_counted_in_memory_without_writes(client, store):
+    for _ in range(3):
+        assert _event(client, "impression").status_code == 204
+    assert client.get("/event?event=slide_view&creative_id=cr_1&line_item_id=li_1&slide=2").status_code == 204
+    _event(client, "cta_click", slide=7)
+
+    assert _docs(store, app_progressive.FS_EVENTS_COLLECTION) == {}
+    assert client.get("/events").get_json()["pending"] == 5
+
+
+def test_flush_writes_one_doc_per_key_and_increments(client, store):
+    for _ in range(2):
+        _event(client, "impression")
+        _event(client, "slide_view", slide=1)
+    client.post("/event", data='{"event": "impression", "creative_id": "cr_2"}',
+                headers={"Content-Type": "text/plain"})
+    assert app_progressive.flush_events() == 2
+
+    _event(client, "impression")
+    assert app_progressive.flush_events() == 1
+    assert app_progressive.flush_events() == 0
+
+    docs = {(d["creative_id"], d["line_item_id"]): d for d in _docs(store, app_progressive.FS_EVENTS_COLLECTION).values()}
+    assert docs[("cr_1", "li_1")]["impression"] == 3
+    assert docs[("cr_1", "li_1")]["slide_view"] == 2
+    assert docs[("cr_1", "li_1")]["slides"] == {"1": 2}
+    assert docs[("cr_2", None)]["impression"] == 1
+
+    body = client.get("/events").get_json()
+    assert body["totals"] == {"impression": 4, "slide_view": 2, "cta_click": 0}
+    assert body["slides"] == {"1": 2} and body["pending"] == 0
+    assert [c["creative_id"] for c in body["by_creative"]] == ["cr_1", "cr_2"]
+    assert client.get("/events?creative_id=cr_2&since=2000-01-01").get_json()["totals"]["impression"] == 1
+
+
+def test_request_after_interval_flushes_pending_counts(client, store, monkeypatch):
+    # Sem o agendador (CPU limitada às requisições): quem grava é a próxima requisição
+    monkeypatch.setattr(app_progressive, "_scheduler_started", True)
+    monkeypatch.setattr(app_progressive, "EVENT_FLUSH_SECONDS", 60)
+    monkeypatch.setattr(app_progressive, "_counters_flushed_at", app_progressive.time.monotonic())
+    _event(client, "impression")
+    assert _docs(store, app_progressive.FS_EVENTS_COLLECTION) == {}
+
+    monkeypatch.setattr(app_progressive, "_counters_flushed_at", app_progressive.time.monotonic() - 61)
+    _event(client, "impression")
+    docs = list(_docs(store, app_progressive.FS_EVENTS_COLLECTION).values())
+    assert len(docs) == 1 and docs[0]["impression"] == 2
+    assert client.get("/events").get_json()["pending"] == 0
+
+
+def test_failed_flush_keeps_counts(client, monkeypatch):
+    _event(client, "impression")
+    monkeypatch.setattr(app_progressive, "_client", lambda: (_ for _ in ()).throw(RuntimeError("offline")))
+    with pytest.raises(RuntimeError):
+        app_progressive.flush_events()
+    assert app_progressive._event_counters.pending() == 1
+
+
+@pytest.mark.parametrize("params, error", [
+    ({"event": "hover"}, "invalid_event"),
+    ({"event": "slide_view", "slide": "x"}, "invalid_slide"),
+    ({"event": "slide_view", "slide": 99}, "invalid_slide"),
+])
+def test_invalid_events_rejected(client, params, error):
+    r = client.post("/event", json=params)
+    assert r.status_code == 400 and r.get_json()["error"] == error
@@ -0,0 +1,71 @@
+"""Migração dos documentos v1/v2 para o esquema normalizado."""
+
+import datetime as dt
+
+import pytest
+
+import schema
+import migrate
+
+
+@pytest.fixture
+def legacy(store, answers):
+    responses = store.collection(migrate.FS_COLLECTION)
+    for i in range(7):
+        responses.document(f"v1_{i}").set({"id": f"v1_{i}", "ts": f"2024-01-0{i + 1}T00:00:00Z",
+                                           "session_id": f"s{i}", "ua": "UA/1", **answers})
+    responses.document("novo").set(schema.response_record("novo", answers, source="collect"))
+    for i in range(5):
+        store.collection(migrate.FS_V2_COLLECTION).document(f"v2_{i}").set({
+            "id": f"v2_{i}", "timestamp": dt.datetime(2024, 2, 1, 12, i), "session_id": f"t{i}",
+            "campaign_id": "sebrae_survey_v2", "audience_type": "general_public",
+            "answers": answers, "metadata": {"user_agent": "UA/2", "page_url": "https://x"},
+        })
+    return store
+
+
+def _responses(store):
+    return {doc.id: doc.to_dict() for doc in store.collection(migrate.FS_COLLECTION).stream()}
+
+
+def test_migrate_all_sources(legacy, answers):
+    result = migrate.migrate(legacy, page_size=3, batch_size=2)
+    assert result["v1"]["migrated"] == 7 and result["v1"]["skipped"] == 1
+    assert result["v2"]["migrated"] == 5
+
+    rows = _responses(legacy)
+    assert len(rows) == 13
+    assert all(row["schema_version"] == schema.SCHEMA_VERSION for row in rows.values())
+    assert all(row["answers"] == answers for row in rows.values())
+    assert rows["v1_0"]["metadata"]["user_agent"] == "UA/1" and "q1" not in rows["v1_0"]
+    assert rows["v2_3"]["ts"] == "2024-02-01T12:03:00Z"
+    assert rows["v2_3"]["audience_type"] == "general_public" and rows["v2_3"]["source"] == "v2"
+
+
+def test_migrate_resumes_from_checkpoint(legacy, monkeypatch):
+    commits = []
+    real_commit = migrate._commit
+
+    def failing_commit(client, records):
+        if len(commits) == 2:
+            raise RuntimeError("queda simulada")
+        commits.append(len(records))
+        return real_commit(client, records)
+
+    monkeypatch.setattr(migrate, "_commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        migrate.migrate_source(legacy, "v2", page_size=2, batch_size=1, workers=1)
+    assert migrate.load_checkpoint(legacy, "v2")["cursor"] == "v2_1"
+
+    monkeypatch.setattr(migrate, "_commit", real_commit)
+    stats = migrate.migrate_source(legacy, "v2", page_size=2, batch_size=1, workers=1)
+    assert stats["resumed_from"] == "v2_1" and stats["read"] == 3
+    assert migrate.load_checkpoint(legacy, "v2")["done"] is True
+    assert sum(1 for row in _responses(legacy).values() if row.get("source") == "v2") == 5
+
+
+def test_migrate_dry_run_does_not_write(legacy):
+    result = migrate.migrate(legacy, dry_run=True)
+    assert result["v1"]["migrated"] == 7 and result["v2"]["migrated"] == 5
+    assert "q1" in _responses(legacy)["v1_0"]
+    assert migrate.load_checkpoint(legacy, "v1") == {}
@@ -0,0 +1,151 @@
+"""Réplica em memória: mesmas respostas das leituras no Firestore."""
+
+import time
+import types
+
+import pytest
+
+import replica
+import app_progressive
+from test_contract import _progressive
+
+
+@pytest.fixture
+def mirror(client, store, answers, monkeypatch):
+    for i, (session_id, campaign, audience) in enumerate([("test_a", "camp_a", "small_business"),
+                                                          ("test_b", "camp_b", "general_public"),
+                                                          ("real_c", "camp_a", "general_public")]):
+        client.post("/collect", json={**answers, "session_id": session_id, "campaign_id": campaign,
+                                      "audience_type": audience})
+        for q in (1, 2, 3):
+            client.post("/collect", json={**_progressive(session_id, q), "campaign_id": campaign,
+                                          "audience_type": audience,
+                                          "timestamp": f"2025-01-0{i + 1}T00:00:0{q}Z"})
+    r = replica.default_replica(store, {"responses": app_progressive.FS_COLLECTION,
+                                        "sessions": app_progressive.FS_SESSIONS_COLLECTION})
+    r.load()
+    monkeypatch.setattr(app_progressive, "_replica", r)
+    return r
+
+
+def _both(client, monkeypatch, url):
+    """(resposta da réplica, resposta do Firestore) para a mesma URL"""
+    monkeypatch.setattr(app_progressive, "REPLICA_ENABLED", True)
+    from_replica = client.get(url).get_json()
+    monkeypatch.setattr(app_progressive, "REPLICA_ENABLED", False)
+    from_firestore = client.get(url).get_json()
+    return from_replica, from_firestore
+
+
+@pytest.mark.parametrize("query", [
+    "", "?campaign_id=camp_a", "?audience_type=general_public", "?session_prefix=test_", "?limit=2",
+    "?campaign_id=camp_a&count_only=1", "?since=2000-01-01&until=2100-01-01",
+])
+def test_responses_parity(client, mirror, monkeypatch, query):
+    from_replica, from_firestore = _both(client, monkeypatch, f"/responses{query}")
+    assert from_replica.pop("source") == "replica"
+    assert from_replica == from_firestore
+
+
+def test_sessions_parity(client, mirror, monkeypatch):
+    first, expected = _both(client, monkeypatch, "/sessions?limit=2")
+    assert first == expected
+    second, expected = _both(client, monkeypatch, f"/sessions?limit=2&cursor={first['next_cursor']}")
+    assert second == expected
+    delta, expected = _both(client, monkeypatch, f"/sessions?since={first['next_since']}")
+    assert delta == expected and delta["count"] == 0
+    filtered, expected = _both(client, monkeypatch, "/sessions?audience_type=general_public")
+    assert filtered == expected and filtered["count"] == 2
+
+
+def test_poll_applies_delta_and_load_drops_deleted(client, store, mirror, monkeypatch):
+    monkeypatch.setattr(app_progressive, "REPLICA_ENABLED", True)
+    client.post("/collect", json=_progressive("novo", 1))
+    assert mirror.poll() >= 2
+    sessions = {s["session_id"] for s in client.get("/sessions").get_json()["sessions"]}
+    assert "novo" in sessions
+
+    store.collection(app_progressive.FS_SESSIONS_COLLECTION).document(app_progressive._doc_id("novo", "session")).delete()
+    mirror.load()
+    sessions = {s["session_id"] for s in client.get("/sessions").get_json()["sessions"]}
+    assert "novo" not in sessions
+
+
+def test_snapshot_listener_changes():
+    r = replica.Replica(None, {"sessions": replica.Mirror("sessions", "updated_at", sort_field="updated_at")})
+    change = lambda kind, doc_id, data=None: types.SimpleNamespace(
+        type=types.SimpleNamespace(name=kind), document=types.SimpleNamespace(id=doc_id, to_dict=lambda: data))
+    callback = r._on_snapshot("sessions")
+    callback(None, [change("ADDED", "a", {"updated_at": "1"}), change("ADDED", "b", {"updated_at": "2"})], None)
+    assert r.ready and [doc_id for doc_id, _ in r.query_sessions(limit=10)[0]] == ["b", "a"]
+    callback(None, [change("REMOVED", "b"), change("MODIFIED", "a", {"updated_at": "3"})], None)
+    assert r.query_sessions(limit=10)[0] == [("a", {"updated_at": "3"})]
+
+
+def test_snapshot_restore_then_delta(client, store, mirror, monkeypatch, tmp_path):
+    path = str(tmp_path / "replica.snap")
+    assert mirror.save_snapshot(path) > 0
+    monkeypatch.setattr(app_progressive, "REPLICA_ENABLED", True)
+    expected = {url: client.get(url).get_json() for url in ("/responses", "/sessions?limit=2")}
+
+    warm = replica.default_replica(store, {name: m.collection for name, m in mirror.mirrors.items()})
+    assert warm.restore_snapshot(path) and warm.ready
+    assert {n: m.watermark for n, m in warm.mirrors.items()} == {n: m.watermark for n, m in mirror.mirrors.items()}
+    monkeypatch.setattr(app_progressive, "_replica", warm)
+    assert {url: client.get(url).get_json() for url in expected} == expected
+
+    monkeypatch.setattr(replica, "REPLICA_OVERLAP_SECONDS", 0)
+    client.post("/collect", json=_progressive("depois", 1))
+    assert warm.poll() == 1  # só o índice da sessão; nada relido
+    assert "depois" in {s["session_id"] for s in client.get("/sessions").get_json()["sessions"]}
+
+
+class _ListeningRef:
+    """Coleção do memstore com on_snapshot (sem eventos), para o modo listener"""
+
+    def __init__(self, ref):
+        self._ref = ref
+
+    def where(self, *args):
+        return _ListeningRef(self._ref.where(*args))
+
+    def stream(self):
+        return self._ref.stream()
+
+    def on_snapshot(self, callback):
+        return types.SimpleNamespace(unsubscribe=lambda: None)
+
+
+def test_restored_listener_resyncs_deletes(client, store, mirror, tmp_path):
+    path = str(tmp_path / "replica.snap")
+    mirror.save_snapshot(path)
+    listening = types.SimpleNamespace(collection=lambda name: _ListeningRef(store.collection(name)))
+    warm = replica.default_replica(listening, {name: m.collection for name, m in mirror.mirrors.items()})
+    assert warm.restore_snapshot(path)
+
+    store.collection(app_progressive.FS_SESSIONS_COLLECTION).document(app_progressive._doc_id("test_a", "session")).delete()
+    warm.start(resync_seconds=0.01)
+    try:
+        assert warm.mode == "listener"
+        deadline = time.time() + 5
+        while "test_a" in {data["session_id"] for _, data in warm.query_sessions(limit=10)[0]}:
+            assert time.time() < deadline, "remoção não chegou à réplica"
+            time.sleep(0.01)
+    finally:
+        warm.stop()
+
+
+def test_snapshot_ignored_when_missing_or_incompatible(mirror, store, tmp_path):
+    path = str(tmp_path / "replica.snap")
+    fresh = lambda: replica.default_replica(store, {name: m.collection for name, m in mirror.mirrors.items()})
+    assert not fresh().restore_snapshot(path)
+
+    mirror.save_snapshot(path)
+    other = fresh()
+    other.mirrors["sessions"].columns = replica.SESSION_COLUMNS[:-1]
+    assert not other.restore_snapshot(path) and not other.ready
+
+    with open(path, "r+b") as f:
+        f.seek(-4, 2)
+        f.write(b"\xff\xff\xff\xff")
+    assert not fresh().restore_snapshot(path)
@@ -0,0 +1,209 @@
+"""Rollups diários e /dashboard-summary."""
+
+import threading
+import datetime as dt
+
+import pytest
+
+import jobs
+import rollups
+
+MOBILE = "Mozilla/5.0 (iPhone) Mobile/15E148"
+
+
+def _wait_rollups(client, full=False):
+    from test_contract import _wait_job
+    r = client.post(f"/rollups{'?full=1' if full else ''}")
+    assert r.status_code == 202
+    job = _wait_job(client, r.get_json()["job_id"])
+    assert job["status"] == "done", job["error"]
+    return job["result"]
+
+
+def _answer(client, session_id, question, day, audience="small_business", campaign="camp_a", **extra):
+    payload = {"session_id": session_id, "question_number": question, "answer": f"a{question}",
+               "campaign_id": campaign, "audience_type": audience, "timestamp": f"{day}T10:0{question}:00Z", **extra}
+    assert client.post("/collect", json=payload, headers={"User-Agent": MOBILE}).status_code == 200
+
+
+@pytest.fixture
+def seeded(client, answers):
+    for q in range(1, 7):
+        _answer(client, "sb_done", q, "2025-09-01", is_complete=q == 6, all_answers=answers if q == 6 else None)
+    for q in (1, 2):
+        _answer(client, "gp_drop", q, "2025-09-01", audience="general_public")
+    _answer(client, "gp_next_day", 1, "2025-09-02", audience="general_public", campaign="camp_b")
+    _answer(client, "test_qa", 1, "2025-09-02", campaign="test_campaign")
+    client.post("/collect", json={**answers, "session_id": "v2", "audience_type": "general_public",
+                                  "campaign_id": "camp_b"})
+    _wait_rollups(client)
+    return client
+
+
+def test_summary_totals(seeded):
+    body = seeded.get("/dashboard-summary").get_json()
+    progressive = body["progressive"]
+    assert progressive["sessions"] == 3 and progressive["completed_sessions"] == 1
+    assert progressive["rows"] == 9 and progressive["complete_rows"] == 1
+    assert progressive["answered_by_question"]["1"] == 3
+    assert progressive["abandonment_rate_by_question"]["2"] == 50.0
+    assert progressive["devices"] == {"Mobile": 9}
+    assert progressive["by_hour"]["10"]["rows"] == 9
+
+    responses = body["responses"]
+    # Registro completo gerado pela última resposta + POST completo
+    assert responses["total"] == 2
+    assert responses["by_audience"] == {"small_business": 1, "general_public": 1}
+    assert responses["questions"]["q1"] == {"resposta_1": 2}
+    assert body["rollups_updated_at"]
+
+
+@pytest.mark.parametrize("query, sessions", [
+    ("?campaign_id=camp_b", 1),
+    ("?since=2025-09-02", 1),
+    ("?until=2025-09-02", 2),
+    ("?include_test=1", 4),
+])
+def test_summary_filters(seeded, query, sessions):
+    assert seeded.get(f"/dashboard-summary{query}").get_json()["progressive"]["sessions"] == sessions
+
+
+def test_summary_audience_filter(seeded):
+    body = seeded.get("/dashboard-summary?audience_type=general_public").get_json()
+    assert body["responses"]["total"] == 1
+    assert body["responses"]["by_audience"] == {"general_public": 1}
+    progressive = body["progressive"]
+    assert progressive["sessions"] == 2 and progressive["completed_sessions"] == 0
+    assert list(progressive["by_audience"]) == ["general_public"]
+
+
+def test_summary_progressive_by_audience(seeded):
+    by_audience = seeded.get("/dashboard-summary").get_json()["progressive"]["by_audience"]
+    assert by_audience["small_business"]["sessions"] == 1
+    assert by_audience["small_business"]["completion_rate"] == 100.0
+    assert by_audience["general_public"]["sessions"] == 2
+    assert by_audience["general_public"]["abandonment_rate_by_question"]["2"] == 100.0
+
+
+def test_incremental_update_recomputes_only_touched_days(seeded, store):
+    before = store.collection(rollups.FS_ROLLUPS_COLLECTION).document("2025-09-01").get().to_dict()
+    _answer(seeded, "late", 1, "2025-09-02")
+    _answer(seeded, "late", 1, "2025-09-02")  # reenvio: não conta duas vezes
+    result = _wait_rollups(seeded)
+    assert result["days"] >= 1
+    assert seeded.get("/dashboard-summary?since=2025-09-02").get_json()["progressive"]["sessions"] == 2
+    after = store.collection(rollups.FS_ROLLUPS_COLLECTION).document("2025-09-01").get().to_dict()
+    assert after["buckets"] == before["buckets"]
+
+
+def test_compact_protocol_uses_session_meta_device(client):
+    first = client.post("/collect", json={"session_id": "tok", "question_number": 1, "answer": "x",
+                                          "campaign_id": "camp_a", "handshake": True,
+                                          "timestamp": "2025-09-03T08:00:00Z"},
+                        headers={"User-Agent": MOBILE}).get_json()
+    client.post("/collect", json={"session_token": first["session_token"], "question_number": 2, "answer": "y",
+                                  "timestamp": "2025-09-03T08:01:00Z"})
+    _wait_rollups(client, full=True)
+    assert client.get("/dashboard-summary").get_json()["progressive"]["devices"] == {"Mobile": 2}
+
+
+def test_timeseries_by_day(seeded):
+    body = seeded.get("/rollups/timeseries?until=2025-09-03").get_json()
+    series = {p["period"]: p for p in body["series"]}
+    assert list(series) == ["2025-09-01", "2025-09-02"]
+    assert series["2025-09-01"]["rows"] == 8 and series["2025-09-01"]["sessions"] == 2
+    assert series["2025-09-01"]["answers"]["q1"] == {"a1": 2}
+    assert series["2025-09-02"]["sessions"] == 1
+
+
+def test_timeseries_by_hour_and_question(seeded):
+    body = seeded.get("/rollups/timeseries?granularity=hour&since=2025-09-01&until=2025-09-01T11"
+                      "&question=q2&audience_type=general_public").get_json()
+    assert [p["period"] for p in body["series"]] == ["2025-09-01T10"]
+    point = body["series"][0]
+    assert point["rows"] == 2 and point["answers"] == {"q2": {"a2": 1}}
+
+
+def test_timeseries_invalid_granularity(client):
+    assert client.get("/rollups/timeseries?granularity=week").status_code == 400
+
+
+def test_open_day_is_compacted_from_hours_and_closed_later(client, store):
+    day = dt.datetime.utcnow().date().isoformat()
+    _answer(client, "today", 1, day)
+    _answer(client, "today", 2, day)
+    _wait_rollups(client)
+    assert store.collection(rollups.FS_ROLLUPS_COLLECTION).document(day).get().to_dict()["closed"] is False
+    hourly = [d.to_dict() for d in store.collection(rollups.FS_ROLLUPS_HOURLY_COLLECTION).stream()]
+    assert [h["hour"] for h in hourly] == [f"{day}T10"]
+
+    later = dt.datetime.utcnow() + dt.timedelta(days=2)
+    result = rollups.update_rollups(store, now=later)
+    assert result["closed"] == 1
+    daily = store.collection(rollups.FS_ROLLUPS_COLLECTION).document(day).get().to_dict()
+    assert daily["closed"] is True and daily["buckets"][0]["sessions"] == 1
+    assert not list(store.collection(rollups.FS_ROLLUPS_HOURLY_COLLECTION).stream())
+
+
+def test_open_day_counts_session_spanning_hours_once(client, store, answers):
+    day = dt.datetime.utcnow().date().isoformat()
+    for q in range(1, 7):
+        hour = 10 if q < 4 else 11
+        _answer(client, "span", q, day, timestamp=f"{day}T{hour}:0{q}:00Z", is_complete=q == 6,
+                all_answers=answers if q == 6 else None)
+    _wait_rollups(client)
+    hourly = [d.to_dict() for d in store.collection(rollups.FS_ROLLUPS_HOURLY_COLLECTION).stream()]
+    assert len(hourly) == 2 and all(h["buckets"][0]["sessions"] == 0 for h in hourly)
+
+    progressive = client.get(f"/dashboard-summary?since={day}").get_json()["progressive"]
+    assert progressive["sessions"] == 1 and progressive["completed_sessions"] == 1
+    assert progressive["abandoned_by_question"] == {} and progressive["answered_by_question"]["1"] == 1
+    assert progressive["rows"] == 6
+
+
+def test_scheduler_submits_periodically():
+    ticks = threading.Event()
+    jobs.schedule("test_tick", 0.01, lambda job: ticks.set())
+    try:
+        assert ticks.wait(2)
+    finally:
+        jobs.unschedule("test_tick")
+
+
+def test_lease_elects_one_runner_per_interval(client, store, monkeypatch):
+    _answer(client, "s1", 1, "2025-09-01")
+    assert rollups.acquire_lease(store, "outra_instancia", now=1000.0)
+    # Lease de outra instância ainda válido: a rodada é pulada, sem ler nada
+    monkeypatch.setattr(rollups.time, "time", lambda: 1500.0)
+    assert rollups.run_leased(store) == {"skipped": "leased"}
+    assert rollups.load_checkpoint(store) == {}
+
+    # Lease vencido (instância morta no meio da rodada): outra assume
+    monkeypatch.setattr(rollups.time, "time", lambda: 2000.0)
+    assert rollups.run_leased(store, interval=300)["days"] == 1
+    # Reservado até 90% do intervalo: outros workers pulam, o próximo tique encontra livre
+    monkeypatch.setattr(rollups.time, "time", lambda: 2200.0)
+    assert rollups.run_leased(store, interval=300) == {"skipped": "leased"}
+    monkeypatch.setattr(rollups.time, "time", lambda: 2270.0)
+    assert "skipped" not in rollups.run_leased(store, interval=300)
+
+
+def test_lease_precondition_rejects_concurrent_takeover(store):
+    assert rollups.acquire_lease(store, "a", seconds=10, now=0.0)
+    ref = store.collection(rollups.FS_CHECKPOINTS_COLLECTION).document(rollups.LEASE_ID)
+    stale = ref.get()
+    assert rollups.acquire_lease(store, "b", seconds=10, now=20.0)
+    # "c" leu o lease vencido antes de "b" gravar: a precondição recusa a troca
+    with pytest.raises(Exception) as error:
+        ref.update({"owner": "c"}, option=store.write_option(last_update_time=stale.update_time))
+    assert rollups._lease_conflict(error.value)
+    assert not rollups.acquire_lease(store, "c", seconds=10, now=25.0)
+    assert ref.get().to_dict()["owner"] == "b"
+
+
+def test_checkpoint_watermark_never_moves_back(store):
+    rollups.save_checkpoint(store, {"progressive": "2025-09-02T00:00:00Z", "responses": None}, {})
+    # Execução mais lenta, iniciada antes, termina depois com um watermark menor
+    rollups.save_checkpoint(store, {"progressive": "2025-09-01T00:00:00Z", "responses": "2025-09-01T00:00:00Z"}, {})
+    assert rollups.load_checkpoint(store)["watermarks"] == {"progressive": "2025-09-02T00:00:00Z",
+                                                            "responses": "2025-09-01T00:00:00Z"}
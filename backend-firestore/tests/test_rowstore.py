@@ -0,0 +1,64 @@
+"""ColumnStore: linhas em colunas compactas, lidas de volta sem perda."""
+
+import datetime as dt
+
+import pytest
+
+from rowstore import ColumnStore
+
+COLUMNS = [("session_id", "code"), ("question_number", "small"), ("answer", "code"),
+           ("is_complete", "bool"), ("timestamp", "time"), ("answers.q1", "code")]
+
+
+@pytest.mark.parametrize("timestamp", [
+    "2025-01-01T12:00:00Z", "2025-01-01T12:00:00.123Z", "2025-01-01T12:00:00.123456Z",
+    "1969-12-31T23:59:59.500Z", "2025-01-01T12:00:00+00:00", "2025-02-30T25:00:00Z", "ontem",
+    dt.datetime(2025, 1, 1),
+])
+def test_timestamps_round_trip(timestamp):
+    rows = ColumnStore(COLUMNS)
+    rows["a"] = {"timestamp": timestamp}
+    assert rows["a"] == {"timestamp": timestamp}
+
+
+def test_round_trip_and_overflow():
+    rows = ColumnStore(COLUMNS)
+    row = {"session_id": "s1", "question_number": 3, "answer": "muito_agil", "is_complete": False,
+           "answers": {"q1": "sim"}, "ignored": "x"}
+    rows["a"] = row
+    rows["b"] = {"question_number": "7", "is_complete": "true", "answer": ["lista"]}
+    assert rows["a"] == {k: v for k, v in row.items() if k != "ignored"}
+    assert rows["b"] == {"question_number": "7", "is_complete": "true", "answer": ["lista"]}
+    assert rows.get("c") is None and "a" in rows and len(rows) == 2
+
+
+def test_overwrite_clears_overflow():
+    rows = ColumnStore(COLUMNS)
+    rows["a"] = {"answer": ["lista"], "question_number": 70000, "is_complete": "sim", "timestamp": "ontem"}
+    rows["a"] = {"answer": "sim", "question_number": 2, "is_complete": True, "timestamp": "2025-01-01T00:00:00Z"}
+    assert rows["a"] == {"answer": "sim", "question_number": 2, "is_complete": True,
+                         "timestamp": "2025-01-01T00:00:00Z"}
+
+
+def test_dictionary_shares_values_and_reuses_slots():
+    rows = ColumnStore(COLUMNS, keep_none=("answers",))
+    for i in range(3):
+        rows[f"r{i}"] = {"answer": "muito_" + "agil", "session_id": f"s{i % 2}"}
+    answers = [row["answer"] for row in rows.values()]
+    assert all(a is answers[0] for a in answers)
+    assert rows["r0"]["answers"] == {"q1": None}
+
+    assert rows.pop("r1")["session_id"] == "s1"
+    rows["r3"] = {"answer": "pouco_agil"}
+    assert len(rows) == 3 and len(rows._ids) == 3
+    assert [doc_id for doc_id, _ in rows.items()] == ["r0", "r3", "r2"]
+
+
+def test_hex_ids_round_trip():
+    rows = ColumnStore(COLUMNS)
+    hex_id, upper_id = "ab" * 20, "AB" * 20
+    rows[hex_id] = {"answer": "sim"}
+    rows[upper_id] = {"answer": "nao"}
+    assert isinstance(rows._ids[0], bytes) and rows._ids[1] == upper_id
+    assert [doc_id for doc_id, _ in rows.items()] == [hex_id, upper_id]
+    assert rows[hex_id] == {"answer": "sim"} and rows.pop(hex_id) and hex_id not in rows
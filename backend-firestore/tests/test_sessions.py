@@ -0,0 +1,101 @@
+"""Índice de sessões mantido na ingestão e GET /sessions."""
+
+import pytest
+
+import app_progressive
+from test_contract import _progressive, _wait_job, _docs
+
+MOBILE = "Mozilla/5.0 (iPhone) Mobile/15E148"
+
+
+@pytest.fixture
+def grouped(client, answers):
+    for q in range(1, 7):
+        client.post("/collect", json=_progressive("done", q, is_complete=q == 6,
+                                                  all_answers=answers if q == 6 else None),
+                    headers={"User-Agent": MOBILE})
+    for q in (1, 3):
+        client.post("/collect", json=_progressive("gaps", q, audience_type="general_public"))
+    client.post("/collect", json=_progressive("other", 1, campaign_id="camp_b"))
+    return client
+
+
+def _sessions(client, query=""):
+    r = client.get(f"/sessions{query}")
+    assert r.status_code == 200
+    return r.get_json()
+
+
+def test_sessions_grouped_with_mask(grouped):
+    body = _sessions(grouped)
+    sessions = {s["session_id"]: s for s in body["sessions"]}
+    assert body["count"] == 3 and not body["has_more"]
+
+    assert sessions["done"]["answered_mask"] == 0b111111
+    assert sessions["done"]["is_complete"] is True
+    assert sessions["done"]["device"] == "Mobile"
+    assert sessions["gaps"]["answered_mask"] == 0b101
+    assert sessions["gaps"]["answered_count"] == 2
+    assert sessions["gaps"]["is_complete"] is False
+    assert sessions["gaps"]["audience_type"] == "general_public"
+    assert sessions["gaps"]["first_answer_at"] <= sessions["gaps"]["last_answer_at"]
+
+
+def test_sessions_index_is_one_doc_per_session(grouped, store):
+    docs = _docs(store, app_progressive.FS_SESSIONS_COLLECTION)
+    assert len(docs) == 3
+    assert docs[app_progressive._doc_id("gaps", "session")]["answers"] == {"q1": "sim", "q3": "sim"}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("?campaign_id=camp_b", {"other"}),
+    ("?audience_type=general_public", {"gaps"}),
+    ("?campaign_id=camp_a&audience_type=small_business", {"done"}),
+])
+def test_sessions_filters(grouped, query, expected):
+    assert {s["session_id"] for s in _sessions(grouped, query)["sessions"]} == expected
+
+
+def test_sessions_pagination(grouped):
+    first = _sessions(grouped, "?limit=2")
+    assert first["count"] == 2 and first["has_more"] and first["next_cursor"]
+    second = _sessions(grouped, f"?limit=2&cursor={first['next_cursor']}")
+    assert second["count"] == 1 and not second["has_more"] and second["next_cursor"] is None
+
+    pages = first["sessions"] + second["sessions"]
+    assert {s["session_id"] for s in pages} == {"done", "gaps", "other"}
+    assert [s["updated_at"] for s in pages] == sorted((s["updated_at"] for s in pages), reverse=True)
+
+
+def test_sessions_since_delta(grouped):
+    since = _sessions(grouped)["next_since"]
+    assert _sessions(grouped, f"?since={since}")["count"] == 0
+
+    grouped.post("/collect", json=_progressive("gaps", 2, audience_type="general_public"))
+    grouped.post("/collect", json=_progressive("new", 1))
+    delta = _sessions(grouped, f"?since={since}&limit=1")
+    assert delta["count"] == 1 and delta["has_more"]
+    rest = _sessions(grouped, f"?since={delta['next_since']}")
+    assert not rest["has_more"]
+
+    changed = {s["session_id"]: s for s in delta["sessions"] + rest["sessions"]}
+    assert set(changed) == {"gaps", "new"}
+    assert changed["gaps"]["answered_mask"] == 0b111
+    assert _sessions(grouped, f"?since={rest['next_since']}")["count"] == 0
+
+
+def test_sessions_replay_merges_per_session(client):
+    items = [_progressive("r1", 1), _progressive("r1", 2), _progressive("r2", 4)]
+    client.post("/replay", json={"answers": items})
+    sessions = {s["session_id"]: s for s in _sessions(client)["sessions"]}
+    assert sessions["r1"]["answered_mask"] == 0b11
+    assert sessions["r2"]["answered_mask"] == 0b1000
+
+
+def test_reconcile_keeps_index_answers(grouped, store):
+    job = _wait_job(grouped, grouped.post("/reconcile-sessions?full=1").get_json()["job_id"])
+    assert job["status"] == "done", job["error"]
+    sessions = {s["session_id"]: s for s in _sessions(grouped)["sessions"]}
+    assert sessions["done"]["answered_mask"] == 0b111111
+    assert sessions["done"]["device"] == "Mobile"
+    assert sessions["gaps"]["answered_mask"] == 0b101
@@ -0,0 +1,26 @@
+"""Cold start: firestore importado só no uso e cliente único por processo."""
+
+import sys
+
+import lazy
+import app_progressive
+
+
+def test_lazy_module_imports_on_first_attribute(monkeypatch):
+    monkeypatch.delitem(sys.modules, "colorsys", raising=False)
+    module = lazy.LazyModule("colorsys")
+    assert not module.loaded and "colorsys" not in sys.modules
+    assert module.rgb_to_hsv(1, 0, 0)[0] == 0
+    assert module.loaded and "colorsys" in sys.modules
+    assert lazy.available("colorsys") and not lazy.available("nao_existe.modulo")
+
+
+def test_client_created_once_per_process(client, store):
+    assert app_progressive._client() is app_progressive._client() is store
+    assert client.post("/collect", json={"session_id": "test_s", "question_number": 1,
+                                         "answer": "sim"}).status_code == 200
+
+
+def test_warm_up_without_firestore(monkeypatch):
+    monkeypatch.setattr(app_progressive, "FS_AVAILABLE", False)
+    assert app_progressive.warm_up() is False
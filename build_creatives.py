@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Build dos criativos HTML5 a partir dos templates de creative-v2/templates
+
+Cada família de layout (carrossel, chatbot, insights, progressivo) tem um único
+template com placeholders `{{nome}}`; o manifesto creative-v2/variants.json
+define tamanhos, públicos e parâmetros. Adicionar um tamanho ou público é só
+uma mudança no manifesto.
+
+Além do HTML legível em creative-v2/, cada variante ganha uma versão minificada
+(CSS/JS/HTML, sem console.log de debug) em creative-v2/dist/, que é a que vai
+para o .zip. O build falha se algum criativo passar do orçamento de peso
+definido em `budget` no manifesto.
+
+Uso:
+    python build_creatives.py            # gera só o que mudou
+    python build_creatives.py --force    # regera todos os variantes
+    python build_creatives.py --check    # falha se algum HTML estiver desatualizado ou acima do orçamento
+    python build_creatives.py --zip      # também empacota os .zip (generate_zips)
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from creative_minify import minify_html, gzip_size
+
+CREATIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "creative-v2")
+MANIFEST_PATH = os.path.join(CREATIVE_DIR, "variants.json")
+CACHE_PATH = os.path.join(CREATIVE_DIR, ".build_cache.json")
+# Versão minificada, que é a entregue ao DV360 (.zip)
+DIST_DIR = os.path.join(CREATIVE_DIR, "dist")
+
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+class BuildError(Exception):
+    pass
+
+
+def _sha256(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _file_sha256(path):
+    try:
+        with open(path, "rb") as f:
+            return _sha256(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def load_manifest(path=MANIFEST_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expand_variants(manifest):
+    """Lista de variantes (template × tamanho × público) com os parâmetros resolvidos.
+
+    Precedência dos parâmetros: público global < template < tamanho < público do template.
+    Valores string podem referenciar {size}, {width}, {height}, {audience} e {slug}.
+    """
+    variants = []
+    for name, spec in manifest["templates"].items():
+        audiences = spec.get("audiences") or {a: {} for a in manifest["audiences"]}
+        for size, size_params in spec["sizes"].items():
+            width, height = size.split("x")
+            for audience, audience_params in audiences.items():
+                base = manifest["audiences"][audience]
+                context = {"size": size, "width": width, "height": height,
+                           "audience": audience, "slug": base["slug"]}
+                params = {**base, "width": width, "height": height,
+                          **spec.get("params", {}), **size_params, **audience_params}
+                params = {k: v.format(**context) if isinstance(v, str) else v for k, v in params.items()}
+                variants.append({
+                    "template": name,
+                    "template_file": os.path.join(CREATIVE_DIR, spec["file"]),
+                    "output": os.path.join(CREATIVE_DIR, spec["output"].format(**context)),
+                    "dist": os.path.join(DIST_DIR, spec["output"].format(**context)),
+                    "copy_to": [os.path.join(CREATIVE_DIR, d) for d in spec.get("copy_to", [])],
+                    "minify": spec.get("minify", manifest.get("minify", True)),
+                    "budget": {**manifest.get("budget", {}), **spec.get("budget", {})},
+                    "params": params,
+                })
+    return variants
+
+
+def render(template, params, name="template"):
+    """Substitui os placeholders; erro listando todos os parâmetros ausentes"""
+    missing = sorted({m for m in PLACEHOLDER.findall(template) if m not in params})
+    if missing:
+        raise BuildError(f"{name}: parâmetros ausentes: {', '.join(missing)}")
+    return PLACEHOLDER.sub(lambda m: str(params[m.group(1)]), template)
+
+
+def _targets(variant):
+    out = [variant["output"]]
+    out += [os.path.join(d, os.path.basename(variant["output"])) for d in variant["copy_to"]]
+    return out
+
+
+def _build_one(variant, templates, cache, force, check):
+    """Renderiza e minifica um variante; retorna um dict com status, digests e tamanhos"""
+    template = templates[variant["template_file"]]
+    input_digest = _sha256(template + json.dumps(variant["params"], sort_keys=True, ensure_ascii=False))
+    key = os.path.relpath(variant["output"], CREATIVE_DIR)
+    cached = cache.get(key, {})
+    result = {"variant": variant, "input": input_digest}
+
+    # Incremental: entrada igual e saídas intactas (não editadas à mão)
+    if not force and not check and cached.get("input") == input_digest and \
+            all(_file_sha256(path) == cached.get("output") for path in _targets(variant)) and \
+            cached.get("dist") and _file_sha256(variant["dist"]) == cached["dist"]:
+        with open(variant["dist"], encoding="utf-8") as f:
+            dist_html = f.read()
+        return {**result, "status": "skipped", "output": cached["output"], "dist": cached["dist"],
+                **_sizes(variant, cached.get("raw_bytes"), dist_html)}
+
+    html = render(template, variant["params"], os.path.basename(variant["template_file"]))
+    dist_html = minify_html(html) if variant["minify"] else html
+    result.update(output=_sha256(html), dist=_sha256(dist_html), **_sizes(variant, len(html.encode("utf-8")), dist_html))
+    if check:
+        stale = any(_file_sha256(path) != result["output"] for path in _targets(variant))
+        return {**result, "status": "stale" if stale else "ok"}
+
+    with open(variant["output"], "w", encoding="utf-8", newline="") as f:
+        f.write(html)
+    for path in _targets(variant)[1:]:
+        shutil.copyfile(variant["output"], path)
+    with open(variant["dist"], "w", encoding="utf-8", newline="") as f:
+        f.write(dist_html)
+    return {**result, "status": "built"}
+
+
+def _sizes(variant, raw_bytes, dist_html):
+    """Tamanho do HTML fonte, minificado e minificado+gzip, e estouros de orçamento"""
+    dist_bytes = len(dist_html.encode("utf-8"))
+    gzip_bytes = gzip_size(dist_html)
+    budget = variant["budget"]
+    over = []
+    if budget.get("initial_load_kb") and dist_bytes > budget["initial_load_kb"] * 1024:
+        over.append(f"{dist_bytes / 1024:.1f} KB > {budget['initial_load_kb']} KB")
+    if budget.get("initial_load_gzip_kb") and gzip_bytes > budget["initial_load_gzip_kb"] * 1024:
+        over.append(f"{gzip_bytes / 1024:.1f} KB gzip > {budget['initial_load_gzip_kb']} KB")
+    return {"raw_bytes": raw_bytes, "dist_bytes": dist_bytes, "gzip_bytes": gzip_bytes, "over_budget": over}
+
+
+def build(manifest=None, force=False, check=False, workers=None):
+    """Gera os variantes em paralelo; retorna a lista de resultados de `_build_one`"""
+    manifest = manifest or load_manifest()
+    variants = expand_variants(manifest)
+    os.makedirs(DIST_DIR, exist_ok=True)
+
+    templates = {}
+    for variant in variants:
+        if variant["template_file"] not in templates:
+            with open(variant["template_file"], encoding="utf-8") as f:
+                templates[variant["template_file"]] = f.read()
+
+    try:
+        with open(CACHE_PATH, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cache = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda v: _build_one(v, templates, cache, force, check), variants))
+
+    if not check:
+        cache = {os.path.relpath(r["variant"]["output"], CREATIVE_DIR): {
+            "input": r["input"], "output": r["output"], "dist": r["dist"], "raw_bytes": r["raw_bytes"],
+        } for r in results}
+        with open(CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+
+    return results
+
+
+def main():
+    force = "--force" in sys.argv
+    check = "--check" in sys.argv
+    make_zips = "--zip" in sys.argv
+
+    print("🚀 BUILD DOS CRIATIVOS")
+    print("=" * 60)
+    started = time.time()
+    try:
+        results = build(force=force, check=check)
+    except BuildError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    for r in results:
+        name = os.path.basename(r["variant"]["output"])
+        if r["status"] == "built":
+            print(f"✅ Gerado: {name}")
+        elif r["status"] == "stale":
+            print(f"❌ Desatualizado: {name}")
+
+    print(f"\n📦 PESO DOS CRIATIVOS (fonte → minificado → gzip):")
+    for r in results:
+        name = os.path.basename(r["variant"]["output"])
+        line = f"   {name}: {r['raw_bytes'] / 1024:.1f} KB → {r['dist_bytes'] / 1024:.1f} KB → {r['gzip_bytes'] / 1024:.1f} KB"
+        print(line + (f"  ❌ acima do orçamento ({'; '.join(r['over_budget'])})" if r["over_budget"] else ""))
+
+    counts = {s: sum(1 for r in results if r["status"] == s) for s in ("built", "skipped", "ok", "stale")}
+    over_budget = [r for r in results if r["over_budget"]]
+    print(f"\n{'='*60}")
+    print(f"📊 {len(results)} variantes em {time.time() - started:.2f}s "
+          f"(gerados: {counts['built']}, sem mudança: {counts['skipped'] + counts['ok']})")
+
+    if over_budget:
+        print(f"❌ {len(over_budget)} criativos acima do orçamento de peso (variants.json → budget)")
+        sys.exit(1)
+
+    if check and counts["stale"]:
+        print("⚠️  Rode `python build_creatives.py` e faça commit dos HTML gerados")
+        sys.exit(1)
+
+    if make_zips and not check:
+        import generate_zips
+        created, unchanged, failed = generate_zips.package(force=force)
+        print(f"📦 .zip: {len(created)} gerados, {len(unchanged)} sem mudança")
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
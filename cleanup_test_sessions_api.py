@@ -7,6 +7,7 @@ Remove registros que começam com 'test_' tanto da coleção 'responses' quanto
 import requests
 import json
 import sys
+import time
 from datetime import datetime
 
 # URLs das APIs
@@ -14,31 +15,36 @@ API_BASE_URL = "https://sebrae-survey-api-fs-609095880025.southamerica-east1.run
 RESPONSES_URL = f"{API_BASE_URL}/responses"
 PROGRESSIVE_URL = f"{API_BASE_URL}/progressive-responses"
 
-def get_all_responses():
-    """Busca todas as respostas da API"""
-    try:
-        response = requests.get(RESPONSES_URL, timeout=30)
-        if response.status_code == 200:
-            return response.json().get('responses', [])
-        else:
-            print(f"❌ Erro ao buscar respostas: {response.status_code}")
-            return []
-    except Exception as e:
-        print(f"❌ Erro na requisição: {str(e)}")
-        return []
+TEST_PREFIX = "test_"
+# Consultas de status seguidas com 404 antes de conferir pelas contagens
+STATUS_MAX_MISSES = 10
 
-def get_all_progressive_responses():
-    """Busca todas as respostas progressivas da API"""
+def get_test_responses(url, count_only=False):
+    """Busca na API apenas os registros de teste (filtro session_prefix aplicado no servidor)"""
+    params = {"session_prefix": TEST_PREFIX}
+    if count_only:
+        params["count_only"] = "1"
     try:
-        response = requests.get(PROGRESSIVE_URL, timeout=30)
+        response = requests.get(url, params=params, timeout=30)
         if response.status_code == 200:
-            return response.json().get('responses', [])
+            result = response.json()
+            return result.get('count', 0) if count_only else result.get('responses', [])
         else:
-            print(f"❌ Erro ao buscar respostas progressivas: {response.status_code}")
-            return []
+            print(f"❌ Erro ao buscar {url}: {response.status_code}")
+            return 0 if count_only else []
     except Exception as e:
         print(f"❌ Erro na requisição: {str(e)}")
-        return []
+        return 0 if count_only else []
+
+def count_test_sessions():
+    """Conta os registros de teste sem baixá-los (aggregation query no servidor)"""
+    total_responses = get_test_responses(RESPONSES_URL, count_only=True)
+    total_progressive = get_test_responses(PROGRESSIVE_URL, count_only=True)
+    print(f"📋 Coleção 'responses': {total_responses} registros")
+    print(f"📋 Coleção 'progressive_responses': {total_progressive} registros")
+    print("-" * 50)
+    print(f"📊 TOTAL DE REGISTROS DE TESTE: {total_responses + total_progressive}")
+    return total_responses, total_progressive
 
 def preview_test_sessions():
     """Mostra uma prévia das sessões de teste"""
@@ -47,13 +53,7 @@ def preview_test_sessions():
     
     # Buscar respostas principais
     print("📋 Buscando respostas principais...")
-    responses = get_all_responses()
-    
-    test_responses = []
-    for resp in responses:
-        session_id = resp.get('session_id', '')
-        if session_id.startswith('test_'):
-            test_responses.append(resp)
+    test_responses = get_test_responses(RESPONSES_URL)
     
     print(f"📋 Coleção 'responses':")
     for resp in test_responses:
@@ -63,13 +63,7 @@ def preview_test_sessions():
     
     # Buscar respostas progressivas
     print("📋 Buscando respostas progressivas...")
-    progressive_responses = get_all_progressive_responses()
-    
-    test_progressive = []
-    for resp in progressive_responses:
-        session_id = resp.get('session_id', '')
-        if session_id.startswith('test_'):
-            test_progressive.append(resp)
+    test_progressive = get_test_responses(PROGRESSIVE_URL)
     
     print(f"📋 Coleção 'progressive_responses':")
     for resp in test_progressive:
@@ -84,26 +78,53 @@ def preview_test_sessions():
     return test_responses, test_progressive
 
 def delete_test_sessions(test_responses, test_progressive):
-    """Remove as sessões de teste usando o endpoint da API"""
+    """Remove as sessões de teste usando o endpoint da API (job em background)"""
     print("🚀 Removendo sessões de teste via API...")
     print("-" * 50)
     
     try:
-        # Chamar o endpoint de limpeza
+        # Chamar o endpoint de limpeza: agenda o job e devolve o job_id
         cleanup_url = f"{API_BASE_URL}/cleanup-test-sessions"
         response = requests.post(cleanup_url, timeout=60)
         
-        if response.status_code == 200:
-            result = response.json()
+        if response.status_code != 202:
+            print(f"❌ Erro na limpeza: {response.status_code}")
+            print(f"📋 Resposta: {response.text}")
+            return
+        
+        status_url = f"{API_BASE_URL}{response.json()['status_url']}"
+        misses = 0
+        while True:
+            status = requests.get(status_url, timeout=30)
+            if status.status_code == 404:
+                # O status do job fica em memória na instância que o executa; outra instância responde 404
+                misses += 1
+                if misses >= STATUS_MAX_MISSES:
+                    print("⚠️ Status do job indisponível (a consulta caiu em outra instância)")
+                    print("📋 Registros de teste restantes:")
+                    count_test_sessions()
+                    return
+                time.sleep(2)
+                continue
+            job = status.json()['job']
+            progress = job.get('progress', {})
+            print(f"   ⏳ {job['status']}: responses={progress.get('responses', 0)} progressive={progress.get('progressive', 0)}")
+            if job['status'] in ('done', 'error'):
+                break
+            time.sleep(2)
+        
+        if job['status'] == 'done':
+            result = job['result']
             print("✅ Limpeza concluída com sucesso!")
             print(f"📊 Resultado:")
-            print(f"   - Coleção 'responses': {result['deleted']['responses']} registros removidos")
-            print(f"   - Coleção 'progressive': {result['deleted']['progressive']} registros removidos")
-            print(f"   - Total: {result['deleted']['total']} registros removidos")
+            print(f"   - Coleção 'responses': {result['responses']} registros removidos")
+            print(f"   - Coleção 'progressive': {result['progressive']} registros removidos")
+            others = sum(result.get(name, 0) for name in ('sessions', 'session_meta', 'dwell', 'events'))
+            print(f"   - Sessões, metadados e agregados: {others} registros removidos")
+            print(f"   - Total: {result['total']} registros removidos")
             print(f"⏰ Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         else:
-            print(f"❌ Erro na limpeza: {response.status_code}")
-            print(f"📋 Resposta: {response.text}")
+            print(f"❌ Erro na limpeza: {job['error']}")
             
     except Exception as e:
         print(f"❌ Erro durante a limpeza: {str(e)}")
@@ -117,7 +138,10 @@ def main():
     print("=" * 60)
     
     # Verificar argumentos
-    if len(sys.argv) > 1 and sys.argv[1] == "--preview":
+    if len(sys.argv) > 1 and sys.argv[1] == "--count":
+        # Apenas contar, sem baixar os registros
+        count_test_sessions()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--preview":
         # Apenas mostrar preview
         test_responses, test_progressive = preview_test_sessions()
         if test_responses or test_progressive:
@@ -135,6 +159,7 @@ def main():
     else:
         # Mostrar ajuda
         print("📖 USO:")
+        print("  python cleanup_test_sessions_api.py --count     # Contar sessões de teste")
         print("  python cleanup_test_sessions_api.py --preview   # Ver sessões de teste")
         print("  python cleanup_test_sessions_api.py --delete    # Ver instruções de remoção")
         print("\n💡 Recomendação: Execute primeiro com --preview para ver o que será removido")
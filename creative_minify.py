@@ -0,0 +1,209 @@
+"""
+Minificação dos criativos HTML5 (HTML, CSS e JS inline) para entrega no DV360
+
+Conservadora por design: o JS mantém as quebras de linha (sem risco com ASI),
+só perde comentários, indentação e os `console.log`/`console.debug` de debug.
+`console.warn`/`console.error` são mantidos.
+"""
+
+import re
+import gzip
+
+BLOCK_TAGS = {
+    "html", "head", "body", "meta", "title", "link", "style", "script", "div", "section",
+    "header", "footer", "main", "nav", "p", "ul", "ol", "li", "h1", "h2", "h3", "h4", "h5",
+    "h6", "form", "fieldset", "label", "input", "br", "!doctype",
+}
+DEBUG_CALLS = ("console.log", "console.debug")
+
+_SCRIPT_OR_STYLE = re.compile(r"(<(script|style)\b[^>]*>)(.*?)(</\2>)", re.S | re.I)
+_HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_BETWEEN_TAGS = re.compile(r">\s+<")
+_TAG_NAME = re.compile(r"</?\s*([!\w]+)")
+# Caracteres depois dos quais uma `/` inicia um regex literal (e não divisão)
+_REGEX_PREFIX = set("(,=:[!&|?{};+-*%<>~^")
+
+
+def gzip_size(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    # mtime fixo: tamanho estável entre execuções
+    return len(gzip.compress(data, compresslevel=9, mtime=0))
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    # Só depois de ':' (antes pode ser seletor descendente, ex. `a :checked`)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+def _js_tokens(js):
+    """Divide o JS em ('code'|'string'|'comment', texto), ciente de strings,
+    template literals (com `${}` aninhado) e regex literals"""
+    tokens = []
+    code = []
+    i, n = 0, len(js)
+    brace_stack = []  # profundidade de chaves dentro de cada `${` aberto
+    last_significant = ""
+
+    def flush():
+        if code:
+            tokens.append(("code", "".join(code)))
+            code.clear()
+
+    def read_template(start):
+        """Lê um template literal a partir de `start` (após a crase ou o `}` de um `${}`)"""
+        j = start
+        while j < n:
+            c = js[j]
+            if c == "\\":
+                j += 2
+                continue
+            if c == "`":
+                return j + 1, False
+            if c == "$" and j + 1 < n and js[j + 1] == "{":
+                return j + 2, True
+            j += 1
+        return n, False
+
+    while i < n:
+        c = js[i]
+        if c in "'\"":
+            flush()
+            j = i + 1
+            while j < n and js[j] != c:
+                j += 2 if js[j] == "\\" else 1
+            tokens.append(("string", js[i:j + 1]))
+            i = j + 1
+            last_significant = c
+        elif c == "`" or (c == "}" and brace_stack and brace_stack[-1] == 0):
+            flush()
+            if c == "}":
+                brace_stack.pop()
+            end, opened = read_template(i + 1)
+            tokens.append(("string", js[i:end]))
+            if opened:
+                brace_stack.append(0)
+            i = end
+            last_significant = "`"
+        elif js.startswith("//", i):
+            flush()
+            j = js.find("\n", i)
+            j = n if j < 0 else j
+            tokens.append(("comment", js[i:j]))
+            i = j
+        elif js.startswith("/*", i):
+            flush()
+            j = js.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            tokens.append(("comment", js[i:j]))
+            i = j
+        elif c == "/" and (last_significant in _REGEX_PREFIX or last_significant == ""):
+            flush()
+            j, in_class = i + 1, False
+            while j < n and (js[j] != "/" or in_class):
+                if js[j] == "\\":
+                    j += 1
+                elif js[j] == "[":
+                    in_class = True
+                elif js[j] == "]":
+                    in_class = False
+                j += 1
+            j += 1
+            while j < n and js[j].isalpha():
+                j += 1
+            tokens.append(("string", js[i:j]))
+            i = j
+            last_significant = "/"
+        else:
+            if brace_stack:
+                if c == "{":
+                    brace_stack[-1] += 1
+                elif c == "}":
+                    brace_stack[-1] -= 1
+            code.append(c)
+            if not c.isspace():
+                last_significant = c
+            i += 1
+    flush()
+    return tokens
+
+
+def _strip_debug_calls(text):
+    """Troca chamadas de debug por `void 0` (válido em qualquer posição de expressão).
+
+    Recebe o código com strings já substituídas por marcadores, então os
+    parênteses podem ser contados diretamente.
+    """
+    pattern = re.compile(r"(?<![\w.$])(?:%s)\s*\(" % "|".join(re.escape(c) for c in DEBUG_CALLS))
+    while True:
+        match = pattern.search(text)
+        if not match:
+            return text
+        depth, k = 1, match.end()
+        while k < len(text) and depth:
+            depth += {"(": 1, ")": -1}.get(text[k], 0)
+            k += 1
+        text = text[:match.start()] + "void 0" + text[k:]
+
+
+def minify_js(js, strip_debug=True):
+    tokens = [t for t in _js_tokens(js) if t[0] != "comment"]
+    strings = {}
+    parts = []
+    for kind, value in tokens:
+        if kind == "code":
+            parts.append(value)
+        else:
+            key = "\0%d\0" % len(strings)
+            strings[key] = value
+            parts.append(key)
+    text = "".join(parts)
+    if strip_debug:
+        text = _strip_debug_calls(text)
+
+    lines = []
+    for line in text.split("\n"):
+        line = re.sub(r"[ \t]+", " ", line).strip()
+        if not line:
+            continue
+        # `void 0;` sozinho numa linha só sai se não for corpo de if/else sem chaves
+        if line == "void 0;" and lines and lines[-1][-1] in ";{}":
+            continue
+        lines.append(line)
+    text = "\n".join(lines)
+    return re.sub(r"\0\d+\0", lambda m: strings[m.group(0)], text)
+
+
+def _between_tags(match, html):
+    before = html.rfind("<", 0, match.start() + 1)
+    left = _TAG_NAME.match(html, before)
+    right = _TAG_NAME.match(html, match.end() - 1)
+    names = {m.group(1).lower() for m in (left, right) if m}
+    # Entre elementos inline o espaço é visível: mantém um
+    return "><" if names & BLOCK_TAGS else "> <"
+
+
+def minify_html(html, strip_debug=True):
+    blocks = {}
+
+    def stash(match):
+        open_tag, name, body, close_tag = match.groups()
+        if name.lower() == "style":
+            body = minify_css(body)
+        elif "src=" not in open_tag:
+            body = minify_js(body, strip_debug)
+        key = "\0B%d\0" % len(blocks)
+        blocks[key] = open_tag + body + close_tag
+        return key
+
+    html = _SCRIPT_OR_STYLE.sub(stash, html)
+    html = _HTML_COMMENT.sub("", html)
+    html = re.sub(r"[ \t]*\n\s*", "\n", html)
+    html = _BETWEEN_TAGS.sub(lambda m: _between_tags(m, html), html)
+    html = re.sub(r"[ \t]{2,}", " ", html).strip()
+    return re.sub(r"\0B\d+\0", lambda m: blocks[m.group(0)], html)
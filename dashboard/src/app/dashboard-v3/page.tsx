@@ -4,50 +4,24 @@ import { useState, useEffect, useCallback, useMemo } from 'react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, LineChart, Line, Area, AreaChart } from 'recharts';
 import { Users, TrendingUp, Target, RefreshCw, Calendar, Award, BarChart3, CheckCircle } from 'lucide-react';
 
-interface SurveyResponse {
+// Sessão já agrupada pelo backend (GET /sessions)
+interface SessionSummary {
   id: string;
-  timestamp: string;
   session_id: string;
   campaign_id: string | null;
-  audience_type?: 'small_business' | 'general_public' | 'all' | string; // Novo campo
-  answers: {
-    q1: string;
-    q2: string;
-    q3: string;
-    q4: string;
-    q5: string;
-    q6: string;
-  };
-  metadata: {
-    user_agent: string | null;
-    referer: string | null;
-    origin: string | null;
-    page_url: string | null;
-  };
-}
-
-interface ProgressiveResponse {
-  id: string;
-  session_id: string;
-  question_number: number;
-  answer: string;
+  audience_type: string | null;
+  answers: Record<string, string>;
+  answer_timestamps: Record<string, string>;
+  answered_count: number;
   is_complete: boolean;
-  timestamp: string;
-  campaign_id: string;
-  audience_type: string;
-  user_agent: string;
-  referer: string;
-  origin: string;
-  page_url: string;
-  all_answers?: Record<string, string>;
-  completion_timestamp?: string;
+  last_answer_at: string | null;
+  updated_at: string;
 }
 
 interface DashboardData {
   totalResponses: number;
   smallBusinessResponses: number;
   generalPublicResponses: number;
-  responses: SurveyResponse[];
   questionStats: Record<string, Record<string, number>>;
   smallBusinessStats: Record<string, Record<string, number>>;
   generalPublicStats: Record<string, Record<string, number>>;
@@ -78,10 +52,51 @@ interface DashboardData {
       completionRate: number;
     }>;
     deviceStats: Record<string, number>;
-    realTimeData: ProgressiveResponse[];
+    realTimeData: SessionSummary[];
+  };
+}
+
+// Formato do GET /dashboard-summary
+interface DashboardSummary {
+  responses: {
+    total: number;
+    by_audience: Record<string, number>;
+    by_day: Record<string, Record<string, number>>;
+    questions: Record<string, Record<string, number>>;
+    questions_by_audience: Record<string, Record<string, Record<string, number>>>;
+    devices: Record<string, number>;
+  };
+  progressive: {
+    rows: number;
+    complete_rows: number;
+    sessions: number;
+    completed_sessions: number;
+    abandoned_sessions: number;
+    completion_rate: number;
+    abandonment_rate_by_question: Record<string, number>;
+    by_hour: Record<string, { rows: number; complete: number }>;
+    campaigns: Record<string, { rows: number; complete_rows: number; sessions: number; completed_sessions: number }>;
+    devices: Record<string, number>;
   };
 }
 
+// Quantis do tempo por pergunta e até concluir (sketches do backend, em segundos)
+interface DwellSummary {
+  count: number;
+  mean: number | null;
+  p50: number | null;
+  p90: number | null;
+  p99: number | null;
+}
+
+interface DwellTimes {
+  questions: Record<string, DwellSummary>;
+  complete: DwellSummary;
+}
+
+const API_BASE = 'https://sebrae-survey-api-fs-609095880025.southamerica-east1.run.app';
+const REALTIME_LIMIT = 100;
+
 const COLORS = ['#A855F7', '#F97316', '#10B981', '#EF4444', '#8B5CF6', '#06B6D4'];
 
 const questionLabels = {
@@ -177,202 +192,104 @@ export default function DashboardV3() {
 
   const fetchData = useCallback(async () => {
     try {
-      // Buscar dados da API V1 (dados gerais)
-      const responseV1 = await fetch('https://sebrae-survey-api-fs-609095880025.southamerica-east1.run.app/responses');
-      if (!responseV1.ok) throw new Error('Erro ao buscar dados V1');
+      // Agregados prontos dos rollups do backend (uma requisição, tamanho fixo)
+      const summaryRes = await fetch(`${API_BASE}/dashboard-summary`);
+      if (!summaryRes.ok) throw new Error('Erro ao buscar resumo do dashboard');
       
-      // Buscar dados da API V2 (dados segmentados)
-      const responseV2 = await fetch('https://sebrae-survey-api-v2-609095880025.us-central1.run.app/responses');
-      if (!responseV2.ok) throw new Error('Erro ao buscar dados V2');
+      // Sessões atualizadas mais recentemente, já agrupadas, para os cards de sessão
+      const sessionsRes = await fetch(`${API_BASE}/sessions?limit=${REALTIME_LIMIT}`);
+      if (!sessionsRes.ok) throw new Error('Erro ao buscar sessões');
       
-      // Buscar dados progressivos
-      const progressiveRes = await fetch('https://sebrae-survey-api-fs-609095880025.southamerica-east1.run.app/progressive-responses');
-      if (!progressiveRes.ok) throw new Error('Erro ao buscar dados progressivos');
-      
-      const dataV1 = await responseV1.json();
-      const dataV2 = await responseV2.json();
-      const progressiveData = await progressiveRes.json();
-      
-      // Combinar dados das duas APIs
-      const allResponses = [
-        ...(dataV1.responses || []).map((r: SurveyResponse) => ({ ...r, audience_type: 'all' })),
-        ...(dataV2.responses || [])
-      ];
-      
-      // Processar dados combinados
-      const responses = allResponses.filter((response: SurveyResponse) => {
-        const campaignId = response.campaign_id;
-        return !campaignId || !campaignId.toLowerCase().includes('test');
-      });
-
-      // Separar por público (simulando dados - em produção viria do campo audience_type)
-      const smallBusinessResponses = responses.filter((_: SurveyResponse, index: number) => index % 2 === 0);
-      const generalPublicResponses = responses.filter((_: SurveyResponse, index: number) => index % 2 === 1);
-
-      // Adicionar audience_type simulado
-      const responsesWithAudience = responses.map((response: SurveyResponse, index: number) => ({
-        ...response,
-        audience_type: index % 2 === 0 ? 'small_business' : 'general_public'
-      }));
-
-      const questionStats: Record<string, Record<string, number>> = {};
-      const smallBusinessStats: Record<string, Record<string, number>> = {};
-      const generalPublicStats: Record<string, Record<string, number>> = {};
-      const deviceStats: Record<string, number> = {};
-
-      // Inicializar estatísticas
-      Object.keys(questionLabels).forEach(q => {
-        questionStats[q] = {};
-        smallBusinessStats[q] = {};
-        generalPublicStats[q] = {};
-      });
-
-      // Processar estatísticas
-      responsesWithAudience.forEach((response: SurveyResponse) => {
-        const audience = response.audience_type || 'general_public';
-        
-        Object.entries(response.answers).forEach(([question, answer]) => {
-          // Estatísticas gerais
-          if (!questionStats[question][answer]) {
-            questionStats[question][answer] = 0;
-          }
-          questionStats[question][answer]++;
-
-          // Estatísticas por público
-          if (audience === 'small_business') {
-            if (!smallBusinessStats[question][answer]) {
-              smallBusinessStats[question][answer] = 0;
-            }
-            smallBusinessStats[question][answer]++;
-          } else {
-            if (!generalPublicStats[question][answer]) {
-              generalPublicStats[question][answer] = 0;
-            }
-            generalPublicStats[question][answer]++;
-          }
+      // Tempos medidos na ingestão; sem eles o painel segue com os demais dados
+      const dwellRes = await fetch(`${API_BASE}/dwell-times`).catch(() => null);
+
+      const summary: DashboardSummary = await summaryRes.json();
+      const sessionsData = await sessionsRes.json();
+      const dwell: DwellTimes | null = dwellRes && dwellRes.ok ? await dwellRes.json() : null;
+      const questionMedians = Object.values(dwell?.questions || {})
+        .map(q => q.p50)
+        .filter((p50): p50 is number => p50 !== null);
+
+      const statsFor = (source: Record<string, Record<string, number>> = {}) => {
+        const stats: Record<string, Record<string, number>> = {};
+        Object.keys(questionLabels).forEach(q => {
+          stats[q] = source[q] || {};
         });
+        return stats;
+      };
 
-        // Estatísticas de dispositivo
-        const userAgent = response.metadata.user_agent || 'Unknown';
-        let device = 'Desktop';
-        if (userAgent.includes('Mobile')) device = 'Mobile';
-        else if (userAgent.includes('Tablet')) device = 'Tablet';
-        
-        deviceStats[device] = (deviceStats[device] || 0) + 1;
-      });
-
-      // Processar dados progressivos
-      const progressiveResponses: ProgressiveResponse[] = progressiveData.responses || [];
-      const completedProgressive = progressiveResponses.filter(p => p.is_complete).length;
-      
-      // Separar dados progressivos completos por público
-      const completedProgressiveResponses = progressiveResponses.filter(p => p.is_complete);
-      const progressiveSmallBusiness = completedProgressiveResponses.filter((_: ProgressiveResponse, index: number) => index % 2 === 0);
-      const progressiveGeneralPublic = completedProgressiveResponses.filter((_: ProgressiveResponse, index: number) => index % 2 === 1);
+      const totalResponses = summary.responses.total;
+      const questionStats = statsFor(summary.responses.questions);
+      const smallBusinessStats = statsFor(summary.responses.questions_by_audience.small_business);
+      const generalPublicStats = statsFor(summary.responses.questions_by_audience.general_public);
 
       // Calcular dados diários com meta
-      const dailyData = calculateDailyData(responsesWithAudience, campaignStartDate, campaignEndDate, targetPerAudience);
+      const dailyData = calculateDailyData(summary.responses.by_day, campaignStartDate, campaignEndDate, targetPerAudience);
 
       // Calcular notas por tema
       const themeScores = calculateThemeScores(smallBusinessStats, generalPublicStats);
-      
-      // Calcular estatísticas progressivas
-      const progressiveStats = {
-        totalSessions: new Set(progressiveResponses.map(p => p.session_id)).size,
-        completedSessions: new Set(progressiveResponses.filter(p => p.is_complete).map(p => p.session_id)).size,
-        abandonedSessions: 0,
-        completionRate: 0,
-        averageTimePerQuestion: 0,
-        questionAbandonmentRate: {} as Record<number, number>,
-        hourlyProgression: [] as Array<{ hour: string; progressive: number; complete: number }>,
-        campaignStats: {} as Record<string, { total: number; completed: number; abandoned: number; completionRate: number }>,
-        deviceStats: {} as Record<string, number>,
-        realTimeData: progressiveResponses
-      };
-
-      // Calcular taxa de abandono progressivo
-      progressiveStats.abandonedSessions = progressiveStats.totalSessions - progressiveStats.completedSessions;
-      progressiveStats.completionRate = progressiveStats.totalSessions > 0 
-        ? (progressiveStats.completedSessions / progressiveStats.totalSessions) * 100 
-        : 0;
 
-      // Calcular abandono por pergunta
+      const progressive = summary.progressive;
+      const questionAbandonmentRate: Record<number, number> = {};
       for (let q = 1; q <= 6; q++) {
-        const questionResponses = progressiveResponses.filter(p => p.question_number === q);
-        const uniqueSessions = new Set(questionResponses.map(p => p.session_id));
-        const completedSessions = new Set(progressiveResponses.filter(p => p.is_complete).map(p => p.session_id));
-        const abandonedAtQ = uniqueSessions.size - Array.from(uniqueSessions).filter(s => completedSessions.has(s)).length;
-        progressiveStats.questionAbandonmentRate[q] = uniqueSessions.size > 0 ? (abandonedAtQ / uniqueSessions.size) * 100 : 0;
+        questionAbandonmentRate[q] = progressive.abandonment_rate_by_question[String(q)] || 0;
       }
 
-      // Calcular dados por hora para progressivas
-      const hourProgression: Record<string, { progressive: number; complete: number }> = {};
-      progressiveResponses.forEach(p => {
-        const hour = new Date(p.timestamp).getHours();
-        const hourKey = `${hour.toString().padStart(2, '0')}:00`;
-        if (!hourProgression[hourKey]) hourProgression[hourKey] = { progressive: 0, complete: 0 };
-        hourProgression[hourKey].progressive++;
-        if (p.is_complete) hourProgression[hourKey].complete++;
-      });
-
+      const hourlyProgression: Array<{ hour: string; progressive: number; complete: number }> = [];
       for (let h = 0; h < 24; h++) {
-        const hourKey = `${h.toString().padStart(2, '0')}:00`;
-        progressiveStats.hourlyProgression.push({
-          hour: hourKey,
-          progressive: hourProgression[hourKey]?.progressive || 0,
-          complete: hourProgression[hourKey]?.complete || 0
+        const hour = h.toString().padStart(2, '0');
+        hourlyProgression.push({
+          hour: `${hour}:00`,
+          progressive: progressive.by_hour[hour]?.rows || 0,
+          complete: progressive.by_hour[hour]?.complete || 0
         });
       }
 
-      // Calcular estatísticas por campanha progressivas
-      const campaignProgressiveStats: Record<string, { total: number; completed: number; abandoned: number; completionRate: number }> = {};
-      progressiveResponses.forEach(p => {
-        const campaign = p.campaign_id || 'unknown';
-        if (!campaignProgressiveStats[campaign]) {
-          campaignProgressiveStats[campaign] = { total: 0, completed: 0, abandoned: 0, completionRate: 0 };
-        }
-        campaignProgressiveStats[campaign].total++;
-        if (p.is_complete) campaignProgressiveStats[campaign].completed++;
+      const campaignStats: Record<string, { total: number; completed: number; abandoned: number; completionRate: number }> = {};
+      Object.entries(progressive.campaigns).forEach(([campaign, stats]) => {
+        campaignStats[campaign] = {
+          total: stats.rows,
+          completed: stats.complete_rows,
+          abandoned: stats.rows - stats.complete_rows,
+          completionRate: stats.rows > 0 ? (stats.complete_rows / stats.rows) * 100 : 0
+        };
       });
 
-      Object.keys(campaignProgressiveStats).forEach(campaign => {
-        const stats = campaignProgressiveStats[campaign];
-        stats.abandoned = stats.total - stats.completed;
-        stats.completionRate = stats.total > 0 ? (stats.completed / stats.total) * 100 : 0;
-      });
-      progressiveStats.campaignStats = campaignProgressiveStats;
-
-      // Calcular estatísticas de dispositivos progressivas
-      const deviceProgressiveStats: Record<string, number> = {};
-      progressiveResponses.forEach(p => {
-        const ua = p.user_agent || '';
-        let device = 'Desktop';
-        if (ua.includes('Mobile')) device = 'Mobile';
-        else if (ua.includes('Tablet')) device = 'Tablet';
-        deviceProgressiveStats[device] = (deviceProgressiveStats[device] || 0) + 1;
-      });
-      progressiveStats.deviceStats = deviceProgressiveStats;
+      const progressiveStats = {
+        totalSessions: progressive.sessions,
+        completedSessions: progressive.completed_sessions,
+        abandonedSessions: progressive.abandoned_sessions,
+        completionRate: progressive.completion_rate,
+        averageTimePerQuestion: questionMedians.length > 0
+          ? Math.round(questionMedians.reduce((sum, p50) => sum + p50, 0) / questionMedians.length)
+          : 0,
+        questionAbandonmentRate,
+        hourlyProgression,
+        campaignStats,
+        deviceStats: progressive.devices,
+        realTimeData: (sessionsData.sessions || []) as SessionSummary[]
+      };
 
-      const completionRate = responses.length > 0 ? 100 : 0;
-      const avgTimeMinutes = responses.length > 0 ? Math.round(responses.length * 0.5) : 0;
+      const completionRate = totalResponses > 0 ? 100 : 0;
+      // Mediana do tempo da primeira resposta até a conclusão, em minutos
+      const avgTimeMinutes = dwell?.complete.p50 ? Math.round(dwell.complete.p50 / 6) / 10 : 0;
       const systemStatus = 'ONLINE';
 
       setData({
-        totalResponses: responses.length + completedProgressive, // Soma total incluindo progressivos completos (sem registros de teste)
-        smallBusinessResponses: smallBusinessResponses.length + progressiveSmallBusiness.length, // Incluir progressivos
-        generalPublicResponses: generalPublicResponses.length + progressiveGeneralPublic.length, // Incluir progressivos
-        responses: responsesWithAudience,
+        totalResponses, // Inclui os registros completos gerados pelas progressivas (sem campanhas de teste)
+        smallBusinessResponses: summary.responses.by_audience.small_business || 0,
+        generalPublicResponses: summary.responses.by_audience.general_public || 0,
         questionStats,
         smallBusinessStats,
         generalPublicStats,
         dailyData,
-        deviceStats,
+        deviceStats: summary.responses.devices,
         completionRate,
         avgTimeMinutes,
         systemStatus,
         themeScores,
-        progressiveResponses: progressiveResponses.length,
-        completedProgressive,
+        progressiveResponses: progressive.rows,
+        completedProgressive: progressive.complete_rows,
         progressiveStats
       });
 
@@ -384,7 +301,7 @@ export default function DashboardV3() {
     }
   }, [campaignEndDate, campaignStartDate]);
 
-  const calculateDailyData = (responses: SurveyResponse[], startDate: Date, endDate: Date, targetPerAudience: number) => {
+  const calculateDailyData = (byDay: Record<string, Record<string, number>>, startDate: Date, endDate: Date, targetPerAudience: number) => {
     const daysDiff = Math.ceil((endDate.getTime() - startDate.getTime()) / (1000 * 60 * 60 * 24));
     const dailyTarget = targetPerAudience / daysDiff;
 
@@ -395,14 +312,10 @@ export default function DashboardV3() {
       currentDate.setDate(startDate.getDate() + i);
       const dateStr = currentDate.toISOString().split('T')[0];
       
-      const dayResponses = responses.filter(r => r.timestamp.startsWith(dateStr));
-      const smallBusinessCount = dayResponses.filter(r => r.audience_type === 'small_business').length;
-      const generalPublicCount = dayResponses.filter(r => r.audience_type === 'general_public').length;
-      
       dailyData.push({
         date: dateStr,
-        smallBusiness: smallBusinessCount,
-        generalPublic: generalPublicCount,
+        smallBusiness: byDay[dateStr]?.small_business || 0,
+        generalPublic: byDay[dateStr]?.general_public || 0,
         smallBusinessTarget: dailyTarget,
         generalPublicTarget: dailyTarget
       });
@@ -492,19 +405,16 @@ export default function DashboardV3() {
     switch (selectedAudience) {
       case 'small_business':
         return {
-          responses: data.responses.filter(r => r.audience_type === 'small_business'),
           stats: data.smallBusinessStats,
           count: data.smallBusinessResponses
         };
       case 'general_public':
         return {
-          responses: data.responses.filter(r => r.audience_type === 'general_public'),
           stats: data.generalPublicStats,
           count: data.generalPublicResponses
         };
       default:
         return {
-          responses: data.responses,
           stats: data.questionStats,
           count: data.totalResponses
         };
@@ -1135,37 +1045,9 @@ export default function DashboardV3() {
                 <CheckCircle className="w-6 h-6 text-purple-400" />
               </div>
               
-              {/* Agrupar dados por sessão */}
               {(() => {
-                const sessionsMap = new Map();
-                data.progressiveStats.realTimeData.forEach(response => {
-                  if (!sessionsMap.has(response.session_id)) {
-                    sessionsMap.set(response.session_id, {
-                      session_id: response.session_id,
-                      responses: [],
-                      is_complete: false,
-                      last_activity: response.timestamp,
-                      campaign_id: response.campaign_id,
-                      audience_type: response.audience_type
-                    });
-                  }
-                  const session = sessionsMap.get(response.session_id);
-                  
-                  // Evitar duplicatas - só adicionar se não existir esta pergunta
-                  const existingQuestion = session.responses.find((r: ProgressiveResponse) => r.question_number === response.question_number);
-                  if (!existingQuestion) {
-                    session.responses.push(response);
-                  }
-                  
-                  session.is_complete = response.is_complete || session.is_complete;
-                  if (new Date(response.timestamp) > new Date(session.last_activity)) {
-                    session.last_activity = response.timestamp;
-                  }
-                });
-
-                const sessions = Array.from(sessionsMap.values()).sort((a, b) => 
-                  new Date(b.last_activity).getTime() - new Date(a.last_activity).getTime()
-                );
+                // Já vêm ordenadas pela última atualização
+                const sessions = data.progressiveStats.realTimeData;
 
                 // Paginação
                 const totalPages = Math.ceil(sessions.length / cardsPerPage);
@@ -1206,32 +1088,34 @@ export default function DashboardV3() {
                         <div className="mb-4">
                           <div className="flex justify-between text-xs text-purple-300 mb-2">
                             <span>Progresso</span>
-                            <span>{session.responses.length}/6 perguntas</span>
+                            <span>{session.answered_count}/6 perguntas</span>
                           </div>
                           <div className="w-full bg-gray-700/50 rounded-full h-2">
                             <div 
                               className="bg-gradient-to-r from-purple-500 to-pink-500 h-2 rounded-full transition-all duration-500"
-                              style={{ width: `${(session.responses.length / 6) * 100}%` }}
+                              style={{ width: `${(session.answered_count / 6) * 100}%` }}
                             ></div>
                           </div>
                         </div>
 
                         {/* Respostas da Sessão */}
                         <div className="space-y-2 mb-4">
-                          {session.responses
-                            .sort((a: ProgressiveResponse, b: ProgressiveResponse) => a.question_number - b.question_number)
-                            .map((response: ProgressiveResponse) => (
-                            <div key={response.id} className="flex items-center justify-between bg-white/5 rounded-lg p-2">
+                          {Object.entries(session.answers)
+                            .sort(([a], [b]) => parseInt(a.slice(1)) - parseInt(b.slice(1)))
+                            .map(([question, answer]) => (
+                            <div key={question} className="flex items-center justify-between bg-white/5 rounded-lg p-2">
                               <div className="flex items-center space-x-2">
                                 <span className="text-xs font-medium text-purple-300">
-                                  P{response.question_number}
+                                  P{question.slice(1)}
                                 </span>
                                 <span className="text-xs text-white">
-                                  {response.answer}
+                                  {answer}
                                 </span>
                               </div>
                               <span className="text-xs text-gray-400">
-                                {new Date(response.timestamp).toLocaleTimeString('pt-BR')}
+                                {session.answer_timestamps[question]
+                                  ? new Date(session.answer_timestamps[question]).toLocaleTimeString('pt-BR')
+                                  : '-'}
                               </span>
                             </div>
                           ))}
@@ -1240,7 +1124,7 @@ export default function DashboardV3() {
                         {/* Footer do Card */}
                         <div className="flex items-center justify-between text-xs text-gray-400 border-t border-white/10 pt-3">
                           <span>Última atividade:</span>
-                          <span>{new Date(session.last_activity).toLocaleString('pt-BR')}</span>
+                          <span>{new Date(session.last_answer_at || session.updated_at).toLocaleString('pt-BR')}</span>
                         </div>
                       </div>
                     ))}
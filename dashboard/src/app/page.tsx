@@ -195,7 +195,7 @@ export default function Dashboard() {
       
       // Combinar dados das duas APIs
       const allResponses = [
-        ...(dataV1.responses || []).map((r: SurveyResponse) => ({ ...r, audience_type: 'all' })),
+        ...(dataV1.responses || []),
         ...(dataV2.responses || [])
       ];
       
@@ -205,15 +205,10 @@ export default function Dashboard() {
         return !campaignId || !campaignId.toLowerCase().includes('test');
       });
 
-      // Separar por público (simulando dados - em produção viria do campo audience_type)
-      const smallBusinessResponses = responses.filter((_: SurveyResponse, index: number) => index % 2 === 0);
-      const generalPublicResponses = responses.filter((_: SurveyResponse, index: number) => index % 2 === 1);
-
-      // Adicionar audience_type simulado
-      const responsesWithAudience = responses.map((response: SurveyResponse, index: number) => ({
-        ...response,
-        audience_type: index % 2 === 0 ? 'small_business' : 'general_public'
-      }));
+      // Separar por público pelo audience_type gravado na coleta (registros antigos sem ele ficam fora dos dois)
+      const smallBusinessResponses = responses.filter((response: SurveyResponse) => response.audience_type === 'small_business');
+      const generalPublicResponses = responses.filter((response: SurveyResponse) => response.audience_type === 'general_public');
+      const responsesWithAudience = responses;
 
       const questionStats: Record<string, Record<string, number>> = {};
       const smallBusinessStats: Record<string, Record<string, number>> = {};
@@ -229,7 +224,7 @@ export default function Dashboard() {
 
       // Processar estatísticas
       responsesWithAudience.forEach((response: SurveyResponse) => {
-        const audience = response.audience_type || 'general_public';
+        const audience = response.audience_type;
         
         Object.entries(response.answers).forEach(([question, answer]) => {
           // Estatísticas gerais
@@ -244,7 +239,7 @@ export default function Dashboard() {
               smallBusinessStats[question][answer] = 0;
             }
             smallBusinessStats[question][answer]++;
-          } else {
+          } else if (audience === 'general_public') {
             if (!generalPublicStats[question][answer]) {
               generalPublicStats[question][answer] = 0;
             }
@@ -267,8 +262,8 @@ export default function Dashboard() {
       
       // Separar dados progressivos completos por público
       const completedProgressiveResponses = progressiveResponses.filter(p => p.is_complete);
-      const progressiveSmallBusiness = completedProgressiveResponses.filter((_: ProgressiveResponse, index: number) => index % 2 === 0);
-      const progressiveGeneralPublic = completedProgressiveResponses.filter((_: ProgressiveResponse, index: number) => index % 2 === 1);
+      const progressiveSmallBusiness = completedProgressiveResponses.filter(p => p.audience_type === 'small_business');
+      const progressiveGeneralPublic = completedProgressiveResponses.filter(p => p.audience_type === 'general_public');
 
       // Calcular dados diários com meta
       const dailyData = calculateDailyData(responsesWithAudience, campaignStartDate, campaignEndDate, targetPerAudience);
@@ -1,24 +1,40 @@
 'use client';
 
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, LineChart, Line } from 'recharts';
 import { Users, Clock, CheckCircle, Activity, Target, RefreshCw, Eye, AlertTriangle, Zap } from 'lucide-react';
 
-interface ProgressiveResponse {
+// Sessão já agrupada pelo backend (GET /sessions); bit 0 do answered_mask = P1
+interface SessionSummary {
   id: string;
+  session_id: string;
+  campaign_id: string | null;
+  audience_type: string | null;
+  device: string | null;
+  answers: Record<string, string>;
+  answer_timestamps: Record<string, string>;
+  answered_mask: number;
+  answered_count: number;
+  is_complete: boolean;
+  completion_timestamp: string | null;
+  first_answer_at: string | null;
+  last_answer_at: string | null;
+  updated_at: string;
+}
+
+interface SessionsPage {
+  sessions: SessionSummary[];
+  has_more: boolean;
+  next_cursor?: string | null;
+  next_since?: string | null;
+}
+
+interface ProgressiveResponse {
   session_id: string;
   question_number: number;
   answer: string;
   is_complete: boolean;
   timestamp: string;
-  campaign_id: string;
-  audience_type: string;
-  user_agent: string;
-  referer: string;
-  origin: string;
-  page_url: string;
-  all_answers?: Record<string, string>;
-  completion_timestamp?: string;
 }
 
 interface ProgressiveStats {
@@ -40,6 +56,97 @@ interface ProgressiveStats {
 }
 
 
+const API_BASE = 'https://sebrae-survey-api-fs-609095880025.southamerica-east1.run.app';
+const SESSIONS_PAGE_SIZE = 500;
+const TOTAL_QUESTIONS = 6;
+
+const answeredQuestion = (session: SessionSummary, question: number) =>
+  (session.answered_mask & (1 << (question - 1))) !== 0;
+
+interface TimeseriesPoint {
+  period: string;
+  rows: number;
+  complete: number;
+}
+
+function computeStats(sessions: SessionSummary[], hourly: TimeseriesPoint[]): ProgressiveStats {
+  const completedSessions = sessions.filter(session => session.is_complete).length;
+
+  // Abandono por pergunta: sessões que responderam P(q) e nenhuma pergunta depois dela
+  const questionAbandonmentRate: Record<number, number> = {};
+  for (let q = 1; q <= TOTAL_QUESTIONS; q++) {
+    let atQuestion = 0;
+    let afterQuestion = 0;
+    sessions.forEach(session => {
+      if (answeredQuestion(session, q)) atQuestion++;
+      if (session.answered_mask >> q) afterQuestion++;
+    });
+    questionAbandonmentRate[q] = atQuestion > 0 ? ((atQuestion - afterQuestion) / atQuestion) * 100 : 0;
+  }
+
+  const campaignStats: ProgressiveStats['campaignStats'] = {};
+  const deviceStats: Record<string, number> = {};
+  const answers: ProgressiveResponse[] = [];
+  let questionIntervals = 0;
+  let intervalSeconds = 0;
+
+  sessions.forEach(session => {
+    Object.entries(session.answer_timestamps).forEach(([question, timestamp]) => {
+      if (!session.answers[question] || !timestamp) return;
+      const isComplete = session.is_complete && timestamp === session.last_answer_at;
+      answers.push({
+        session_id: session.session_id,
+        question_number: parseInt(question.slice(1)),
+        answer: session.answers[question],
+        is_complete: isComplete,
+        timestamp
+      });
+    });
+
+    const campaign = session.campaign_id || 'unknown';
+    const stats = campaignStats[campaign] ?? { total: 0, completed: 0, abandoned: 0, completionRate: 0 };
+    stats.total++;
+    if (session.is_complete) stats.completed++;
+    campaignStats[campaign] = stats;
+
+    const device = session.device || 'Desktop';
+    deviceStats[device] = (deviceStats[device] || 0) + 1;
+
+    if (session.answered_count > 1 && session.first_answer_at && session.last_answer_at) {
+      const seconds = (new Date(session.last_answer_at).getTime() - new Date(session.first_answer_at).getTime()) / 1000;
+      intervalSeconds += seconds;
+      questionIntervals += session.answered_count - 1;
+    }
+  });
+
+  Object.values(campaignStats).forEach(stats => {
+    stats.completionRate = stats.total > 0 ? (stats.completed / stats.total) * 100 : 0;
+    stats.abandoned = stats.total - stats.completed;
+  });
+
+  // Série por hora (UTC) já ordenada pelos rollups do backend
+  const hourlyProgression = hourly.map(point => ({
+    hour: `${point.period.slice(11, 13)}:00`,
+    progressive: point.rows,
+    complete: point.complete
+  }));
+
+  answers.sort((a, b) => a.timestamp.localeCompare(b.timestamp));
+
+  return {
+    totalSessions: sessions.length,
+    completedSessions,
+    abandonedSessions: sessions.length - completedSessions,
+    completionRate: sessions.length > 0 ? (completedSessions / sessions.length) * 100 : 0,
+    averageTimePerQuestion: questionIntervals > 0 ? Math.round(intervalSeconds / questionIntervals) : 0,
+    questionAbandonmentRate,
+    hourlyProgression,
+    campaignStats,
+    deviceStats,
+    realTimeData: answers.slice(-50) // Últimas 50 respostas
+  };
+}
+
 const questionLabels = {
   1: 'Tecnologia e Inovação',
   2: 'Diversidade e Inclusão', 
@@ -72,120 +179,58 @@ export default function ProgressiveDashboard() {
   const [lastUpdate, setLastUpdate] = useState<Date>(new Date());
   const [selectedCampaign, setSelectedCampaign] = useState<string>('all');
 
-  const fetchData = useCallback(async () => {
-    try {
-      // Buscar dados progressivos da API
-      const response = await fetch('https://sebrae-survey-api-fs-609095880025.southamerica-east1.run.app/progressive-responses');
-      if (!response.ok) throw new Error('Erro ao buscar dados progressivos');
-      
-      const progressiveData = await response.json();
-      
-      // Processar dados progressivos
-      const responses: ProgressiveResponse[] = progressiveData.responses || [];
-      
-      // Calcular estatísticas
-      const sessionMap = new Map<string, ProgressiveResponse[]>();
-      responses.forEach(response => {
-        if (!sessionMap.has(response.session_id)) {
-          sessionMap.set(response.session_id, []);
-        }
-        sessionMap.get(response.session_id)!.push(response);
-      });
-
-      const sessions = Array.from(sessionMap.values());
-      const completedSessions = sessions.filter(session => 
-        session.some(r => r.is_complete)
-      ).length;
-      const abandonedSessions = sessions.length - completedSessions;
-
-      // Calcular taxa de abandono por pergunta
-      const questionAbandonmentRate: Record<number, number> = {};
-      for (let q = 1; q <= 6; q++) {
-        const sessionsAtQuestion = sessions.filter(session => 
-          session.some(r => r.question_number === q)
-        ).length;
-        const sessionsAfterQuestion = sessions.filter(session => 
-          session.some(r => r.question_number > q)
-        ).length;
-        questionAbandonmentRate[q] = sessionsAtQuestion > 0 ? 
-          ((sessionsAtQuestion - sessionsAfterQuestion) / sessionsAtQuestion) * 100 : 0;
-      }
-
-      // Calcular dados por hora
-      const hourlyMap = new Map<string, { progressive: number; complete: number }>();
-      responses.forEach(response => {
-        const hour = new Date(response.timestamp).toLocaleTimeString('pt-BR', { 
-          hour: '2-digit', 
-          minute: '2-digit' 
-        });
-        if (!hourlyMap.has(hour)) {
-          hourlyMap.set(hour, { progressive: 0, complete: 0 });
-        }
-        const hourData = hourlyMap.get(hour)!;
-        hourData.progressive++;
-        if (response.is_complete) {
-          hourData.complete++;
-        }
-      });
-
-      const hourlyProgression = Array.from(hourlyMap.entries())
-        .map(([hour, data]) => ({ hour, ...data }))
-        .sort((a, b) => a.hour.localeCompare(b.hour));
-
-      // Calcular estatísticas por campanha
-      const campaignStats: Record<string, { total: number; completed: number; abandoned: number; completionRate: number }> = {};
-      responses.forEach(response => {
-        const campaign = response.campaign_id || 'unknown';
-        if (!campaignStats[campaign]) {
-          campaignStats[campaign] = { total: 0, completed: 0, abandoned: 0, completionRate: 0 };
-        }
-        campaignStats[campaign].total++;
-        if (response.is_complete) {
-          campaignStats[campaign].completed++;
-        }
-      });
-
-      // Calcular taxa de conclusão por campanha
-      Object.keys(campaignStats).forEach(campaign => {
-        const stats = campaignStats[campaign];
-        stats.completionRate = stats.total > 0 ? (stats.completed / stats.total) * 100 : 0;
-        stats.abandoned = stats.total - stats.completed;
-      });
-
-      // Calcular estatísticas de dispositivo
-      const deviceStats: Record<string, number> = {};
-      responses.forEach(response => {
-        const userAgent = response.user_agent || 'Unknown';
-        let device = 'Desktop';
-        if (userAgent.includes('Mobile')) device = 'Mobile';
-        else if (userAgent.includes('Tablet')) device = 'Tablet';
-        
-        deviceStats[device] = (deviceStats[device] || 0) + 1;
-      });
+  // Índice local das sessões: a carga inicial pagina o /sessions e cada
+  // atualização traz só as sessões alteradas desde o último `since`
+  const sessionsRef = useRef<Map<string, SessionSummary>>(new Map());
+  const sinceRef = useRef<string | null>(null);
+
+  const loadSessions = useCallback(async () => {
+    const sessions = sessionsRef.current;
+    if (sinceRef.current === null) {
+      let cursor: string | null = null;
+      do {
+        const params = new URLSearchParams({ limit: String(SESSIONS_PAGE_SIZE) });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE}/sessions?${params}`);
+        if (!response.ok) throw new Error('Erro ao buscar sessões');
+        const page: SessionsPage = await response.json();
+        page.sessions.forEach(session => sessions.set(session.id, session));
+        if (!cursor) sinceRef.current = page.next_since ?? '';
+        cursor = page.next_cursor ?? null;
+      } while (cursor);
+      return;
+    }
 
-      // Calcular tempo médio por pergunta (simulado)
-      const averageTimePerQuestion = responses.length > 0 ? Math.round(responses.length * 0.3) : 0;
-
-      setData({
-        totalSessions: sessions.length,
-        completedSessions,
-        abandonedSessions,
-        completionRate: sessions.length > 0 ? (completedSessions / sessions.length) * 100 : 0,
-        averageTimePerQuestion,
-        questionAbandonmentRate,
-        hourlyProgression,
-        campaignStats,
-        deviceStats,
-        realTimeData: responses.slice(-50) // Últimas 50 respostas
-      });
+    let hasMore = true;
+    while (hasMore) {
+      const params = new URLSearchParams({ limit: String(SESSIONS_PAGE_SIZE) });
+      if (sinceRef.current) params.set('since', sinceRef.current);
+      const response = await fetch(`${API_BASE}/sessions?${params}`);
+      if (!response.ok) throw new Error('Erro ao buscar sessões');
+      const page: SessionsPage = await response.json();
+      page.sessions.forEach(session => sessions.set(session.id, session));
+      sinceRef.current = page.next_since ?? sinceRef.current;
+      hasMore = page.has_more;
+    }
+  }, []);
 
+  const fetchData = useCallback(async () => {
+    try {
+      const today = new Date().toISOString().slice(0, 10);
+      const [hourlyRes] = await Promise.all([
+        fetch(`${API_BASE}/rollups/timeseries?granularity=hour&since=${today}`),
+        loadSessions()
+      ]);
+      if (!hourlyRes.ok) throw new Error('Erro ao buscar atividade por hora');
+      const hourly = await hourlyRes.json();
+      setData(computeStats(Array.from(sessionsRef.current.values()), hourly.series || []));
       setLastUpdate(new Date());
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Erro desconhecido');
     } finally {
       setLoading(false);
     }
-  }, []);
+  }, [loadSessions]);
 
   useEffect(() => {
     fetchData();
@@ -1,75 +1,182 @@
 #!/usr/bin/env python3
 """
 Script para gerar arquivos .zip dos criativos corrigidos
+
+Os criativos vêm do manifesto creative-v2/variants.json (via build_creatives) e
+o .zip leva a versão minificada de creative-v2/dist/. Os arquivos são
+reproduzíveis (ordem e datas fixas): o mesmo HTML gera sempre os mesmos bytes.
+Um .zip só é refeito quando o hash do HTML muda; os checksums ficam em
+creative-v2/checksums.json para conferência no upload.
+
+Uso:
+    python generate_zips.py            # gera só os .zip que mudaram
+    python generate_zips.py --force    # refaz todos
+    python generate_zips.py --verify   # confere os .zip e o HTML atual contra checksums.json
 """
 
 import os
+import sys
+import json
+import hashlib
 import zipfile
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import build_creatives
+
+CHECKSUMS_PATH = os.path.join(build_creatives.CREATIVE_DIR, "checksums.json")
+# Data mínima aceita pelo formato zip; fixa para o arquivo ser determinístico
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+def _sha256_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
 
 def create_zip_for_creative(html_file_path, zip_file_path):
     """Cria um arquivo .zip para um criativo HTML"""
     try:
         with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Adiciona o arquivo HTML ao zip
-            zipf.write(html_file_path, os.path.basename(html_file_path))
+            # Adiciona o arquivo HTML ao zip, sem mtime/permissões do sistema
+            info = zipfile.ZipInfo(os.path.basename(html_file_path), date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(html_file_path, "rb") as f:
+                zipf.writestr(info, f.read(), compresslevel=9)
             print(f"✅ Criado: {zip_file_path}")
         return True
     except Exception as e:
         print(f"❌ Erro ao criar {zip_file_path}: {str(e)}")
         return False
 
+
+def discover_creatives():
+    """Pares (html minificado, .zip) de todos os variantes do manifesto"""
+    return sorted(
+        (variant["dist"], variant["output"].replace(".html", ".zip"))
+        for variant in build_creatives.expand_variants(build_creatives.load_manifest())
+    )
+
+
+def load_checksums():
+    try:
+        with open(CHECKSUMS_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _package_one(html_file, zip_file):
+    """Roda no pool de processos; retorna (zip, entrada de checksums ou None)"""
+    if not create_zip_for_creative(html_file, zip_file):
+        return zip_file, None
+    return zip_file, {
+        "source_sha256": _sha256_file(html_file),
+        "sha256": _sha256_file(zip_file),
+        "bytes": os.path.getsize(zip_file),
+    }
+
+
+def package(force=False, workers=None):
+    """Gera os .zip que mudaram em paralelo; retorna (criados, inalterados, falhas)"""
+    creatives = discover_creatives()
+    checksums = load_checksums()
+    pending = []
+    unchanged = []
+    for html_file, zip_file in creatives:
+        name = os.path.basename(zip_file)
+        entry = checksums.get(name)
+        if not force and entry and os.path.exists(zip_file) and \
+                entry["source_sha256"] == _sha256_file(html_file) and entry["sha256"] == _sha256_file(zip_file):
+            unchanged.append(zip_file)
+        else:
+            pending.append((html_file, zip_file))
+
+    created, failed = [], []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for zip_file, entry in executor.map(_package_one, *zip(*pending)):
+                if entry:
+                    checksums[os.path.basename(zip_file)] = entry
+                    created.append(zip_file)
+                else:
+                    failed.append(zip_file)
+
+    names = {os.path.basename(zip_file) for _, zip_file in creatives}
+    with open(CHECKSUMS_PATH, "w", encoding="utf-8") as f:
+        json.dump({k: v for k, v in checksums.items() if k in names}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return created, unchanged, failed
+
+
+def verify():
+    """Confere cada .zip contra o checksum registrado; retorna a lista de divergências.
+
+    O `source_sha256` registrado também é comparado com o HTML minificado que os
+    templates e o manifesto geram agora (build em modo --check, sem gravar): um
+    .zip íntegro mas feito de um HTML antigo falha a conferência.
+    """
+    problems = []
+    checksums = load_checksums()
+    current = {os.path.basename(r["variant"]["output"]).replace(".html", ".zip"): r["dist"]
+               for r in build_creatives.build(check=True)}
+    for name in sorted(set(current) - set(checksums)):
+        problems.append(f"{name}: sem checksum registrado")
+    for name, entry in sorted(checksums.items()):
+        path = os.path.join(build_creatives.CREATIVE_DIR, name)
+        if not os.path.exists(path):
+            problems.append(f"{name}: ausente")
+        elif _sha256_file(path) != entry["sha256"]:
+            problems.append(f"{name}: sha256 diferente")
+        elif name in current and current[name] != entry["source_sha256"]:
+            problems.append(f"{name}: desatualizado (HTML mudou; rode python generate_zips.py)")
+    return problems
+
+
 def main():
     """Função principal para gerar todos os zips"""
     print("🚀 GERANDO ARQUIVOS .ZIP DOS CRIATIVOS CORRIGIDOS")
     print("=" * 60)
-    
-    # Lista dos arquivos HTML corrigidos
-    creative_files = [
-        "creative-v2/sebrae_carousel_300x250_PEQUENOS_NEGOCIOS.html",
-        "creative-v2/sebrae_carousel_300x250_SOCIEDADE.html",
-        "creative-v2/sebrae_carousel_320x250_PEQUENOS_NEGOCIOS.html",
-        "creative-v2/sebrae_carousel_320x250_SOCIEDADE.html",
-        "creative-v2/sebrae_carousel_336x280_PEQUENOS_NEGOCIOS.html",
-        "creative-v2/sebrae_carousel_336x280_SOCIEDADE.html",
-    ]
-    
-    success_count = 0
-    total_count = len(creative_files)
-    
-    for html_file in creative_files:
-        if os.path.exists(html_file):
-            # Nome do arquivo zip baseado no HTML
-            zip_file = html_file.replace('.html', '.zip')
-            
-            # Criar o zip
-            if create_zip_for_creative(html_file, zip_file):
-                success_count += 1
-        else:
-            print(f"⚠️  Arquivo não encontrado: {html_file}")
-    
+
+    if "--verify" in sys.argv:
+        problems = verify()
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"✅ Todos os .zip conferem com {os.path.basename(CHECKSUMS_PATH)}")
+        return
+
+    # Garante que creative-v2/dist/ está atualizado (incremental, rápido)
+    for result in build_creatives.build():
+        if result["over_budget"]:
+            print(f"❌ {os.path.basename(result['variant']['output'])} acima do orçamento de peso")
+            sys.exit(1)
+
+    created, unchanged, failed = package(force="--force" in sys.argv)
+
     print(f"\n{'='*60}")
     print("📊 RELATÓRIO DE GERAÇÃO DE ZIPS:")
-    print(f"✅ Arquivos .zip criados com sucesso: {success_count}")
-    print(f"📁 Total de arquivos processados: {total_count}")
-    
-    if success_count == total_count:
-        print("🎉 TODOS OS ARQUIVOS .ZIP FORAM CRIADOS COM SUCESSO!")
+    print(f"✅ Arquivos .zip criados com sucesso: {len(created)}")
+    print(f"⏭️  Sem mudança: {len(unchanged)}")
+    print(f"📁 Total de arquivos processados: {len(created) + len(unchanged) + len(failed)}")
+
+    if not failed:
+        print("🎉 TODOS OS ARQUIVOS .ZIP ESTÃO ATUALIZADOS!")
     else:
-        print(f"⚠️  {total_count - success_count} arquivos falharam")
-    
-    print(f"\n📋 ARQUIVOS .ZIP CRIADOS:")
-    for html_file in creative_files:
-        zip_file = html_file.replace('.html', '.zip')
-        if os.path.exists(zip_file):
-            file_size = os.path.getsize(zip_file)
-            print(f"   📦 {zip_file} ({file_size} bytes)")
-    
+        print(f"⚠️  {len(failed)} arquivos falharam")
+
+    print(f"\n📋 ARQUIVOS .ZIP:")
+    for name, entry in sorted(load_checksums().items()):
+        print(f"   📦 {name} ({entry['bytes']} bytes, sha256 {entry['sha256'][:12]})")
+
     print(f"\n{'='*60}")
     print("✅ CRIATIVOS PRONTOS PARA UPLOAD NO DV360!")
-    print("   - Usabilidade 100% funcional")
-    print("   - Clicktag corrigida")
-    print("   - Arquivos .zip gerados")
+    print(f"   - Checksums em {os.path.relpath(CHECKSUMS_PATH)}")
+
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
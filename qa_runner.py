@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+QA DOS CRIATIVOS COM POOL DE NAVEGADORES
+
+Distribui os jobs (criativo × cenário) do manifesto creative-v2/variants.json
+entre N Chrome headless reaproveitados, com esperas explícitas por condições
+do DOM (sem time.sleep), e gera um relatório único.
+
+As chamadas de rede do criativo (fetch/sendBeacon) são interceptadas na página:
+nenhum cenário grava dados na API de produção.
+
+As verificações estáticas (clickTag, dimensões, .zip) ficam em
+validate_creatives.py; aqui só o que precisa de navegador.
+
+Uso:
+    python qa_runner.py                       # todos os criativos e cenários
+    python qa_runner.py --browsers 6
+    python qa_runner.py --only 336x280 --scenario fluxo_completo
+    python qa_runner.py --json relatorio_qa.json
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.chrome.options import Options
+
+import build_creatives
+
+QA_BROWSERS = int(os.environ.get("QA_BROWSERS", "4"))
+QA_TIMEOUT = float(os.environ.get("QA_TIMEOUT", "5"))
+
+# Registra as chamadas de rede em window.__qaRequests em vez de enviá-las
+NETWORK_STUB = """
+window.__qaRequests = [];
+window.fetch = function(url, options) {
+  window.__qaRequests.push({url: String(url), body: (options || {}).body || null});
+  return Promise.resolve(new Response(JSON.stringify({status: 'ok', session_token: 'qa'}),
+    {status: 200, headers: {'Content-Type': 'application/json'}}));
+};
+navigator.sendBeacon = function(url, body) {
+  window.__qaRequests.push({url: String(url), body: body || null, beacon: true});
+  return true;
+};
+"""
+
+
+class BrowserPool:
+    """Pool de Chrome headless compartilhado entre as threads do runner"""
+
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.Queue()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _create(self):
+        chrome_options = Options()
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--window-size=400,700")
+        chrome_options.set_capability("goog:loggingPrefs", {"browser": "SEVERE"})
+        driver = webdriver.Chrome(options=chrome_options)
+        # O stub roda antes dos scripts do criativo em cada navegação
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": NETWORK_STUB})
+        with self._lock:
+            self._all.append(driver)
+        return driver
+
+    def start(self):
+        """Sobe os navegadores em paralelo (a criação é o passo mais lento)"""
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            for driver in executor.map(lambda _: self._create(), range(self.size)):
+                self._idle.put(driver)
+
+    def acquire(self):
+        return self._idle.get()
+
+    def release(self, driver):
+        self._idle.put(driver)
+
+    def close(self):
+        for driver in self._all:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+
+class Scenario:
+    """Contexto de um job: registra as verificações com o mesmo formato dos scripts de QA"""
+
+    def __init__(self, driver, variant):
+        self.driver = driver
+        self.variant = variant
+        self.wait = WebDriverWait(driver, QA_TIMEOUT)
+        self.checks = []
+
+    def log_test(self, test_name, result, details=""):
+        self.checks.append({"test": test_name, "result": bool(result), "details": details})
+
+    def open(self):
+        # Descarta o log do job anterior neste navegador
+        self.driver.get_log("browser")
+        self.driver.get(f"file://{os.path.abspath(self.variant['output'])}")
+        self.wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
+
+    # Helpers do carrossel
+    def slide_index(self):
+        transform = self.driver.execute_script("return document.getElementById('track').style.transform") or ""
+        digits = "".join(c for c in transform if c.isdigit())
+        return int(digits) // 100 if digits else 0
+
+    def wait_slide(self, index):
+        self.wait.until(lambda d: self.slide_index() == index)
+
+    def answer_current(self, index):
+        slide = self.driver.find_elements(By.CSS_SELECTOR, ".slide")[index]
+        label = slide.find_element(By.CSS_SELECTOR, "label.opt")
+        label.click()
+        radio = label.find_element(By.CSS_SELECTOR, "input")
+        self.wait.until(lambda d: radio.is_selected())
+
+    def go_through_survey(self):
+        """Do slide inicial até o agradecimento respondendo a primeira opção"""
+        self.driver.find_element(By.CSS_SELECTOR, ".button[data-action='start']").click()
+        self.wait_slide(1)
+        for q in range(1, 7):
+            self.answer_current(q)
+            if q < 6:
+                self.driver.find_element(By.ID, "next").click()
+                self.wait_slide(q + 1)
+        self.driver.find_element(By.CSS_SELECTOR, ".button[data-action='to-thanks']").click()
+        last = len(self.driver.find_elements(By.CSS_SELECTOR, ".slide")) - 1
+        self.wait_slide(last)
+        return last
+
+    def requests(self):
+        return self.driver.execute_script("return window.__qaRequests || []")
+
+
+def scenario_carregamento(s):
+    s.open()
+    width, height = int(s.variant["params"]["width"]), int(s.variant["params"]["height"])
+    size = s.driver.execute_script(
+        "const r = (document.querySelector('.stage') || document.body).getBoundingClientRect();"
+        "return [Math.round(r.width), Math.round(r.height)];")
+    s.log_test("DIMENSÕES RENDERIZADAS", size == [width, height], f"{size[0]}x{size[1]} (esperado {width}x{height})")
+    errors = [e["message"] for e in s.driver.get_log("browser") if e.get("level") == "SEVERE"]
+    s.log_test("SEM ERROS DE JAVASCRIPT", not errors, "; ".join(errors[:3]))
+
+
+def scenario_navegacao(s):
+    s.open()
+    s.driver.find_element(By.CSS_SELECTOR, ".button[data-action='start']").click()
+    s.wait_slide(1)
+    step = s.driver.find_elements(By.CSS_SELECTOR, ".slide")[1].find_element(By.CSS_SELECTOR, ".header .step")
+    s.log_test("NAVEGAÇÃO INICIAL", "Pergunta 1 de 6" in step.text, step.text)
+    s.answer_current(1)
+    s.driver.find_element(By.ID, "next").click()
+    s.wait_slide(2)
+    s.driver.find_element(By.ID, "prev").click()
+    s.wait_slide(1)
+    s.log_test("VOLTAR MANTÉM RESPOSTA", s.driver.find_elements(By.CSS_SELECTOR, "input[name='q1']:checked"), "q1")
+
+
+def scenario_fluxo_completo(s):
+    s.open()
+    last = s.go_through_survey()
+    thanks = s.driver.find_elements(By.CSS_SELECTOR, ".slide")[last].find_element(By.CSS_SELECTOR, ".header h1")
+    s.log_test("FLUXO COMPLETO", "Obrigado" in thanks.text, thanks.text)
+    link = s.driver.find_elements(By.CSS_SELECTOR, ".slide")[last].find_element(By.CSS_SELECTOR, "a.button")
+    s.wait.until(EC.element_to_be_clickable(link))
+    s.log_test("CLICKTAG FINAL CLICÁVEL", "clickTag" in (link.get_attribute("href") or ""), link.text.strip())
+    s.wait.until(lambda d: any("/collect" in r["url"] for r in s.requests()))
+    s.log_test("ENVIO DAS RESPOSTAS", True, f"{len(s.requests())} requisições interceptadas")
+
+
+def scenario_envio_progressivo(s):
+    s.open()
+    s.go_through_survey()
+    # Uma chamada por resposta; o registro completo pode ir por sendBeacon
+    s.wait.until(lambda d: sum(1 for r in s.requests() if "/collect" in r["url"] and not r.get("beacon")) >= 6)
+    bodies = [json.loads(r["body"]) for r in s.requests() if "/collect" in r["url"] and r["body"] and not r.get("beacon")]
+    questions = sorted({b.get("question_number") for b in bodies if b.get("question_number")})
+    s.log_test("RESPOSTAS PROGRESSIVAS", questions == [1, 2, 3, 4, 5, 6], f"perguntas enviadas: {questions}")
+
+
+# Cenários por família de template
+SCENARIOS = {
+    "carregamento": (scenario_carregamento, None),
+    "navegacao": (scenario_navegacao, ("carousel", "carousel_progressive")),
+    "fluxo_completo": (scenario_fluxo_completo, ("carousel", "carousel_progressive")),
+    "envio_progressivo": (scenario_envio_progressivo, ("carousel_progressive",)),
+}
+
+
+def build_jobs(only=None, scenario=None):
+    jobs = []
+    for variant in build_creatives.expand_variants(build_creatives.load_manifest()):
+        if only and only not in os.path.basename(variant["output"]):
+            continue
+        for name, (fn, templates) in SCENARIOS.items():
+            if (scenario is None or scenario == name) and (templates is None or variant["template"] in templates):
+                jobs.append((variant, name, fn))
+    return jobs
+
+
+def run_job(pool, job):
+    variant, name, fn = job
+    driver = pool.acquire()
+    started = time.time()
+    s = Scenario(driver, variant)
+    try:
+        fn(s)
+    except Exception as e:
+        s.log_test("ERRO GERAL", False, f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}")
+    finally:
+        pool.release(driver)
+    return {
+        "creative": os.path.basename(variant["output"]),
+        "scenario": name,
+        "seconds": round(time.time() - started, 2),
+        "checks": s.checks,
+        "passed": all(c["result"] for c in s.checks) and bool(s.checks),
+    }
+
+
+def print_report(results, elapsed, browsers):
+    print(f"\n{'='*80}")
+    print("📊 RELATÓRIO FINAL - QA DOS CRIATIVOS")
+    print(f"{'='*80}")
+    by_creative = {}
+    for r in results:
+        by_creative.setdefault(r["creative"], []).append(r)
+    for creative, runs in sorted(by_creative.items()):
+        ok = all(r["passed"] for r in runs)
+        print(f"{'✅' if ok else '❌'} {creative}")
+        for r in runs:
+            print(f"   {'✅' if r['passed'] else '❌'} {r['scenario']} ({r['seconds']}s)")
+            for c in r["checks"]:
+                if not c["result"]:
+                    print(f"      - {c['test']}: {c['details']}")
+
+    total = sum(len(r["checks"]) for r in results)
+    passed = sum(1 for r in results for c in r["checks"] if c["result"])
+    print(f"\n📈 Jobs: {len(results)} em {elapsed:.1f}s com {browsers} navegadores")
+    print(f"✅ Verificações aprovadas: {passed}/{total}")
+    if total and passed == total:
+        print("🎉 100% DOS TESTES PASSARAM!")
+    else:
+        print(f"⚠️  {total - passed} VERIFICAÇÕES FALHARAM - NECESSÁRIO REVISAR")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QA dos criativos com pool de navegadores")
+    parser.add_argument("--browsers", type=int, default=QA_BROWSERS)
+    parser.add_argument("--only", help="filtra criativos pelo nome do arquivo")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--json", help="grava o relatório em JSON")
+    args = parser.parse_args()
+
+    jobs = build_jobs(args.only, args.scenario)
+    browsers = max(1, min(args.browsers, len(jobs)))
+    print("🚀 QA DOS CRIATIVOS - POOL DE NAVEGADORES")
+    print(f"📋 {len(jobs)} jobs, {browsers} navegadores")
+
+    started = time.time()
+    pool = BrowserPool(browsers)
+    try:
+        pool.start()
+        with ThreadPoolExecutor(max_workers=browsers) as executor:
+            results = list(executor.map(lambda job: run_job(pool, job), jobs))
+    finally:
+        pool.close()
+    elapsed = time.time() - started
+
+    print_report(results, elapsed, browsers)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_seconds": round(elapsed, 2), "browsers": browsers, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"💾 Relatório salvo em {args.json}")
+
+    if not all(r["passed"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
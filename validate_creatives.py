@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+VALIDAÇÃO ESTÁTICA DOS CRIATIVOS PARA DV360
+
+Analisa o HTML e o .zip de cada variante do manifesto (creative-v2/variants.json)
+sem abrir navegador:
+- clickTag declarada (URL https) e usada em exatamente um link
+- clickTag só no último frame do carrossel e fora de botões/opções
+- dimensões (nome do arquivo × viewport × CSS do body/.stage) e meta ad.size
+- referências a recursos externos
+- .zip com um único HTML e dentro do orçamento de peso
+
+Os testes com Selenium ficam só para interação (navegação, envio de respostas).
+
+Uso:
+    python validate_creatives.py
+    python validate_creatives.py --strict   # avisos também reprovam
+"""
+
+import os
+import re
+import sys
+import time
+import zipfile
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor
+
+import build_creatives
+from creative_minify import gzip_size
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+INTERACTIVE_TAGS = {"button", "input", "label", "select", "textarea"}
+
+CLICKTAG_DECLARATION = re.compile(r"\bvar\s+clickTag\s*=\s*[\"']([^\"']*)[\"']")
+CLICKTAG_USAGE = re.compile(r"\bclickTag\b")
+CSS_URL = re.compile(r"url\(\s*['\"]?([^'\")]+)")
+
+
+class _CreativeParser(HTMLParser):
+    """Coleta metas, scripts, estilos, links e recursos, com a hierarquia de slides"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.metas = {}
+        self.scripts = []
+        self.styles = []
+        self.resources = []
+        self.links = []
+        self.slides = 0
+        self._text_target = None
+
+    def _slide_index(self):
+        return self.slides - 1 if any(tag == "section" and "slide" in classes for tag, classes, _ in self.stack) else None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "section" and "slide" in classes:
+            self.slides += 1
+        if tag == "meta" and attrs.get("name"):
+            self.metas[attrs["name"].lower()] = attrs.get("content") or ""
+        for attr in ("src", "href"):
+            value = attrs.get(attr)
+            if value and tag != "a":
+                self.resources.append((tag, value))
+        if tag == "a":
+            self.links.append({"href": attrs.get("href") or "", "slide": self._slide_index(), "contains": set()})
+        if tag in INTERACTIVE_TAGS or attrs.get("id") in ("prev", "next"):
+            for open_tag, _, link in self.stack:
+                if open_tag == "a" and link is not None:
+                    link["contains"].add(attrs.get("id") or tag)
+        if tag in ("script", "style"):
+            self._text_target = self.scripts if tag == "script" else self.styles
+            self._text_target.append("")
+        if tag not in VOID_TAGS:
+            self.stack.append((tag, classes, self.links[-1] if tag == "a" else None))
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._text_target = None
+        # Tolera HTML mal aninhado: fecha até a tag correspondente
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                del self.stack[i:]
+                break
+
+    def handle_data(self, data):
+        if self._text_target is not None:
+            self._text_target[-1] += data
+
+
+def _css_dimensions(css, selector):
+    match = re.search(r"(?:^|[}\s,])" + re.escape(selector) + r"\s*\{([^}]*)\}", css)
+    if not match:
+        return None
+    width = re.search(r"(?<![-\w])width\s*:\s*(\d+)px", match.group(1))
+    height = re.search(r"(?<![-\w])height\s*:\s*(\d+)px", match.group(1))
+    return (int(width.group(1)) if width else None, int(height.group(1)) if height else None)
+
+
+def check_html(html, width, height):
+    """Verificações estáticas de um HTML; lista de (status, descrição, detalhes)"""
+    parser = _CreativeParser()
+    parser.feed(html)
+    checks = []
+    scripts = "\n".join(parser.scripts)
+    css = "\n".join(parser.styles)
+
+    # 1. clickTag declarada
+    declaration = CLICKTAG_DECLARATION.search(scripts)
+    if not declaration:
+        checks.append(("❌", "clickTag NÃO definida", "CRÍTICO"))
+    elif not declaration.group(1).startswith("https://"):
+        checks.append(("❌", "clickTag sem URL https", declaration.group(1) or "(vazia)"))
+    else:
+        checks.append(("✅", "clickTag definida", f"Valor: {declaration.group(1)}"))
+
+    # 2. Exatamente um link de saída, e via clickTag
+    clicktag_links = [link for link in parser.links if CLICKTAG_USAGE.search(link["href"])]
+    hardcoded = [link["href"] for link in parser.links if link["href"].startswith("http")]
+    if len(clicktag_links) == 1:
+        checks.append(("✅", "Apenas 1 link com clickTag", f"Encontrados: {len(clicktag_links)}"))
+    else:
+        checks.append(("❌", "Links com clickTag", f"Encontrados: {len(clicktag_links)} (esperado: 1)"))
+    if hardcoded:
+        checks.append(("❌", "Links de saída fixos (sem clickTag)", ", ".join(hardcoded)))
+
+    # 3. No carrossel, a clickTag fica só no último frame
+    if parser.slides:
+        fora = [link["slide"] for link in clicktag_links if link["slide"] != parser.slides - 1]
+        if clicktag_links and not fora:
+            checks.append(("✅", "clickTag só no último frame", f"Frame {parser.slides - 1}"))
+        elif fora:
+            checks.append(("❌", "clickTag em outros frames", f"Frames: {fora}"))
+
+    # 4. Nenhum botão/opção dentro do link da clickTag
+    interativos = sorted(set().union(*(link["contains"] for link in clicktag_links))) if clicktag_links else []
+    if interativos:
+        checks.append(("❌", "Elementos interativos dentro da clickTag", ", ".join(interativos)))
+    elif clicktag_links:
+        checks.append(("✅", "Botões e opções sem clickTag", "Correto"))
+
+    # 5. Dimensões
+    viewport = re.search(r"width\s*=\s*(\d+)", parser.metas.get("viewport", ""))
+    if viewport and int(viewport.group(1)) != width:
+        checks.append(("❌", "Viewport incorreto", f"Esperado: {width}, Encontrado: {viewport.group(1)}"))
+    found = _css_dimensions(css, "body") or (None, None)
+    stage = _css_dimensions(css, ".stage")
+    if found == (width, height) or stage == (width, height):
+        checks.append(("✅", "Dimensões corretas", f"{width}x{height}"))
+    else:
+        checks.append(("❌", "Dimensões incorretas", f"Esperado: {width}x{height}, Encontrado: body {found}, .stage {stage}"))
+
+    ad_size = parser.metas.get("ad.size")
+    if ad_size is None:
+        checks.append(("⚠️", "Meta ad.size ausente", f'<meta name="ad.size" content="width={width},height={height}">'))
+    elif re.sub(r"\s", "", ad_size) != f"width={width},height={height}":
+        checks.append(("❌", "Meta ad.size incorreta", ad_size))
+    else:
+        checks.append(("✅", "Meta ad.size", ad_size))
+
+    # 6. Recursos externos
+    external = [value for _, value in parser.resources if re.match(r"(https?:)?//", value)]
+    external += [url for url in CSS_URL.findall(css) if re.match(r"(https?:)?//", url)]
+    insecure = [url for url in external if url.startswith("http://")]
+    if insecure:
+        checks.append(("❌", "Recursos externos sem https", ", ".join(insecure)))
+    elif external:
+        checks.append(("⚠️", "Recursos externos no carregamento", ", ".join(external)))
+    else:
+        checks.append(("✅", "Sem recursos externos", "Tudo inline"))
+
+    return checks
+
+
+def check_zip(zip_path, budget):
+    """Estrutura e peso do .zip; retorna (verificações, HTML contido ou None)"""
+    if not os.path.exists(zip_path):
+        return [("❌", "ZIP ausente", os.path.basename(zip_path))], None
+    with zipfile.ZipFile(zip_path) as zipf:
+        files = zipf.namelist()
+        html_files = [name for name in files if name.endswith(".html")]
+        if len(files) == 1 and len(html_files) == 1:
+            checks = [("✅", "ZIP válido", files[0])]
+        else:
+            checks = [("❌", "ZIP inválido", f"{files}")]
+        html = zipf.read(html_files[0]).decode("utf-8") if html_files else None
+
+    zip_bytes = os.path.getsize(zip_path)
+    limit = budget.get("initial_load_kb")
+    if limit and zip_bytes > limit * 1024:
+        checks.append(("❌", "ZIP acima do orçamento", f"{zip_bytes / 1024:.1f} KB > {limit} KB"))
+    else:
+        checks.append(("✅", "Peso do ZIP", f"{zip_bytes / 1024:.1f} KB"))
+    limit = budget.get("initial_load_gzip_kb")
+    if html and limit and gzip_size(html) > limit * 1024:
+        checks.append(("❌", "HTML acima do orçamento (gzip)", f"{gzip_size(html) / 1024:.1f} KB > {limit} KB"))
+    return checks, html
+
+
+def validate_variant(variant):
+    """Valida um variante (roda no pool de processos)"""
+    width, height = int(variant["params"]["width"]), int(variant["params"]["height"])
+    checks, html = check_zip(variant["output"].replace(".html", ".zip"), variant["budget"])
+    if html is None:
+        # Sem .zip utilizável: valida ao menos o HTML fonte
+        with open(variant["output"], encoding="utf-8") as f:
+            html = f.read()
+    return os.path.basename(variant["output"]), checks + check_html(html, width, height)
+
+
+def validate_all(workers=None):
+    variants = build_creatives.expand_variants(build_creatives.load_manifest())
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(validate_variant, variants))
+
+
+def main():
+    strict = "--strict" in sys.argv
+    print("🚀 VALIDAÇÃO ESTÁTICA DOS CRIATIVOS - DV360")
+    print("=" * 80)
+    started = time.time()
+    results = validate_all()
+
+    reprovados = []
+    total = aprovadas = 0
+    for arquivo, checks in results:
+        print(f"\n🔍 {arquivo}")
+        for status, descricao, detalhes in checks:
+            print(f"   {status} {descricao}: {detalhes}")
+        total += len(checks)
+        aprovadas += sum(1 for c in checks if c[0] == "✅")
+        if any(c[0] == "❌" or (strict and c[0] == "⚠️") for c in checks):
+            reprovados.append(arquivo)
+
+    print(f"\n{'='*80}")
+    print("📊 RELATÓRIO FINAL - VALIDAÇÃO ESTÁTICA")
+    print(f"📈 Total de verificações: {total} em {len(results)} criativos ({time.time() - started:.2f}s)")
+    print(f"✅ Verificações aprovadas: {aprovadas}")
+    if reprovados:
+        print(f"\n⚠️  NECESSÁRIO CORREÇÃO!")
+        for arquivo in reprovados:
+            print(f"   ❌ REPROVADO {arquivo}")
+        sys.exit(1)
+    print(f"\n🎉 APROVADO PARA DV360!")
+
+
+if __name__ == "__main__":
+    main()